@@ -0,0 +1,194 @@
+"""
+Process-wide cache of final answers, shared by all sessions.
+
+MemoryManager caches are per session, so the same question from another user
+ran the full graph again. Answers are now cached by normalized question, with
+an embedding-similarity tier for paraphrases, and served straight from
+ManagerAgent. Entries keep the graph state fields the /ask response is built
+from (answer, documents, routing, citations) and are tagged with the corpus
+version they were computed against. Only answers graded grounded and useful
+are stored, and a hit never carries another user's question or messages.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from Graph.cache_engine import LRUTTLCache
+from Graph.semantic_cache import SemanticCache
+from Graph.grade_cache import normalize_question
+from Graph.company_matcher import global_company_matcher
+from Graph.edges import generation_is_verified
+from Graph.web_search_service import is_time_sensitive, WEB_SEARCH_TTL
+from load_vector_dbs.vector_db_registry import global_vector_db_registry
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# Minimum cosine similarity for a paraphrase to reuse an answer
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.97"))
+
+# Graph state fields the /ask response is built from; messages are rebuilt
+# from the asking user's own question on a hit
+CACHED_STATE_FIELDS = (
+    "Intermediate_message", "documents", "citation_info", "tool_calls",
+    "document_sources", "cross_reference_analysis", "summary_strategy", "routing_memory",
+    "vectorstore_searched", "web_searched", "vectorstore_quality", "retry_count"
+)
+
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def question_signature(question: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Companies and figures (years, amounts) named in a question. A paraphrase
+    only reuses an answer if these match, so "FY2023" never serves "FY2024".
+    """
+    return (
+        tuple(sorted(global_company_matcher.match(question))),
+        tuple(sorted(NUMBER_PATTERN.findall(question or "")))
+    )
+
+
+class AnswerCache:
+    """
+    Exact tier: LRU/TTL cache keyed by (corpus version, normalized question,
+    extra inputs). Semantic tier: question embeddings pointing at exact-tier
+    keys, partitioned by corpus version and extra inputs. Partitions of older
+    corpus versions are dropped once a new version is seen, and the number of
+    partitions is bounded by the semantic cache.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY, registry=None):
+        """
+        Args:
+            max_entries: Maximum number of cached answers
+            ttl: Time to live for an answer in seconds
+            similarity_threshold: Minimum cosine similarity for a semantic hit
+            registry: Vector DB registry providing the corpus version
+        """
+        self.registry = registry or global_vector_db_registry
+        self.similarity_threshold = similarity_threshold
+        self._answers = LRUTTLCache(max_entries=max_entries, ttl=ttl)
+        self._index = SemanticCache(capacity=max_entries, ttl=int(ttl), similarity_threshold=similarity_threshold)
+        self._lock = threading.Lock()
+        self._corpus_version = None
+        self.stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def _inputs_key(extra_inputs: Optional[dict]) -> str:
+        return json.dumps(extra_inputs or {}, sort_keys=True, default=str)
+
+    def _key(self, corpus_version: str, question: str, extra_inputs: Optional[dict]):
+        return (corpus_version, normalize_question(question), self._inputs_key(extra_inputs))
+
+    def _partition(self, corpus_version: str, extra_inputs: Optional[dict]) -> str:
+        return f"{corpus_version}|{self._inputs_key(extra_inputs)}"
+
+    def _drop_stale_partitions(self, corpus_version: str):
+        """
+        Free the semantic index partitions of older corpus versions the
+        first time a new version is seen. Called with the lock held.
+        """
+        if corpus_version == self._corpus_version:
+            return
+        if self._corpus_version is not None:
+            prefix = f"{corpus_version}|"
+            dropped = self._index.drop_partitions(lambda partition: not partition.startswith(prefix))
+            if dropped:
+                print(f"ANSWER CACHE: dropped {dropped} index partitions of older corpus versions")
+        self._corpus_version = corpus_version
+
+    def cacheable(self, question: str) -> bool:
+        """Time-sensitive questions ("latest", "stock price", ...) are never cached."""
+        return ANSWER_CACHE_ENABLED and bool(question) and not is_time_sensitive(question)
+
+    def get(self, question: str, embedding: Optional[List[float]] = None,
+            extra_inputs: Optional[dict] = None) -> Optional[Dict[str, Any]]:
+        """
+        Look up an answer for the question.
+
+        Args:
+            question: The user question
+            embedding: Question embedding for the semantic tier (None: exact tier only)
+            extra_inputs: Extra graph inputs of the request
+
+        Returns:
+            dict: Cached graph state fields plus "answer_cache" hit details, or None
+        """
+        if not self.cacheable(question):
+            return None
+        corpus_version = self.registry.corpus_version
+        with self._lock:
+            self._drop_stale_partitions(corpus_version)
+            entry = self._answers.get(self._key(corpus_version, question, extra_inputs))
+            if entry is not None:
+                self.stats['exact_hits'] += 1
+                print(f"ANSWER CACHE HIT (exact): {question}")
+                return {**entry["state"], "answer_cache": {"tier": "exact"}}
+
+            if embedding is not None:
+                match = self._index.get(embedding, self._partition(corpus_version, extra_inputs))
+                if match is not None:
+                    key, similarity = match
+                    entry = self._answers.get(key)
+                    if entry is not None and entry["signature"] == question_signature(question):
+                        self.stats['semantic_hits'] += 1
+                        print(f"ANSWER CACHE HIT (similarity {similarity:.3f}): {question} -> {entry['question']}")
+                        return {**entry["state"], "answer_cache": {
+                            "tier": "semantic", "similarity": round(similarity, 4)
+                        }}
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, question: str, result: Dict[str, Any], embedding: Optional[List[float]] = None,
+            extra_inputs: Optional[dict] = None, corpus_version: Optional[str] = None):
+        """
+        Store the final graph state of a run whose answer was graded grounded
+        and useful. Answers accepted after the retry limit, or generated
+        without documents, are not stored. Answers using web results expire
+        with the web search cache.
+
+        Args:
+            corpus_version: Version the answer was computed against (default: current)
+        """
+        if not self.cacheable(question) or not result.get("Intermediate_message"):
+            return
+        if not generation_is_verified(result):
+            print(f"ANSWER CACHE SKIP (answer not verified): {question}")
+            return
+        corpus_version = corpus_version or self.registry.corpus_version
+        if corpus_version != self.registry.corpus_version:
+            return  # the corpus changed while the graph was running
+        key = self._key(corpus_version, question, extra_inputs)
+        entry = {
+            "question": question,
+            "corpus_version": corpus_version,
+            "signature": question_signature(question),
+            "cached_at": time.time(),
+            "state": {field: result[field] for field in CACHED_STATE_FIELDS if field in result}
+        }
+        with self._lock:
+            ttl = min(self._answers.ttl, WEB_SEARCH_TTL) if result.get("web_searched") else None
+            self._drop_stale_partitions(corpus_version)
+            self._answers.put(key, entry, ttl=ttl)
+            if embedding is not None:
+                self._index.put(embedding, key, self._partition(corpus_version, extra_inputs))
+            self.stats['stores'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._answers.clear()
+            self._index = SemanticCache(capacity=self._answers.max_entries, ttl=self._index.ttl,
+                                        similarity_threshold=self.similarity_threshold)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'entries': len(self._answers)}
+
+
+# Shared by all sessions in the process
+global_answer_cache = AnswerCache()
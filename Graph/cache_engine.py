@@ -0,0 +1,194 @@
+"""
+LRU cache with TTL expiry and an approximate memory budget, used by the memory manager.
+"""
+
+import sys
+import time
+import heapq
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+def estimate_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """
+    Approximate the memory held by an object graph in bytes.
+
+    Walks containers and object attributes (e.g. LangChain Documents) once each,
+    so shared objects are not counted twice.
+    """
+    if _seen is None:
+        _seen = set()
+    obj_id = id(obj)
+    if obj_id in _seen:
+        return 0
+    _seen.add(obj_id)
+
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, _seen) + estimate_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, _seen)
+    elif hasattr(obj, '__dict__'):
+        size += estimate_size(vars(obj), _seen)
+    elif hasattr(obj, 'nbytes'):
+        size += int(obj.nbytes)
+    return size
+
+
+class LRUTTLCache:
+    """
+    Least-recently-used cache with per-entry TTL and an approximate byte budget.
+
+    get and put are O(1) (amortized O(log n) for the expiry heap). Entries are
+    evicted in LRU order when either max_entries or max_bytes is exceeded, and
+    expired entries are dropped on access or when purge_expired runs.
+    It also supports the dict operations the memory manager already relied on
+    (len, in, [], del, items).
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = 3600):
+        """
+        Args:
+            max_entries: Maximum number of entries
+            max_bytes: Approximate memory budget in bytes (None for no limit)
+            ttl: Default time to live in seconds (None for no expiry)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[Any, float, int]]" = OrderedDict()  # key -> (value, expires_at, size)
+        self._expiry_heap = []  # (expires_at, key), stale items are skipped lazily
+        self.total_bytes = 0
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self.total_bytes -= size
+
+    def _is_expired(self, expires_at: float, now: float) -> bool:
+        return expires_at <= now
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it most recently used."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return default
+        value, expires_at, _ = entry
+        if self._is_expired(expires_at, time.time()):
+            self._remove(key)
+            self.stats['expirations'] += 1
+            self.stats['misses'] += 1
+            return default
+        self._data.move_to_end(key)
+        self.stats['hits'] += 1
+        return value
+
+    def put(self, key, value, ttl: Optional[float] = None, size: Optional[int] = None):
+        """
+        Insert or replace an entry, evicting least recently used entries if
+        the entry count or byte budget is exceeded.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Time to live for this entry (default: the cache's ttl)
+            size: Size in bytes if already known (default: estimated)
+        """
+        if key in self._data:
+            self._remove(key)
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else float('inf')
+        size = estimate_size(value) if size is None else size
+
+        self._data[key] = (value, expires_at, size)
+        self.total_bytes += size
+        if expires_at != float('inf'):
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+
+        self.purge_expired()
+        while self._data and (len(self._data) > self.max_entries or
+                              (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            oldest_key = next(iter(self._data))
+            if oldest_key == key and len(self._data) == 1:
+                break  # a single entry larger than the budget is still kept
+            self._remove(oldest_key)
+            self.stats['evictions'] += 1
+
+    def purge_expired(self) -> int:
+        """Remove every expired entry. Returns the number removed."""
+        now = time.time()
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry_heap)
+            entry = self._data.get(key)
+            # Skip heap items left behind by entries that were replaced or removed
+            if entry is not None and entry[1] == expires_at:
+                self._remove(key)
+                removed += 1
+        self.stats['expirations'] += removed
+        if len(self._expiry_heap) > 2 * max(len(self._data), 64):
+            self._expiry_heap = [(e, k) for k, (_, e, _) in self._data.items() if e != float('inf')]
+            heapq.heapify(self._expiry_heap)
+        return removed
+
+    def pop(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry[0]
+
+    def clear(self):
+        self._data.clear()
+        self._expiry_heap = []
+        self.total_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'entries': len(self._data),
+            'approx_bytes': self.total_bytes,
+            'hit_rate': self.stats['hits'] / lookups if lookups > 0 else 0.0
+        }
+
+    # Dict-style access (does not touch LRU order or hit/miss counters)
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and not self._is_expired(entry[1], time.time())
+
+    def __getitem__(self, key):
+        return self._data[key][0]
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __delitem__(self, key):
+        self._remove(key)
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self._data.keys()))
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def values(self):
+        return [value for value, _, _ in self._data.values()]
+
+    def items(self):
+        return [(key, value) for key, (value, _, _) in self._data.items()]
@@ -0,0 +1,225 @@
+"""
+Company detection by alias with a compiled Aho-Corasick automaton.
+
+All aliases are matched in one pass over the question, and a hit only counts
+on word boundaries, so "ms" no longer matches inside "terms" or "v" inside
+"revenue". Very short tickers (e.g. "V", "MS") must also be written in
+upper case, and aliases that are ordinary words ("chase", "meta", "visa")
+must be written as a name ("Chase", "VISA").
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from load_vector_dbs.vector_db_registry import global_vector_db_registry
+from load_vector_dbs.payload_filters import global_payload_catalog
+
+# Standard company name -> aliases (names, tickers, short forms)
+COMPANY_ALIASES = {
+    "amazon": ["amazon", "amzn", "amazon.com"],
+    "berkshire": ["berkshire", "berkshire hathaway", "brk"],
+    "google": ["google", "alphabet", "googl", "goog"],
+    "Jhonson and Jhonosn": ["johnson", "jnj", "johnson & johnson", "johnson and johnson"],
+    "jp morgan": ["jp morgan", "jpmorgan", "jpmc", "chase", "jpm"],
+    "meta": ["meta", "facebook", "fb", "meta platforms"],
+    "microsoft": ["microsoft", "msft", "ms"],
+    "nvidia": ["nvidia", "nvda"],
+    "tesla": ["tesla", "tsla"],
+    "visa": ["visa", "v"],
+    "walmart": ["walmart", "wmt"],
+    "pfizer": ["pfizer", "pfe"]
+}
+
+# Aliases up to this length only match when written in upper case (tickers)
+CASE_SENSITIVE_MAX_LENGTH = 2
+
+# Aliases that are also ordinary words: they only match in title or upper
+# case, and at the start of a sentence (where title case says nothing) the
+# rule-based query planner leaves the question to the LLM
+DICTIONARY_WORD_ALIASES = frozenset({"chase", "meta", "visa"})
+
+
+class AhoCorasick:
+    """
+    Multi-pattern string matcher. Patterns are added once, then compiled;
+    search runs in O(len(text) + matches).
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any]]] = [[]]
+
+    def add(self, pattern: str, value: Any):
+        """Add a pattern; value is returned with every match of it."""
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((pattern, value))
+
+    def compile(self):
+        """Build the failure links (breadth-first over the trie)."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Iterable[Tuple[int, int, Any]]:
+        """
+        Yields:
+            tuple: (start, end, value) for every pattern occurrence in text
+        """
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern, value in self._output[state]:
+                yield index - len(pattern) + 1, index + 1, value
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+def _starts_sentence(text: str, index: int) -> bool:
+    preceding = text[:index].rstrip(" \t\n\"'(")
+    return not preceding or preceding[-1] in ".?!:"
+
+
+class CompanyMatcher:
+    """
+    Finds the companies named in a question. Built from COMPANY_ALIASES and
+    the `company` payload values stored in the collections; rebuilt when the
+    corpus version changes.
+    """
+
+    def __init__(self, aliases: Optional[Dict[str, List[str]]] = None, registry=None,
+                 scan_collections: bool = True):
+        """
+        Args:
+            aliases: Standard company name -> aliases (default: COMPANY_ALIASES)
+            registry: Vector DB registry used to read company values and the corpus version
+            scan_collections: Also add the `company` values found in the collections
+        """
+        self.aliases = aliases or COMPANY_ALIASES
+        self.registry = registry or global_vector_db_registry
+        self.scan_collections = scan_collections
+        self._lock = threading.Lock()
+        self._automaton: Optional[AhoCorasick] = None
+        self._corpus_version: Optional[str] = None
+        self.companies: List[str] = []
+
+    def payload_values(self, company: str) -> List[str]:
+        """
+        The `company` payload values stored for a standard company name
+        (e.g. "AMAZON" and "amazon" for "amazon").
+        """
+        values = []
+        for value in global_payload_catalog.values("company"):
+            if str(value).lower() == company.lower() or self.match(str(value).replace("_", " ")) == [company]:
+                values.append(value)
+        return values
+
+    def _build(self) -> AhoCorasick:
+        automaton = AhoCorasick()
+        known = {}
+        for company, aliases in self.aliases.items():
+            for alias in aliases + [company]:
+                known[alias.lower()] = company
+
+        if self.scan_collections:
+            for value in global_payload_catalog.values("company"):
+                known.setdefault(str(value).strip().lower(), str(value).strip().lower())
+
+        for alias, company in known.items():
+            if len(alias) <= CASE_SENSITIVE_MAX_LENGTH:
+                forms = (alias.upper(),)
+            elif alias in DICTIONARY_WORD_ALIASES:
+                forms = (alias.title(), alias.upper())
+            else:
+                forms = None
+            automaton.add(alias, (company, forms, alias in DICTIONARY_WORD_ALIASES))
+        automaton.compile()
+        self.companies = sorted(set(known.values()))
+        print(f"Company matcher built with {len(known)} aliases for {len(self.companies)} companies")
+        return automaton
+
+    def _get_automaton(self) -> AhoCorasick:
+        corpus_version = self.registry.corpus_version if self.scan_collections else None
+        if self._automaton is None or corpus_version != self._corpus_version:
+            with self._lock:
+                if self._automaton is None or corpus_version != self._corpus_version:
+                    self._automaton = self._build()
+                    self._corpus_version = corpus_version
+        return self._automaton
+
+    def _matches(self, question: str) -> List[Tuple[str, bool]]:
+        """
+        (company, ambiguous) per mention, in order. A mention is ambiguous
+        when it is a dictionary-word alias in title case starting a sentence.
+        """
+        text = question or ""
+        lowered = text.lower()
+        matches = []
+        for start, end, (company, forms, dictionary_word) in self._get_automaton().search(lowered):
+            if not (_is_boundary(lowered, start - 1) and _is_boundary(lowered, end)):
+                continue
+            if forms is not None and text[start:end] not in forms:
+                continue
+            ambiguous = dictionary_word and text[start:end] != text[start:end].upper() and _starts_sentence(text, start)
+            matches.append((start, -(end - start), company, ambiguous))
+
+        mentions = []
+        covered_until = -1
+        # Longest match wins where aliases overlap ("johnson & johnson" over "johnson")
+        for start, negative_length, company, ambiguous in sorted(matches):
+            if start < covered_until:
+                continue
+            covered_until = start - negative_length
+            mentions.append((company, ambiguous))
+        return mentions
+
+    def match(self, question: str) -> List[str]:
+        """
+        Companies named in the question, in order of first mention.
+
+        Args:
+            question: The user question
+
+        Returns:
+            list: Standard company names
+        """
+        companies = []
+        for company, _ in self._matches(question):
+            if company not in companies:
+                companies.append(company)
+        return companies
+
+    def is_ambiguous(self, question: str) -> bool:
+        """
+        Whether a company was only recognized through an ordinary-word alias
+        at the start of a sentence ("Chase the trend", "Meta analysis shows"),
+        so the match may not name a company at all.
+        """
+        mentions = self._matches(question)
+        certain = {company for company, ambiguous in mentions if not ambiguous}
+        return any(ambiguous and company not in certain for company, ambiguous in mentions)
+
+
+# Shared matcher, built on first use
+global_company_matcher = CompanyMatcher()
@@ -0,0 +1,232 @@
+"""
+Context packing for generation prompts.
+
+Generation used to receive the raw Document list (Python reprs with all
+metadata) or whole content/metadata dicts, with no size limit. The packer
+selects documents by maximal marginal relevance (MMR) over their vectors,
+drops near-duplicates, stops at a token budget and renders a compact
+numbered block the answer can cite as [1], [2], ...
+"""
+
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from load_vector_dbs.vector_db_registry import global_vector_db_registry
+
+# Prompt tokens available for retrieved context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Relevance vs. diversity trade-off of MMR (1.0 = relevance only)
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Chunks at least this similar to an already selected chunk are dropped
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.95"))
+CONTEXT_ENCODING = os.getenv("CONTEXT_ENCODING", "cl100k_base")
+
+
+@lru_cache(maxsize=4)
+def get_encoder(encoding_name: str = CONTEXT_ENCODING):
+    """tiktoken encoder, loaded once per process (None if unavailable)."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        print(f"tiktoken encoder unavailable, estimating tokens from length: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoder = get_encoder()
+    if encoder is None:
+        return len(text) // 4 + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoder = get_encoder()
+    if encoder is None:
+        return text[:max_tokens * 4]
+    return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+
+
+def document_label(document: Any) -> str:
+    """Short source description used in the citation line."""
+    metadata = getattr(document, "metadata", None) or {}
+    parts = []
+    if metadata.get("source_file"):
+        parts.append(str(metadata["source_file"]))
+    elif metadata.get("company"):
+        parts.append(str(metadata["company"]))
+    elif metadata.get("url") or metadata.get("source"):
+        parts.append(str(metadata.get("url") or metadata.get("source")))
+    if metadata.get("page_num") is not None:
+        parts.append(f"p.{metadata['page_num']}")
+    if metadata.get("fiscal_year") is not None:
+        parts.append(f"FY{metadata['fiscal_year']}")
+    return ", ".join(parts) or "web"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr_order(query_vector: Optional[Sequence[float]], document_vectors: List[Optional[Sequence[float]]],
+              lambda_mult: float = CONTEXT_MMR_LAMBDA,
+              duplicate_similarity: float = CONTEXT_DUPLICATE_SIMILARITY) -> List[int]:
+    """
+    Order documents by maximal marginal relevance, leaving out near-duplicates.
+
+    Documents without a vector keep their retrieval position after the
+    vector-ranked ones and are never treated as duplicates.
+
+    Returns:
+        list: Document indexes in selection order
+    """
+    with_vectors = [i for i, vector in enumerate(document_vectors) if vector is not None]
+    without_vectors = [i for i, vector in enumerate(document_vectors) if vector is None]
+    if not with_vectors or query_vector is None:
+        return list(range(len(document_vectors)))
+
+    vectors = _normalize(np.asarray([document_vectors[i] for i in with_vectors], dtype=np.float32))
+    relevance = vectors @ _normalize(np.asarray(query_vector, dtype=np.float32))
+    similarity = vectors @ vectors.T
+
+    selected: List[int] = []
+    remaining = list(range(len(with_vectors)))
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        keep = redundancy < duplicate_similarity
+        if not keep.any():
+            break
+        candidates = [r for r, k in zip(remaining, keep) if k]
+        dropped = len(remaining) - len(candidates)
+        if dropped:
+            print(f"DROPPED {dropped} NEAR-DUPLICATE CHUNK(S) FROM CONTEXT")
+        scores = lambda_mult * relevance[candidates] - (1 - lambda_mult) * redundancy[keep]
+        best = candidates[int(np.argmax(scores))]
+        selected.append(best)
+        remaining = [r for r in candidates if r != best]
+    return [with_vectors[i] for i in selected] + without_vectors
+
+
+def document_vectors(documents: List[Any], known_vectors: Optional[Dict[Any, Sequence[float]]] = None,
+                     embed_missing: bool = True) -> List[Optional[Sequence[float]]]:
+    """
+    Vectors for the documents: the ones Qdrant returned (keyed by
+    (collection, point id)), the rest embedded through the cached embeddings.
+    """
+    known_vectors = known_vectors or {}
+    vectors = []
+    missing = []
+    for index, document in enumerate(documents):
+        metadata = getattr(document, "metadata", None) or {}
+        vector = known_vectors.get((metadata.get("_collection_name"), metadata.get("_id")))
+        vectors.append(vector)
+        if vector is None:
+            missing.append(index)
+    if missing and embed_missing:
+        try:
+            embedded = global_vector_db_registry.embeddings.embed_documents(
+                [documents[i].page_content for i in missing]
+            )
+            for index, vector in zip(missing, embedded):
+                vectors[index] = vector
+        except Exception as e:
+            print(f"Could not embed context documents, keeping retrieval order for them: {e}")
+    return vectors
+
+
+def select_documents(documents: List[Any], query_vector: Optional[Sequence[float]] = None,
+                     vectors: Optional[List[Optional[Sequence[float]]]] = None,
+                     token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[tuple]:
+    """
+    Pick the documents that go into the prompt: MMR order, no near-duplicates,
+    within the token budget. The first document is truncated rather than
+    dropped if it alone exceeds the budget.
+
+    Returns:
+        list: (index in documents, document) pairs in selection order
+    """
+    if not documents:
+        return []
+    order = mmr_order(query_vector, vectors or [None] * len(documents))
+
+    selected = []
+    used_tokens = 0
+    for index in order:
+        document = documents[index]
+        tokens = count_tokens(document.page_content) + 16  # citation line and separators
+        if used_tokens + tokens > token_budget:
+            if not selected:
+                document = document.model_copy(update={
+                    "page_content": truncate_to_tokens(document.page_content, max(token_budget - 16, 1))
+                })
+                selected.append((index, document))
+                used_tokens = token_budget
+            continue
+        selected.append((index, document))
+        used_tokens += tokens
+
+    print(f"PACKED {len(selected)} OF {len(documents)} DOCUMENTS INTO ~{used_tokens} CONTEXT TOKENS")
+    return selected
+
+
+def render_context(documents: List[Any], start: int = 1) -> str:
+    """Render documents as numbered, citable blocks."""
+    return "\n\n".join(
+        f"[{number}] {document_label(document)}\n{document.page_content.strip()}"
+        for number, document in enumerate(documents, start=start)
+    )
+
+
+def pack_context(documents: List[Any], query_vector: Optional[Sequence[float]] = None,
+                 known_vectors: Optional[Dict[Any, Sequence[float]]] = None,
+                 token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Build the prompt context for the standard RAG chain.
+
+    Args:
+        documents: Graded documents
+        query_vector: Question embedding
+        known_vectors: Vectors returned by Qdrant, keyed by (collection, point id)
+        token_budget: Maximum context tokens
+
+    Returns:
+        str: Numbered context blocks
+    """
+    vectors = document_vectors(documents, known_vectors) if query_vector is not None else None
+    selected = select_documents(documents, query_vector, vectors, token_budget)
+    return render_context([document for _, document in selected])
+
+
+def pack_document_sources(document_sources: Dict[str, List[Any]], query_vector: Optional[Sequence[float]] = None,
+                          known_vectors: Optional[Dict[Any, Sequence[float]]] = None,
+                          token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Build the prompt context for the cross-referencing chain: one budget and
+    one MMR pass over all sources, rendered grouped by source type with
+    running citation numbers.
+    """
+    documents = []
+    source_types = []
+    for source_type, docs in document_sources.items():
+        for document in docs or []:
+            documents.append(document)
+            source_types.append(source_type)
+
+    vectors = document_vectors(documents, known_vectors) if query_vector is not None else None
+    selected = select_documents(documents, query_vector, vectors, token_budget)
+
+    sections = []
+    number = 1
+    for source_type in document_sources:
+        chosen = [document for index, document in selected if source_types[index] == source_type]
+        if chosen:
+            sections.append(f"### {source_type}\n{render_context(chosen, start=number)}")
+            number += len(chosen)
+    return "\n\n".join(sections)
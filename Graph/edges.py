@@ -1,10 +1,7 @@
 "his modules has all info about the graph edges"
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
-from load_vector_dbs.prompts_and_chains import (get_question_router_chain,
-                                                          get_hallucination_chain, 
-                                                          get_answer_quality_chain)
-from load_vector_dbs.load_dbs import load_vector_database
+from langchain_core.runnables import RunnableParallel
+from load_vector_dbs.llm_registry import global_llm_registry
+from Graph.nodes import get_router_results, aget_router_results
 
 def route_question(state):
     """
@@ -30,8 +27,6 @@ def route_question(state):
     print(f"Question to route: {question}")
     
     # Initialize variables at the top to prevent UnboundLocalError
-    text_results = None
-    image_results = None
     text_points = []
     image_points = []
     text_relevance_score = 0
@@ -52,130 +47,34 @@ def route_question(state):
         print(f"Recent conversation context: {recent_queries}")
     
     try:
-        init = load_vector_database()
-        _, vectorstore, _ = init.get_text_retriever()
+        # Reuse the searches the entry node ran for this question
+        router_results = state.get("router_results") or {}
+        text_result = router_results.get("text")
+        if text_result is None or text_result.question != question:
+            print("---NO ROUTER RESULTS FOR THIS QUESTION, SEARCHING NOW---")
+            router_results = get_router_results(state, question)
+            text_result = router_results.get("text")
+        image_result = router_results.get("image")
 
-        # Generate embedding for the question
-        query_embedding = init.embeddings.embed_query(question)
-        print(f"Generated embedding with dimension: {len(query_embedding)}")
-        
-        # Check for cached documents first
-        cached_docs = global_memory_manager.get_cached_documents(query_embedding)
-        if cached_docs:
-            print("---USING CACHED DOCUMENT RESULTS---")
-            text_points = cached_docs.get('documents', [])
-            text_relevance_score = sum(cached_docs.get('scores', [])) / len(cached_docs.get('scores', [1]))
-            max_text_score = max(cached_docs.get('scores', [0]))
-            image_points = []  # Simplified for cached case
-            image_relevance_score = 0
-            max_image_score = 0
-            state['performance_metrics']['cache_hits'] += 1
-        else:
-            # Qdrant similarity search for top 5 text docs
-            text_results = init.qdrant_client.query_points(
-                collection_name=vectorstore.collection_name,
-                query=query_embedding,
-                limit=5,
-                with_payload=True
-            )
-            print(f"Text search completed for collection: {vectorstore.collection_name}")
-
-            # Get image vector store
-            image_vectorstore, _, _ = init.get_image_retriever()
-            image_results = init.qdrant_client.query_points(
-                collection_name=image_vectorstore.collection_name,
-                query=query_embedding,
-                limit=5,
-                with_payload=True
-            )
-            print(f"Image search completed for collection: {image_vectorstore.collection_name}")
-            
-            # Extract results safely and calculate scores
-            text_relevance_score = 0
-            image_relevance_score = 0
-            max_text_score = 0
-            max_image_score = 0
-            
-            text_points = []
-            # Qdrant query_points returns points attribute, not result
-            if hasattr(text_results, 'points') and text_results.points:
-                text_points = text_results.points
-                scores = [point.score for point in text_points if hasattr(point, 'score') and point.score is not None]
-                if scores:
-                    text_relevance_score = sum(scores) / len(scores)  # Average instead of sum
-                    max_text_score = max(scores)
-                    # Cache the results
-                    global_memory_manager.cache_document_retrieval(
-                        query_embedding, text_points, scores, "text"
-                    )
-            elif hasattr(text_results, 'result') and text_results.result:
-                # Fallback for older API
-                text_points = text_results.result
-                scores = [point.score for point in text_points if hasattr(point, 'score') and point.score is not None]
-                if scores:
-                    text_relevance_score = sum(scores) / len(scores)
-                    max_text_score = max(scores)
-            
-            image_points = []
-            # Qdrant query_points returns points attribute, not result
-            if hasattr(image_results, 'points') and image_results.points:
-                image_points = image_results.points
-                scores = [point.score for point in image_points if hasattr(point, 'score') and point.score is not None]
-                if scores:
-                    image_relevance_score = sum(scores) / len(scores)  # Average instead of sum
-                    max_image_score = max(scores)
-            elif hasattr(image_results, 'result') and image_results.result:
-                # Fallback for older API
-                image_points = image_results.result
-                scores = [point.score for point in image_points if hasattr(point, 'score') and point.score is not None]
-                if scores:
-                    image_relevance_score = sum(scores) / len(scores)
-                    max_image_score = max(scores)
+        if text_result is not None:
+            text_points = text_result.points
+            scores = text_result.scores
+            if scores:
+                text_relevance_score = sum(scores) / len(scores)  # Average instead of sum
+                max_text_score = max(scores)
+
+        if image_result is not None:
+            image_points = image_result.points
+            scores = image_result.scores
+            if scores:
+                image_relevance_score = sum(scores) / len(scores)  # Average instead of sum
+                max_image_score = max(scores)
         
     except Exception as e:
         print(f"Error during vector search: {str(e)}")
         print("---ROUTE: FALLBACK TO VECTORSTORE DUE TO SEARCH ERROR---")
         # Variables are already initialized at the top, so just continue with routing logic
 
-    # Calculate relevance scores more robustly
-    text_relevance_score = 0
-    image_relevance_score = 0
-    max_text_score = 0
-    max_image_score = 0
-    
-    # Extract results safely and calculate scores
-    text_points = []
-    # Qdrant query_points returns points attribute, not result
-    if text_results and hasattr(text_results, 'points') and text_results.points:
-        text_points = text_results.points
-        scores = [point.score for point in text_points if hasattr(point, 'score') and point.score is not None]
-        if scores:
-            text_relevance_score = sum(scores) / len(scores)  # Average instead of sum
-            max_text_score = max(scores)
-    elif hasattr(text_results, 'result') and text_results.result:
-        # Fallback for older API
-        text_points = text_results.result
-        scores = [point.score for point in text_points if hasattr(point, 'score') and point.score is not None]
-        if scores:
-            text_relevance_score = sum(scores) / len(scores)
-            max_text_score = max(scores)
-    
-    image_points = []
-    # Qdrant query_points returns points attribute, not result
-    if image_results and hasattr(image_results, 'points') and image_results.points:
-        image_points = image_results.points
-        scores = [point.score for point in image_points if hasattr(point, 'score') and point.score is not None]
-        if scores:
-            image_relevance_score = sum(scores) / len(scores)  # Average instead of sum
-            max_image_score = max(scores)
-    elif hasattr(image_results, 'result') and image_results.result:
-        # Fallback for older API
-        image_points = image_results.result
-        scores = [point.score for point in image_points if hasattr(point, 'score') and point.score is not None]
-        if scores:
-            image_relevance_score = sum(scores) / len(scores)
-            max_image_score = max(scores)
-
     # Use the higher of average scores or max individual score for decision making
     best_text_score = max(text_relevance_score, max_text_score)
     best_image_score = max(image_relevance_score, max_image_score)
@@ -267,7 +166,41 @@ def route_question(state):
     state['performance_metrics']['total_queries'] += 1
     
     return routing_decision
-    
+
+
+def route_question_to_retrievers(state):
+    """
+    Route the question, fanning vectorstore queries out to the text and image
+    retrieval branches so both searches run in the same graph step.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        str or list: Next node(s) to call
+    """
+    routing_decision = route_question(state)
+    if routing_decision == "vectorstore":
+        return ["vectorstore", "vectorstore_images"]
+    return routing_decision
+
+
+async def aroute_question_to_retrievers(state):
+    """
+    Async version of route_question_to_retrievers. Runs the routing searches
+    with the async client when the entry node did not, then applies the same
+    routing rules.
+    """
+    question = state["messages"][-1].content
+    text_result = (state.get("router_results") or {}).get("text")
+    if text_result is None or text_result.question != question:
+        try:
+            state = {**state, "router_results": await aget_router_results(state, question)}
+        except Exception as e:
+            print(f"Async routing search failed, router will retry: {e}")
+    return route_question_to_retrievers(state)
+
+
 def decide_to_generate(state):
     """
     Determines whether to generate an answer, add web search, or re-generate a question.
@@ -283,6 +216,8 @@ def decide_to_generate(state):
     filtered_documents = state["documents"]
     vectorstore_searched = state.get("vectorstore_searched", False)
     web_searched = state.get("web_searched", False)
+    # A web search that failed or found nothing is not tried again
+    web_search_available = not web_searched and not state.get("web_search_failed", False)
     
     print(f"Filtered documents count: {len(filtered_documents) if filtered_documents else 0}")
     print(f"Vectorstore searched: {vectorstore_searched}, Web searched: {web_searched}")
@@ -290,10 +225,10 @@ def decide_to_generate(state):
     if not filtered_documents:
         # All documents have been filtered check_relevance
         retry_count = state.get("retry_count", 0)
-        if not web_searched and vectorstore_searched and retry_count < 2:
+        if web_search_available and vectorstore_searched and retry_count < 2:
             print("---DECISION: NO RELEVANT VECTORSTORE DOCS, TRY WEB SEARCH---")
             return "integrate_web_search"
-        elif not web_searched and retry_count < 2:
+        elif web_search_available and retry_count < 2:
             print("---DECISION: NO RELEVANT DOCS AFTER ALL SEARCHES, TRY FINANCIAL WEB SEARCH---")
             return "financial_web_search"
         else:
@@ -302,7 +237,7 @@ def decide_to_generate(state):
             return "generate"
     else:
         # We have relevant documents, be more generous with what we consider sufficient
-        if vectorstore_searched and not web_searched and len(filtered_documents) == 1:
+        if vectorstore_searched and web_search_available and len(filtered_documents) == 1:
             # Only supplement with web if we have just 1 document (reduced threshold)
             print("---DECISION: SINGLE DOCUMENT FOUND, SUPPLEMENT WITH WEB SEARCH---")
             return "integrate_web_search"
@@ -310,36 +245,98 @@ def decide_to_generate(state):
             print(f"---DECISION: SUFFICIENT DOCUMENTS ({len(filtered_documents)}), GENERATE ANSWER---")
             return "generate"
     
+def get_generation_graders():
+    """
+    Hallucination and answer-quality graders run side by side: invoke() runs
+    both in threads and ainvoke() gathers them, so grading a generation takes
+    one LLM round trip instead of two. Each prompt only reads its own inputs.
+    """
+    return RunnableParallel(
+        grounded=global_llm_registry.get_chain("hallucination_grader"),
+        answers_question=global_llm_registry.get_chain("answer_grader")
+    )
+
+
+def generation_grader_inputs(state):
+    return {
+        "documents": documents_for_grounding(state),
+        "question": state["messages"][-1].content,
+        "generation": state["Intermediate_message"]
+    }
+
+
 def grade_generation_v_documents_and_question(state):
     """
-    Determines whether the generation is grounded in the document and answers question.
+    Grades whether the generation is grounded in the documents and answers the question.
     Enhanced for cross-referencing scenarios.
 
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): Updates generation_grades with the hallucination and answer grades
+    """
+
+    print("---CHECK HALLUCINATIONS AND GRADE GENERATION vs QUESTION---")
+    scores = get_generation_graders().invoke(generation_grader_inputs(state))
+    return record_generation_grades(state, scores)
+
+
+async def agrade_generation_v_documents_and_question(state):
+    """
+    Async version of grade_generation_v_documents_and_question.
+    """
+    print("---CHECK HALLUCINATIONS AND GRADE GENERATION vs QUESTION---")
+    scores = await get_generation_graders().ainvoke(generation_grader_inputs(state))
+    return record_generation_grades(state, scores)
+
+
+def record_generation_grades(state, scores):
+    grade = scores["grounded"].binary_score
+    answer_grade = scores["answers_question"].binary_score
+    if grade.lower() == "yes":
+        print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
+        print(f"Question: {state['messages'][-1].content}, Answer {state['Intermediate_message']}")
+    return {"generation_grades": {"grounded": grade.lower(), "answers_question": answer_grade.lower()}}
+
+
+def decide_after_generation_grading(state):
+    """
+    Routes a graded generation using the grades recorded by
+    grade_generation_v_documents_and_question.
+
     Args:
         state (dict): The current graph state
 
     Returns:
         str: Decision for next node to call
     """
+    grades = state.get("generation_grades") or {}
+    return decide_after_generation_grades(state, grades.get("grounded", "no"), grades.get("answers_question", "no"))
 
-    print("---CHECK HALLUCINATIONS---")
-    messages = state["messages"]
-    question = messages[-1].content
-    
+
+def generation_is_verified(state) -> bool:
+    """
+    Whether the final generation was graded grounded and useful, rather than
+    accepted to stop retrying or generated without any documents.
+    """
+    grades = state.get("generation_grades") or {}
+    return (
+        bool(state.get("documents"))
+        and grades.get("grounded") == "yes"
+        and grades.get("answers_question") == "yes"
+    )
+
+
+def documents_for_grounding(state):
+    """
+    Documents the generation is checked against: for cross-referencing, all
+    categorized document sources if available, otherwise the graded documents.
+    """
     documents = state["documents"]
     document_sources = state.get("document_sources", {})
-    Intermediate_message = state["Intermediate_message"]
     cross_ref_analysis = state.get("cross_reference_analysis", {})
 
-    #  Track retry count in state
-    retry_count = state.get("retry_count", 0)
-    max_retries = 1  # Reduced from 2 to 1 for faster responses
-
-    llm = ChatOpenAI(model="gpt-4o")
-    hallucination_grader = get_hallucination_chain(llm)
-    
-    # For cross-referencing, use document_sources if available, otherwise fall back to documents
-    docs_for_grading = documents
     if cross_ref_analysis.get("needs_cross_reference") == "yes" and document_sources:
         # Combine all document sources for grading
         all_docs_for_grading = []
@@ -347,24 +344,30 @@ def grade_generation_v_documents_and_question(state):
             if source_docs:
                 all_docs_for_grading.extend(source_docs)
         if all_docs_for_grading:
-            docs_for_grading = all_docs_for_grading
-    
-    score = hallucination_grader.invoke(
-        {"documents": docs_for_grading, "generation": Intermediate_message}
-    )
-    grade = score.binary_score
+            return all_docs_for_grading
+    return documents
+
+
+def decide_after_generation_grades(state, grade, answer_grade):
+    """
+    Turn the hallucination and answer-quality grades into the next step.
+
+    Args:
+        state (dict): The current graph state
+        grade (str): Hallucination grade ('yes' when grounded)
+        answer_grade (str): Answer-quality grade, None when not graded
+
+    Returns:
+        str: Decision for next node to call
+    """
+    cross_ref_analysis = state.get("cross_reference_analysis", {})
+
+    #  Track retry count in state
+    retry_count = state.get("retry_count", 0)
+    max_retries = 1  # Reduced from 2 to 1 for faster responses
 
     # Check hallucination
     if grade.lower() == "yes":
-        print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
-        # Check question-answering
-        print("---GRADE GENERATION vs QUESTION---")
-        print(f"Question: {question}, Answer {Intermediate_message}")
-        answer_grader = get_answer_quality_chain(llm)
-        answer_score = answer_grader.invoke(
-            {"question": question, "generation": Intermediate_message}
-        )
-        answer_grade = answer_score.binary_score
         if answer_grade.lower() == "yes":
             print("---DECISION: GENERATION ADDRESSES QUESTION---")
             return "useful"
@@ -0,0 +1,102 @@
+"""
+Cross-session cache of document grades from the retrieval grader.
+
+Verdicts are keyed by (normalized question, chunk ID, grader model) and tagged
+with the corpus version, so re-ingesting documents invalidates them.
+"""
+
+import os
+import re
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from Graph.cache_engine import LRUTTLCache
+from load_vector_dbs.singleflight import SingleFlight
+from load_vector_dbs.vector_db_registry import global_vector_db_registry
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question or "").strip().lower().rstrip("?!. ")
+
+
+def document_cache_id(document: Any) -> str:
+    """
+    Stable identifier for a document: the Qdrant point ID when it came from
+    the vector store, otherwise a hash of its content (e.g. web results).
+    """
+    metadata = getattr(document, "metadata", None) or {}
+    point_id = metadata.get("_id")
+    if point_id is not None:
+        return f"{metadata.get('_collection_name', '')}:{point_id}"
+    content = getattr(document, "page_content", str(document))
+    return "sha1:" + hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class GradeCache:
+    """
+    Process-wide cache of "yes"/"no" grades shared by all sessions.
+    """
+
+    def __init__(self, max_entries: int = 20000, ttl: Optional[float] = 24 * 3600, registry=None):
+        """
+        Args:
+            max_entries: Maximum number of cached grades
+            ttl: Time to live for a grade in seconds
+            registry: Vector DB registry providing the corpus version
+        """
+        self.registry = registry or global_vector_db_registry
+        self._cache = LRUTTLCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self._inflight = SingleFlight("grading")
+
+    def _key(self, question: str, document: Any, model: str):
+        return (self.registry.corpus_version, model, normalize_question(question), document_cache_id(document))
+
+    def get_many(self, question: str, documents: List[Any], model: str) -> Dict[int, str]:
+        """
+        Look up cached grades.
+
+        Returns:
+            dict: Maps the index of each document with a cached grade to that grade
+        """
+        found = {}
+        with self._lock:
+            for index, document in enumerate(documents):
+                grade = self._cache.get(self._key(question, document, model))
+                if grade is not None:
+                    found[index] = grade
+        return found
+
+    def put(self, question: str, document: Any, model: str, grade: str):
+        """Store the grader's verdict for a document."""
+        if grade is None:
+            return
+        with self._lock:
+            self._cache.put(self._key(question, document, model), grade.lower(), size=0)
+
+    def coalesce(self, question: str, document: Any, model: str, grade_fn):
+        """
+        Run grade_fn(), unless the same grade (question, chunk, model) is
+        already being computed by another request; then share that result.
+        """
+        return self._inflight.do(self._key(question, document, model), grade_fn)
+
+    async def acoalesce(self, question: str, document: Any, model: str, agrade_fn):
+        """Async version of coalesce; agrade_fn returns a coroutine."""
+        return await self._inflight.ado(self._key(question, document, model), agrade_fn)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._cache.get_stats(), 'coalesced': self._inflight.stats['shared']}
+
+
+# Shared across sessions in the process
+global_grade_cache = GradeCache(
+    max_entries=int(os.getenv("GRADE_CACHE_MAX_ENTRIES", "20000")),
+    ttl=float(os.getenv("GRADE_CACHE_TTL", str(24 * 3600)))
+)
@@ -0,0 +1,210 @@
+"""
+Score-aware pre-grading: decide clear cases from the Qdrant similarity score so
+the LLM grader only sees ambiguous documents.
+
+Cut-offs come from the LLM grades logged for earlier documents (per collection),
+or can be pinned with GRADE_ACCEPT_SCORE / GRADE_REJECT_SCORE. A small random
+share of score-decided documents still goes to the LLM (GRADE_CALIBRATION_SAMPLE_RATE)
+so the logged grades keep covering the whole score range.
+"""
+
+import os
+import json
+import random
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from load_vector_dbs.load_dbs import SCORE_METADATA_KEY
+
+# Share of score-decided documents sent to the LLM grader as calibration samples
+GRADE_CALIBRATION_SAMPLE_RATE = float(os.getenv("GRADE_CALIBRATION_SAMPLE_RATE", "0.05"))
+# Seconds between background flushes of recorded grades
+GRADE_CALIBRATION_FLUSH_INTERVAL = float(os.getenv("GRADE_CALIBRATION_FLUSH_INTERVAL", "2"))
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else None
+
+
+class ScoreGradeCalibrator:
+    """
+    Keeps (similarity score, LLM grade) pairs per collection and derives the
+    score above which the LLM always accepted and below which it always rejected.
+    Recorded grades are queued and applied in batches by a background writer,
+    so the request path never re-sorts samples or touches the log file.
+    """
+
+    def __init__(self, log_path: Optional[str] = None, max_samples: int = 2000,
+                 min_samples: int = 50, target_precision: float = 0.97,
+                 flush_interval: float = GRADE_CALIBRATION_FLUSH_INTERVAL):
+        """
+        Args:
+            log_path: JSONL file the grades are appended to and loaded from (None to keep in memory)
+            max_samples: Samples kept per collection
+            min_samples: Samples needed before cut-offs are derived
+            target_precision: Share of LLM grades that must agree above/below a cut-off
+            flush_interval: Seconds between background flushes of recorded grades
+        """
+        self.log_path = log_path
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.target_precision = target_precision
+        self.accept_override = _env_float("GRADE_ACCEPT_SCORE")
+        self.reject_override = _env_float("GRADE_REJECT_SCORE")
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self._thresholds: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[str, float, bool]] = []
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._load()
+
+    def _load(self):
+        if not self.log_path or not os.path.exists(self.log_path):
+            return
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._add(entry["collection"], entry["score"], entry["relevant"])
+            for collection in self._samples:
+                self._recalibrate(collection)
+            print(f"Loaded grade calibration samples from {self.log_path}")
+        except Exception as e:
+            print(f"Could not load grade calibration log: {e}")
+
+    def _add(self, collection: str, score: float, relevant: bool):
+        samples = self._samples.setdefault(collection, deque(maxlen=self.max_samples))
+        samples.append((float(score), bool(relevant)))
+
+    def record(self, collection: str, score: float, relevant: bool):
+        """Queue an LLM grade for a document with a known similarity score."""
+        with self._pending_lock:
+            self._pending.append((collection, float(score), bool(relevant)))
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._flush_loop, name="grade-calibration", daemon=True)
+                self._writer.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Apply the queued grades: recalibrate once per collection and append them to the log."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        with self._lock:
+            for collection, score, relevant in pending:
+                self._add(collection, score, relevant)
+            for collection in {collection for collection, _, _ in pending}:
+                self._recalibrate(collection)
+            if self.log_path:
+                try:
+                    directory = os.path.dirname(self.log_path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.writelines(
+                            json.dumps({"collection": collection, "score": score, "relevant": relevant}) + "\n"
+                            for collection, score, relevant in pending
+                        )
+                except Exception as e:
+                    print(f"Could not write grade calibration log: {e}")
+
+    def _recalibrate(self, collection: str):
+        samples = sorted(self._samples.get(collection, []))
+        if len(samples) < self.min_samples:
+            self._thresholds[collection] = (None, None)
+            return
+
+        # Lowest score from which the LLM accepted at least target_precision of documents
+        accept = None
+        relevant_above = 0
+        for count, (score, relevant) in enumerate(reversed(samples), start=1):
+            relevant_above += relevant
+            if count >= 10 and relevant_above / count >= self.target_precision:
+                accept = score
+
+        # Highest score up to which the LLM rejected at least target_precision of documents
+        reject = None
+        rejected_below = 0
+        for count, (score, relevant) in enumerate(samples, start=1):
+            rejected_below += not relevant
+            if count >= 10 and rejected_below / count >= self.target_precision:
+                reject = score
+
+        if accept is not None and reject is not None and reject >= accept:
+            accept, reject = None, None  # overlapping evidence, keep using the LLM
+        self._thresholds[collection] = (accept, reject)
+
+    def thresholds(self, collection: str) -> Tuple[Optional[float], Optional[float]]:
+        """
+        Returns:
+            tuple: (accept_at_or_above, reject_at_or_below); None disables that side
+        """
+        accept, reject = self._thresholds.get(collection, (None, None))
+        if self.accept_override is not None:
+            accept = self.accept_override
+        if self.reject_override is not None:
+            reject = self.reject_override
+        return accept, reject
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            collection: {
+                'samples': len(samples),
+                'thresholds': self.thresholds(collection)
+            }
+            for collection, samples in self._samples.items()
+        }
+
+
+def pre_grade_documents(documents: List[Any], calibrator: ScoreGradeCalibrator):
+    """
+    Split documents by similarity score before LLM grading.
+
+    Documents without a score (e.g. web results) are always ambiguous.
+
+    Returns:
+        tuple: (decisions, ambiguous_indexes) where decisions maps a document's
+        index to "yes"/"no" for the clear cases
+    """
+    decisions = {}
+    ambiguous = []
+    for index, document in enumerate(documents):
+        metadata = getattr(document, "metadata", None) or {}
+        score = metadata.get(SCORE_METADATA_KEY)
+        if score is None:
+            ambiguous.append(index)
+            continue
+
+        accept, reject = calibrator.thresholds(metadata.get("_collection_name", "unknown"))
+        if accept is not None and score >= accept:
+            decisions[index] = "yes"
+        elif reject is not None and score <= reject:
+            decisions[index] = "no"
+        else:
+            ambiguous.append(index)
+    return decisions, ambiguous
+
+
+def calibration_samples(decisions: Dict[int, str], rate: float = GRADE_CALIBRATION_SAMPLE_RATE) -> List[int]:
+    """
+    Indexes of score-decided documents to grade with the LLM anyway, so the
+    calibrator keeps seeing LLM grades above and below the cut-offs.
+    """
+    return [index for index in decisions if random.random() < rate]
+
+
+# Shared calibrator; grades are logged so cut-offs survive restarts
+global_grade_calibrator = ScoreGradeCalibrator(
+    log_path=os.getenv("GRADE_LOG_PATH", os.path.join("cache", "grade_log.jsonl"))
+)
@@ -4,6 +4,24 @@ from langgraph.graph.message import add_messages
 from typing_extensions import TypedDict
 import time
 
+
+def merge_tool_calls(existing: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge tool call logs written by nodes that may run in the same step.
+
+    Nodes return the full log (previous entries plus their own), so the entries
+    both lists share as a prefix are kept once and the new tail is appended.
+    """
+    existing = existing or []
+    new = new or []
+    shared = 0
+    for old_entry, new_entry in zip(existing, new):
+        if old_entry != new_entry:
+            break
+        shared += 1
+    return list(existing) + list(new[shared:])
+
+
 class GraphState(TypedDict):
     """
     Represents the state of our graph with memory capabilities.
@@ -12,14 +30,19 @@ class GraphState(TypedDict):
         question: question
         generation: LLM generation
         documents: list of documents
+        text_documents: documents from the text retrieval branch
+        image_documents: documents from the image retrieval branch
+        router_results: scored points from the routing searches, reused by retrieval
         vectorstore_searched: whether vectorstore has been searched
         web_searched: whether web search has been conducted
+        web_search_failed: whether a web search failed or found nothing (not retried)
         vectorstore_quality: quality score of vectorstore results
         needs_web_fallback: whether web search is needed as fallback
         cross_reference_analysis: analysis of cross-referencing needs
         document_sources: categorized document sources for citation
         citation_info: citation information for all sources
         summary_strategy: strategy for document summarization
+        generation_grades: hallucination and answer grades of the latest generation
         
         # Memory and Performance Enhancement Components
         conversation_memory: conversational context and history
@@ -27,23 +50,29 @@ class GraphState(TypedDict):
         document_cache: cached document retrievals and gradings
         routing_memory: learned routing patterns and preferences
         performance_metrics: timing and quality metrics for optimization
-        context_embeddings: cached embeddings for faster similarity matching
+        context_embeddings: the current question and its embedding, reused by routing and retrieval
+        speculative_tasks: question-only classifiers started at graph entry, joined by the nodes using them
         user_preferences: learned user preferences and query patterns
         session_metadata: session-level information and context
     """
     messages: Annotated[Sequence[BaseMessage], add_messages]
     Intermediate_message: str
     documents: List[str]
+    text_documents: List[Any]
+    image_documents: List[Any]
+    router_results: Optional[Dict[str, Any]]
     retry_count: int
-    tool_calls: List[Dict[str, Any]]
+    tool_calls: Annotated[List[Dict[str, Any]], merge_tool_calls]
     vectorstore_searched: bool
     web_searched: bool
+    web_search_failed: bool
     vectorstore_quality: str  # "good", "poor", "none"
     needs_web_fallback: bool
     cross_reference_analysis: Dict[str, Any]
     document_sources: Dict[str, List[Any]]  # categorized by source type
     citation_info: List[Dict[str, Any]]
     summary_strategy: str
+    generation_grades: Optional[Dict[str, str]]  # {"grounded": "yes"/"no", "answers_question": "yes"/"no"}
     
     # Memory and Performance Enhancement
     conversation_memory: Optional[Dict[str, Any]]
@@ -52,6 +81,7 @@ class GraphState(TypedDict):
     routing_memory: Optional[Dict[str, Any]]
     performance_metrics: Optional[Dict[str, Any]]
     context_embeddings: Optional[Dict[str, Any]]
+    speculative_tasks: Optional[Dict[str, Any]]
     user_preferences: Optional[Dict[str, Any]]
     session_metadata: Optional[Dict[str, Any]] 
     
\ No newline at end of file
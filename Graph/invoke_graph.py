@@ -1,20 +1,35 @@
 "This module is useful for building the graph which will create an agentic workflow."
 import os
 from dotenv import load_dotenv
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from Graph.graph_state import GraphState
-from Graph.nodes import (retrieve_from_images_data, web_search, retrieve,
-                         grade_documents, generate, transform_query,
-                         financial_web_search, show_result, integrate_web_search,
+from Graph.nodes import (retrieve_from_images_data, web_search,
+                         transform_query, financial_web_search, show_result, integrate_web_search,
                          evaluate_vectorstore_quality, analyze_cross_reference_needs,
                          determine_summary_strategy, categorize_documents_by_source,
-                         generate_with_cross_reference_and_citations)
-from Graph.edges import (route_question, decide_to_generate,
+                         generate_with_cross_reference_and_citations, prepare_question,
+                         merge_retrieved_documents, aretrieve_from_images_data, aweb_search,
+                         atransform_query, afinancial_web_search, aintegrate_web_search,
+                         aanalyze_cross_reference_needs,
+                         agenerate_with_cross_reference_and_citations, aprepare_question,
+                         rerank_documents, arerank_documents)
+from Graph.edges import (route_question_to_retrievers, decide_to_generate,
                          grade_generation_v_documents_and_question,
                          decide_after_web_integration, decide_cross_reference_approach,
-                         decide_after_cross_reference_analysis)
+                         decide_after_cross_reference_analysis, aroute_question_to_retrievers,
+                         agrade_generation_v_documents_and_question, decide_after_generation_grading)
 from Graph.session_aware_wrapper import SessionAwareGraphWrapper
 load_dotenv()
+
+
+def sync_and_async(func, afunc):
+    """
+    Wrap a node or edge with its async version, so the compiled graph runs
+    func under invoke() and afunc under ainvoke().
+    """
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
+
 os.environ["GROQ_API_KEY"]=os.getenv("GROQ_API_KEY")
 os.environ["TAVILY_API_KEY"]=os.getenv("TAVILY_API_KEY")
 
@@ -44,37 +59,52 @@ class BuildingGraph:
             memory_enhanced_retrieve, 
             memory_enhanced_generate, 
             memory_enhanced_grade_documents,
-            finalize_with_memory_update
+            finalize_with_memory_update,
+            amemory_enhanced_retrieve,
+            amemory_enhanced_generate,
+            amemory_enhanced_grade_documents
         )
         
-        workflow.add_node("image_analyses_retrival",retrieve_from_images_data)
-        workflow.add_node("web_search", web_search)
-        workflow.add_node("retrieve", memory_enhanced_retrieve)  # Memory-enhanced
-        workflow.add_node("grade_documents", memory_enhanced_grade_documents)  # Memory-enhanced
-        workflow.add_node("generate", memory_enhanced_generate)  # Memory-enhanced
-        workflow.add_node("transform_query", transform_query)
-        workflow.add_node("financial_web_search", financial_web_search)
+        # Nodes that do I/O get an async version used by ainvoke()
+        workflow.add_node("prepare_question", sync_and_async(prepare_question, aprepare_question))  # Embeds the question once
+        workflow.add_node("image_analyses_retrival", sync_and_async(retrieve_from_images_data, aretrieve_from_images_data))
+        workflow.add_node("merge_retrieved_documents", merge_retrieved_documents)
+        workflow.add_node("rerank_documents", sync_and_async(rerank_documents, arerank_documents))  # Local CPU reranker
+        workflow.add_node("web_search", sync_and_async(web_search, aweb_search))
+        workflow.add_node("retrieve", sync_and_async(memory_enhanced_retrieve, amemory_enhanced_retrieve))  # Memory-enhanced
+        workflow.add_node("grade_documents", sync_and_async(memory_enhanced_grade_documents, amemory_enhanced_grade_documents))  # Memory-enhanced
+        workflow.add_node("generate", sync_and_async(memory_enhanced_generate, amemory_enhanced_generate))  # Memory-enhanced
+        workflow.add_node("transform_query", sync_and_async(transform_query, atransform_query))
+        workflow.add_node("financial_web_search", sync_and_async(financial_web_search, afinancial_web_search))
         workflow.add_node("show_result", show_result)
-        workflow.add_node("integrate_web_search", integrate_web_search)
+        workflow.add_node("integrate_web_search", sync_and_async(integrate_web_search, aintegrate_web_search))
         workflow.add_node("evaluate_vectorstore_quality", evaluate_vectorstore_quality)
-        workflow.add_node("analyze_cross_reference", analyze_cross_reference_needs)
-        workflow.add_node("determine_strategy", determine_summary_strategy)
+        workflow.add_node("analyze_cross_reference", sync_and_async(analyze_cross_reference_needs, aanalyze_cross_reference_needs))
+        workflow.add_node("determine_strategy", determine_summary_strategy)  # Rule-based, no LLM call
         workflow.add_node("categorize_documents", categorize_documents_by_source)
-        workflow.add_node("generate_with_citations", generate_with_cross_reference_and_citations)
+        workflow.add_node("generate_with_citations", sync_and_async(generate_with_cross_reference_and_citations,
+                                                                    agenerate_with_cross_reference_and_citations))
         workflow.add_node("finalize_memory", finalize_with_memory_update)  # New memory finalization node
 
+        workflow.add_edge(START, "prepare_question")
+
+        # Vectorstore queries fan out to text and image retrieval in parallel
         workflow.add_conditional_edges(
-            START,
-            route_question,
+            "prepare_question",
+            sync_and_async(route_question_to_retrievers, aroute_question_to_retrievers),
             {
                 "web_search": "web_search",
-                "vectorstore": "retrieve"
+                "vectorstore": "retrieve",
+                "vectorstore_images": "image_analyses_retrival"
             },
         )
 
-        workflow.add_edge("retrieve", "image_analyses_retrival")
+        # Wait for both retrieval branches before grading
+        workflow.add_edge(["retrieve", "image_analyses_retrival"], "merge_retrieved_documents")
 
-        workflow.add_edge("image_analyses_retrival", "grade_documents")
+        # Rerank the candidate pool locally; only the top-N reach the grader
+        workflow.add_edge("merge_retrieved_documents", "rerank_documents")
+        workflow.add_edge("rerank_documents", "grade_documents")
 
         workflow.add_edge("web_search", "generate")
 
@@ -88,6 +118,14 @@ class BuildingGraph:
             },
         )
 
+        # Generations are graded in their own nodes so the grades stay in the state
+        workflow.add_node("grade_generation", sync_and_async(
+            grade_generation_v_documents_and_question, agrade_generation_v_documents_and_question
+        ))
+        workflow.add_node("grade_generation_with_citations", sync_and_async(
+            grade_generation_v_documents_and_question, agrade_generation_v_documents_and_question
+        ))
+
         # New edge for web integration
         workflow.add_conditional_edges(
             "integrate_web_search",
@@ -113,10 +151,12 @@ class BuildingGraph:
 
         workflow.add_edge("financial_web_search", "generate")
         workflow.add_edge("transform_query", "retrieve")
+        workflow.add_edge("transform_query", "image_analyses_retrival")
 
+        workflow.add_edge("generate", "grade_generation")
         workflow.add_conditional_edges(
-            "generate",
-            grade_generation_v_documents_and_question,
+            "grade_generation",
+            decide_after_generation_grading,
             {
                 "not supported": "generate",
                 "useful": "show_result",
@@ -125,9 +165,10 @@ class BuildingGraph:
         )
 
         # Add similar grading for enhanced generation with citations
+        workflow.add_edge("generate_with_citations", "grade_generation_with_citations")
         workflow.add_conditional_edges(
-            "generate_with_citations",
-            grade_generation_v_documents_and_question,
+            "grade_generation_with_citations",
+            decide_after_generation_grading,
             {
                 "not supported": "generate_with_citations",
                 "useful": "show_result",
@@ -4,29 +4,71 @@ Memory-enhanced nodes for the RAG system that leverage caching and conversation
 
 from Graph.memory_manager import global_memory_manager, with_memory
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-def memory_enhanced_retrieve(state: Dict[str, Any]) -> Dict[str, Any]:
+
+def get_session_memory_manager(state: Dict[str, Any]):
     """
-    Enhanced retrieve function with memory capabilities.
+    Get the memory manager of the session the state belongs to,
+    falling back to the global one.
     """
-    print("---MEMORY-ENHANCED RETRIEVE---")
-    start_time = time.time()
-    
-    messages = state["messages"]
-    question = messages[-1].content
-    
-    # Get session-specific memory manager
     session_memory_manager = global_memory_manager  # Default fallback
-    if 'session_metadata' in state and 'user_id' in state['session_metadata']:
+    if 'session_metadata' in state:
         # Use session-specific memory from session manager
         from Graph.session_aware_wrapper import global_session_manager_v2
         session_id = state['session_metadata'].get('session_id', 'default')
         session_graph = global_session_manager_v2.active_sessions.get(session_id)
         if session_graph and hasattr(session_graph, 'session_memory_manager'):
             session_memory_manager = session_graph.session_memory_manager
-            print(f"Using session memory manager for: {session_id}")
-    
+    return session_memory_manager
+
+
+def memory_enhanced_retrieve(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Enhanced retrieve function with memory capabilities.
+    """
+    print("---MEMORY-ENHANCED RETRIEVE---")
+    start_time = time.time()
+    question = state["messages"][-1].content
+    session_memory_manager = get_session_memory_manager(state)
+
+    cached_result = get_cached_retrieval(state, session_memory_manager, question)
+    if cached_result is not None:
+        return cached_result
+
+    # If not cached, perform normal retrieval
+    from Graph.nodes import retrieve
+    result = retrieve(state)
+    record_retrieval(session_memory_manager, question, result, start_time)
+    return result
+
+
+async def amemory_enhanced_retrieve(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Async version of memory_enhanced_retrieve.
+    """
+    print("---MEMORY-ENHANCED RETRIEVE---")
+    start_time = time.time()
+    question = state["messages"][-1].content
+    session_memory_manager = get_session_memory_manager(state)
+
+    cached_result = get_cached_retrieval(state, session_memory_manager, question)
+    if cached_result is not None:
+        return cached_result
+
+    from Graph.nodes import aretrieve
+    result = await aretrieve(state)
+    record_retrieval(session_memory_manager, question, result, start_time)
+    return result
+
+
+def get_cached_retrieval(state: Dict[str, Any], session_memory_manager, question: str) -> Optional[Dict[str, Any]]:
+    """
+    Serve the text retrieval from the session's query cache.
+
+    Returns:
+        dict: The node result on a cache hit, otherwise None
+    """
     # Quick cache check with timeout
     try:
         # Check conversation context for related queries (limited to recent 2 for speed)
@@ -45,16 +87,23 @@ def memory_enhanced_retrieve(state: Dict[str, Any]) -> Dict[str, Any]:
     if cached_result:
         print("---USING CACHED RETRIEVAL RESULTS---")
         state['performance_metrics']['cache_hits'] += 1
-        return {**state, **cached_result}
-    
-    # If not cached, perform normal retrieval
-    from Graph.nodes import retrieve
-    result = retrieve(state)
-    
+        # Return only this branch's keys: the image branch updates state in the same step.
+        # Older cache entries stored the text documents under 'documents'.
+        text_documents = cached_result.get('text_documents', cached_result.get('documents', []))
+        return {
+            "text_documents": text_documents,
+            "vectorstore_searched": True,
+            "tool_calls": state.get("tool_calls", []) + [{"tool": "text_retriever_cache"}]
+        }
+    return None
+
+
+def record_retrieval(session_memory_manager, question: str, result: Dict[str, Any], start_time: float):
+    """Cache a fresh retrieval result and track its response time."""
     # Cache the results (with error handling for performance)
     try:
-        if result.get('documents'):
-            quality_score = len(result['documents']) / 4.0  # Normalize to 0-1 based on max expected docs
+        if result.get('text_documents'):
+            quality_score = len(result['text_documents']) / 4.0  # Normalize to 0-1 based on max expected docs
             # Cache without context for exact query matching
             session_memory_manager.cache_query_result(
                 question, 
@@ -73,8 +122,6 @@ def memory_enhanced_retrieve(state: Dict[str, Any]) -> Dict[str, Any]:
         session_memory_manager.performance_metrics['response_times'].append(response_time)
     except Exception as e:
         print(f"Performance tracking failed: {e}")
-    
-    return result
 
 
 def memory_enhanced_generate(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -82,16 +129,32 @@ def memory_enhanced_generate(state: Dict[str, Any]) -> Dict[str, Any]:
     Enhanced generate function that uses conversation memory for better responses.
     """
     print("---MEMORY-ENHANCED GENERATE---")
-    
-    # Get session-specific memory manager
-    session_memory_manager = global_memory_manager  # Default fallback
-    if 'session_metadata' in state:
-        from Graph.session_aware_wrapper import global_session_manager_v2
-        session_id = state['session_metadata'].get('session_id', 'default')
-        session_graph = global_session_manager_v2.active_sessions.get(session_id)
-        if session_graph and hasattr(session_graph, 'session_memory_manager'):
-            session_memory_manager = session_graph.session_memory_manager
-    
+    session_memory_manager = get_session_memory_manager(state)
+    apply_conversation_context(state, session_memory_manager)
+
+    # Perform generation (import here to avoid circular imports)
+    from Graph.nodes import generate
+    result = generate(state)
+    record_generation(state, session_memory_manager, result)
+    return result
+
+
+async def amemory_enhanced_generate(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Async version of memory_enhanced_generate.
+    """
+    print("---MEMORY-ENHANCED GENERATE---")
+    session_memory_manager = get_session_memory_manager(state)
+    apply_conversation_context(state, session_memory_manager)
+
+    from Graph.nodes import agenerate
+    result = await agenerate(state)
+    record_generation(state, session_memory_manager, result)
+    return result
+
+
+def apply_conversation_context(state: Dict[str, Any], session_memory_manager):
+    """Add recent conversation context and user preferences to the state for generation."""
     # Get conversation context for continuity
     conversation_context = session_memory_manager.get_conversation_context()
     if conversation_context:
@@ -113,11 +176,10 @@ def memory_enhanced_generate(state: Dict[str, Any]) -> Dict[str, Any]:
         state['detail_level'] = user_prefs['preferred_detail_level']
     if user_prefs.get('response_format_preference'):
         state['format_preference'] = user_prefs['response_format_preference']
-    
-    # Perform generation (import here to avoid circular imports)
-    from Graph.nodes import generate
-    result = generate(state)
-    
+
+
+def record_generation(state: Dict[str, Any], session_memory_manager, result: Dict[str, Any]):
+    """Update conversation memory with the generated answer."""
     # Update conversation memory
     if result.get('Intermediate_message'):
         context_used = [doc.metadata.get('source_file', 'unknown') for doc in state.get('documents', [])]
@@ -126,8 +188,6 @@ def memory_enhanced_generate(state: Dict[str, Any]) -> Dict[str, Any]:
             result['Intermediate_message'],
             context_used
         )
-    
-    return result
 
 
 def memory_enhanced_grade_documents(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -135,16 +195,32 @@ def memory_enhanced_grade_documents(state: Dict[str, Any]) -> Dict[str, Any]:
     Enhanced document grading that learns from user feedback and past decisions.
     """
     print("---MEMORY-ENHANCED DOCUMENT GRADING---")
-    
-    # Get session-specific memory manager
-    session_memory_manager = global_memory_manager  # Default fallback
-    if 'session_metadata' in state:
-        from Graph.session_aware_wrapper import global_session_manager_v2
-        session_id = state['session_metadata'].get('session_id', 'default')
-        session_graph = global_session_manager_v2.active_sessions.get(session_id)
-        if session_graph and hasattr(session_graph, 'session_memory_manager'):
-            session_memory_manager = session_graph.session_memory_manager
-            
+    session_memory_manager = get_session_memory_manager(state)
+    apply_feedback_grading_mode(state, session_memory_manager)
+
+    # Perform normal document grading
+    from Graph.nodes import grade_documents
+    result = grade_documents(state)
+    record_grading(state, session_memory_manager, result)
+    return result
+
+
+async def amemory_enhanced_grade_documents(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Async version of memory_enhanced_grade_documents.
+    """
+    print("---MEMORY-ENHANCED DOCUMENT GRADING---")
+    session_memory_manager = get_session_memory_manager(state)
+    apply_feedback_grading_mode(state, session_memory_manager)
+
+    from Graph.nodes import agrade_documents
+    result = await agrade_documents(state)
+    record_grading(state, session_memory_manager, result)
+    return result
+
+
+def apply_feedback_grading_mode(state: Dict[str, Any], session_memory_manager):
+    """Switch to lenient grading when recent user feedback was positive."""
     # Get conversation context to understand document relevance patterns
     conversation_context = session_memory_manager.get_conversation_context()
     recent_feedback = [ctx.get('user_feedback', 0) for ctx in conversation_context if ctx.get('user_feedback')]
@@ -154,11 +230,10 @@ def memory_enhanced_grade_documents(state: Dict[str, Any]) -> Dict[str, Any]:
         print("---APPLYING LENIENT GRADING BASED ON POSITIVE FEEDBACK---")
         # This would be implemented in the actual grading logic
         state['grading_mode'] = 'lenient'
-    
-    # Perform normal document grading
-    from Graph.nodes import grade_documents
-    result = grade_documents(state)
-    
+
+
+def record_grading(state: Dict[str, Any], session_memory_manager, result: Dict[str, Any]):
+    """Track how many documents survived grading."""
     # Learn from grading patterns
     if result.get('documents'):
         grading_quality = len(result['documents']) / len(state.get('documents', [1]))
@@ -167,8 +242,6 @@ def memory_enhanced_grade_documents(state: Dict[str, Any]) -> Dict[str, Any]:
             session_memory_manager.performance_metrics['vectorstore_scores'].append(grading_quality)
         except Exception as e:
             print(f"Performance tracking failed: {e}")
-    
-    return result
 
 
 def finalize_with_memory_update(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -186,14 +259,8 @@ def finalize_with_memory_update(state: Dict[str, Any]) -> Dict[str, Any]:
             routing_decision = routing_info.get('decision', 'unknown')
             
             # Get session-specific memory manager
-            session_memory_manager = global_memory_manager  # Default fallback
-            if 'session_metadata' in state:
-                from Graph.session_aware_wrapper import global_session_manager_v2
-                session_id = state['session_metadata'].get('session_id', 'default')
-                session_graph = global_session_manager_v2.active_sessions.get(session_id)
-                if session_graph and hasattr(session_graph, 'session_memory_manager'):
-                    session_memory_manager = session_graph.session_memory_manager
-                    
+            session_memory_manager = get_session_memory_manager(state)
+
             if routing_decision != 'unknown' and hasattr(session_memory_manager, 'learn_routing_pattern'):
                 session_memory_manager.learn_routing_pattern(
                     state['messages'][-1].content,
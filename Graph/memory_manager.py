@@ -10,6 +10,8 @@ from datetime import datetime, timedelta
 from langchain_core.messages import BaseMessage
 import numpy as np
 from functools import wraps
+from Graph.semantic_cache import SemanticCache
+from Graph.cache_engine import LRUTTLCache
 
 class MemoryManager:
     """
@@ -17,20 +19,25 @@ class MemoryManager:
     Handles caching, conversation memory, and performance optimization.
     """
     
-    def __init__(self, cache_ttl: int = 3600, max_cache_size: int = 1000):
+    def __init__(self, cache_ttl: int = 3600, max_cache_size: int = 1000,
+                 max_cache_bytes: int = 64 * 1024 * 1024):
         """
         Initialize memory manager.
         
         Args:
             cache_ttl: Time to live for cache entries in seconds (default: 1 hour)
             max_cache_size: Maximum number of cache entries to maintain
+            max_cache_bytes: Approximate memory budget per cache (default: 64 MB)
         """
         self.cache_ttl = cache_ttl
         self.max_cache_size = max_cache_size
+        self.max_cache_bytes = max_cache_bytes
         
-        # Initialize memory stores
-        self.query_cache: Dict[str, Dict[str, Any]] = {}
-        self.document_cache: Dict[str, Dict[str, Any]] = {}
+        # Initialize memory stores (LRU with TTL expiry and a byte budget)
+        self.query_cache = LRUTTLCache(max_cache_size, max_cache_bytes, cache_ttl)
+        self.document_cache = LRUTTLCache(max_cache_size, max_cache_bytes, cache_ttl)
+        # Similarity index over query embeddings, pointing at document_cache keys
+        self.document_index = SemanticCache(capacity=max_cache_size, ttl=cache_ttl)
         self.routing_patterns: Dict[str, Dict[str, Any]] = {}
         self.conversation_history: List[Dict[str, Any]] = []
         self.performance_metrics: Dict[str, List[float]] = {
@@ -51,6 +58,24 @@ class MemoryManager:
             'common_query_types': [],
             'response_format_preference': 'structured'
         }
+
+    def __setstate__(self, state: Dict[str, Any]):
+        """Restore pickled sessions, adding structures introduced after they were saved."""
+        self.__dict__.update(state)
+        if 'max_cache_bytes' not in state:
+            self.max_cache_bytes = 64 * 1024 * 1024
+        if 'document_index' not in state:
+            self.document_index = SemanticCache(capacity=self.max_cache_size, ttl=self.cache_ttl)
+            self.document_cache = {}
+        if not isinstance(self.query_cache, LRUTTLCache):
+            old_entries = self.query_cache
+            self.query_cache = LRUTTLCache(self.max_cache_size, self.max_cache_bytes, self.cache_ttl)
+            for key, entry in sorted(old_entries.items(), key=lambda item: item[1].get('timestamp', 0)):
+                remaining = self.cache_ttl - (time.time() - entry.get('timestamp', 0))
+                if remaining > 0:
+                    self.query_cache.put(key, entry, ttl=remaining)
+        if not isinstance(self.document_cache, LRUTTLCache):
+            self.document_cache = LRUTTLCache(self.max_cache_size, self.max_cache_bytes, self.cache_ttl)
         
     def generate_cache_key(self, query: str, context: Optional[Dict] = None) -> str:
         """Generate a unique cache key for queries."""
@@ -65,94 +90,78 @@ class MemoryManager:
     
     def cleanup_expired_cache(self):
         """Remove expired cache entries."""
-        current_time = time.time()
-        
-        # Clean query cache
-        expired_keys = [
-            key for key, value in self.query_cache.items()
-            if not self.is_cache_valid(value.get('timestamp', 0))
-        ]
-        for key in expired_keys:
-            del self.query_cache[key]
-            
-        # Clean document cache
-        expired_keys = [
-            key for key, value in self.document_cache.items()
-            if not self.is_cache_valid(value.get('timestamp', 0))
-        ]
-        for key in expired_keys:
-            del self.document_cache[key]
+        self.query_cache.purge_expired()
+        self.document_cache.purge_expired()
+        self.document_index.remove_expired()
     
     def cache_query_result(self, query: str, result: Dict[str, Any], 
                           context: Optional[Dict] = None, quality_score: float = 0.0):
         """Cache query results for faster future responses."""
         cache_key = self.generate_cache_key(query, context)
         
-        self.query_cache[cache_key] = {
+        # The cache evicts least recently used entries past max_cache_size or the byte budget
+        self.query_cache.put(cache_key, {
             'query': query,
             'result': result,
             'context': context,
             'timestamp': time.time(),
             'quality_score': quality_score,
             'access_count': 1
-        }
-        
-        # Maintain cache size limit
-        if len(self.query_cache) > self.max_cache_size:
-            # Remove oldest entries
-            sorted_items = sorted(
-                self.query_cache.items(),
-                key=lambda x: x[1]['timestamp']
-            )
-            for key, _ in sorted_items[:len(sorted_items) - self.max_cache_size]:
-                del self.query_cache[key]
+        })
     
     def get_cached_query_result(self, query: str, context: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
         """Retrieve cached query result if available and valid."""
         cache_key = self.generate_cache_key(query, context)
         self.cache_stats['total_requests'] += 1
         
-        if cache_key in self.query_cache:
-            cached_entry = self.query_cache[cache_key]
-            if self.is_cache_valid(cached_entry['timestamp']):
-                # Update access count and timestamp
-                cached_entry['access_count'] += 1
-                cached_entry['last_accessed'] = time.time()
-                self.cache_stats['cache_hits'] += 1
-                print(f"CACHE HIT for query: {query[:50]}...")
-                return cached_entry['result']
-            else:
-                # Remove expired entry
-                del self.query_cache[cache_key]
+        # Expired entries are dropped by the cache on lookup
+        cached_entry = self.query_cache.get(cache_key)
+        if cached_entry is not None:
+            # Update access count and timestamp
+            cached_entry['access_count'] += 1
+            cached_entry['last_accessed'] = time.time()
+            self.cache_stats['cache_hits'] += 1
+            print(f"CACHE HIT for query: {query[:50]}...")
+            return cached_entry['result']
         
         self.cache_stats['cache_misses'] += 1
         print(f"CACHE MISS for query: {query[:50]}...")
         return None
     
+    def _document_cache_key(self, query_embedding: List[float], collection_type: str) -> str:
+        """Cache key for a query embedding within one collection."""
+        embedding_bytes = np.asarray(query_embedding, dtype=np.float32).tobytes()
+        return hashlib.md5(collection_type.encode() + b":" + embedding_bytes).hexdigest()
+
     def cache_document_retrieval(self, query_embedding: List[float], documents: List[Any], 
                                scores: List[float], collection_type: str = "text"):
         """Cache document retrieval results."""
-        # Create a hash of the embedding for caching
-        embedding_hash = hashlib.md5(str(query_embedding).encode()).hexdigest()
+        cache_key = self._document_cache_key(query_embedding, collection_type)
         
-        self.document_cache[embedding_hash] = {
+        self.document_cache.put(cache_key, {
             'documents': documents,
             'scores': scores,
             'collection_type': collection_type,
             'timestamp': time.time()
-        }
+        })
+        self.document_index.put(query_embedding, cache_key, collection_type)
     
     def get_cached_documents(self, query_embedding: List[float], 
-                           similarity_threshold: float = 0.95) -> Optional[Dict[str, Any]]:
-        """Retrieve cached documents if query embedding is similar enough."""
-        embedding_hash = hashlib.md5(str(query_embedding).encode()).hexdigest()
-        
-        if embedding_hash in self.document_cache:
-            cached_entry = self.document_cache[embedding_hash]
-            if self.is_cache_valid(cached_entry['timestamp']):
-                return cached_entry
-        
-        # TODO: Implement similarity-based retrieval for similar embeddings
+                           similarity_threshold: float = 0.95,
+                           collection_type: str = "text") -> Optional[Dict[str, Any]]:
+        """
+        Retrieve cached documents if a cached query embedding for the collection
+        has cosine similarity of at least similarity_threshold.
+        """
+        match = self.document_index.get(query_embedding, collection_type, similarity_threshold)
+        if not match:
+            return None
+
+        cache_key, similarity = match
+        cached_entry = self.document_cache.get(cache_key)
+        if cached_entry is not None:
+            print(f"DOCUMENT CACHE HIT ({collection_type}, similarity {similarity:.3f})")
+            return {**cached_entry, 'similarity': similarity}
         return None
     
     def learn_routing_pattern(self, query: str, routing_decision: str, 
@@ -263,6 +272,8 @@ class MemoryManager:
             'cache_hit_rate': self._calculate_cache_hit_rate(),
             'average_response_time': np.mean(self.performance_metrics['response_times']) if self.performance_metrics['response_times'] else 0,
             'cache_size': len(self.query_cache),
+            'query_cache_stats': self.query_cache.get_stats(),
+            'document_cache_stats': self.document_cache.get_stats(),
             'routing_patterns_learned': len(self.routing_patterns),
             'conversation_length': len(self.conversation_history)
         }
@@ -0,0 +1,151 @@
+"""
+Near-duplicate collapse for retrieved chunks, run before grading.
+
+Ingestion splits with chunk_overlap=100, and the text and image collections
+often return overlapping content from the same page, so the grader used to see
+the same text several times. Chunks are fingerprinted with a 64-bit SimHash
+over word shingles; near-identical ones are collapsed to the best-scored copy,
+and chunks of the same source_file/page_num that overlap are stitched into one.
+"""
+
+import os
+import re
+import hashlib
+from typing import Any, List, Optional, Tuple
+
+from load_vector_dbs.load_dbs import SCORE_METADATA_KEY
+
+NEAR_DUPLICATES_ENABLED = os.getenv("NEAR_DUPLICATES", "true").lower() in ("1", "true", "yes")
+# SimHash bits that may differ for two chunks to count as duplicates
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", "3"))
+# Shortest shared text for two chunks of one page to be stitched together
+CHUNK_MERGE_MIN_OVERLAP = int(os.getenv("CHUNK_MERGE_MIN_OVERLAP", "50"))
+SHINGLE_SIZE = 3
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> List[str]:
+    """Overlapping word n-grams of the lower-cased text."""
+    words = WORD_PATTERN.findall((text or "").lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the text's shingles."""
+    weights = [0] * 64
+    for shingle in shingles(text):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def page_key(document: Any) -> Optional[Tuple[Any, Any]]:
+    """(source, page) a chunk comes from, or None if unknown."""
+    metadata = getattr(document, "metadata", None) or {}
+    source = metadata.get("source_file") or metadata.get("company")
+    page = metadata.get("page_num")
+    if source is None or page is None:
+        return None
+    return source, page
+
+
+def stitch(first: str, second: str, min_overlap: int = CHUNK_MERGE_MIN_OVERLAP) -> Optional[str]:
+    """
+    Join two texts where the end of one repeats the start of the other
+    (or one contains the other).
+
+    Returns:
+        str: The joined text, or None if they do not overlap
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for left, right in ((first, second), (second, first)):
+        if len(right) < min_overlap:
+            continue
+        start = left.find(right[:min_overlap])
+        while start != -1:
+            if right.startswith(left[start:]):
+                return left[:start] + right
+            start = left.find(right[:min_overlap], start + 1)
+    return None
+
+
+def _score(document: Any) -> float:
+    score = (getattr(document, "metadata", None) or {}).get(SCORE_METADATA_KEY)
+    return score if score is not None else float("-inf")
+
+
+def merged_metadata(best: Any, first: Any, second: Any) -> dict:
+    """
+    Metadata for a stitched chunk: the better-scored part's, with a composite
+    "merge:<id1>+<id2>" point ID so grade caching and MMR vectors keyed by
+    point ID never treat the merged text as either original chunk.
+    """
+    metadata = dict(getattr(best, "metadata", None) or {})
+    ids = [(getattr(part, "metadata", None) or {}).get("_id") for part in (first, second)]
+    if all(point_id is not None for point_id in ids):
+        metadata["_id"] = "merge:" + "+".join(str(point_id) for point_id in ids)
+    else:
+        metadata.pop("_id", None)  # content-hash fallback
+    return metadata
+
+
+def collapse_near_duplicates(documents: List[Any], max_distance: int = NEAR_DUPLICATE_DISTANCE,
+                             min_overlap: int = CHUNK_MERGE_MIN_OVERLAP) -> List[Any]:
+    """
+    Drop near-duplicate chunks and merge overlapping chunks of the same page.
+
+    The best-scored copy of a duplicate is kept, in the position of the first
+    copy. A merged chunk keeps the metadata of its best-scored part.
+
+    Args:
+        documents: Retrieved documents
+        max_distance: SimHash bits that may differ between duplicates
+        min_overlap: Shortest shared text for stitching same-page chunks
+
+    Returns:
+        list: The collapsed documents
+    """
+    if not NEAR_DUPLICATES_ENABLED or len(documents) < 2:
+        return documents
+
+    kept: List[Any] = []
+    fingerprints: List[int] = []
+    duplicates = 0
+    merged = 0
+    for document in documents:
+        fingerprint = simhash(document.page_content)
+        key = page_key(document)
+        for index, other in enumerate(kept):
+            if hamming_distance(fingerprint, fingerprints[index]) <= max_distance:
+                duplicates += 1
+                if _score(document) > _score(other):
+                    kept[index], fingerprints[index] = document, fingerprint
+                break
+            if key is not None and key == page_key(other):
+                text = stitch(other.page_content, document.page_content, min_overlap)
+                if text is not None:
+                    merged += 1
+                    best = document if _score(document) > _score(other) else other
+                    kept[index] = best.model_copy(update={"page_content": text,
+                                                          "metadata": merged_metadata(best, other, document)})
+                    fingerprints[index] = simhash(text)
+                    break
+        else:
+            kept.append(document)
+            fingerprints.append(fingerprint)
+
+    if duplicates or merged:
+        print(f"COLLAPSED {len(documents)} DOCUMENTS TO {len(kept)} "
+              f"({duplicates} near-duplicates, {merged} overlapping chunks merged)")
+    return kept
@@ -1,32 +1,46 @@
 "This module contains all info about about the nodes in the graph"
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from langchain_core.documents import Document
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
 from langchain_core.messages import AIMessage
-from langchain_tavily import TavilySearch
-from load_vector_dbs.prompts_and_chains import (get_retrival_grader_chain, get_rag_chain,
-                                                          get_company_name, get_question_rewriter_chain,
-                                                          get_cross_reference_analyzer_chain,
-                                                          get_document_summary_strategy_chain,
-                                                          get_enhanced_rag_chain_with_citations)
-from load_vector_dbs.load_dbs import load_vector_database
+from load_vector_dbs.llm_registry import global_llm_registry
+from load_vector_dbs.load_dbs import load_vector_database, RetrievalResult
+from Graph.grade_filter import global_grade_calibrator, pre_grade_documents, calibration_samples, SCORE_METADATA_KEY
+from Graph.grade_cache import global_grade_cache
+from Graph.company_matcher import global_company_matcher
+from Graph.retrieval_filters import extract_retrieval_constraints, constraints_cache_scope
+from Graph.context_packer import pack_context, pack_document_sources
+from Graph.near_duplicates import collapse_near_duplicates
+from Graph.web_search_service import global_web_search_service
+from Graph.reranker import global_reranker, candidate_pool_size, document_group, RERANK_TOP_N, RERANK_FAST_MODE
+from Graph.query_planner import (start_query_planning, astart_query_planning, get_query_plan,
+                                 aget_query_plan, decide_summary_strategy, global_query_plan_cache)
 load_dotenv()
 
-def extract_multiple_companies_from_question(question, llm=None):
+# Maximum number of documents graded by the LLM at the same time
+GRADING_MAX_CONCURRENCY = int(os.getenv("GRADING_MAX_CONCURRENCY", "8"))
+
+# Model used by the retrieval grader (part of the grade cache key)
+GRADER_MODEL = os.getenv("GRADER_MODEL", "gpt-4o")
+
+# Documents fetched per collection; a larger pool when the reranker chooses from it
+ROUTER_SEARCH_LIMIT = candidate_pool_size(5)
+RETRIEVAL_K = candidate_pool_size(4)
+
+def extract_multiple_companies_from_question(question, use_llm=True, state=None):
     """
     Extract multiple companies from the question for cross-referencing scenarios.
-    Uses LLM-based extraction for more accurate company identification.
+    Uses the question's query plan for more accurate company identification.
     """
     try:
-        if llm:
-            from load_vector_dbs.prompts_and_chains import get_multi_company_extractor_chain
+        if use_llm:
+            # Companies come from the (usually cached) structured query plan
+            extraction_result = get_query_plan(state or {}, question)
             
-            # Use structured LLM extraction
-            extractor_chain = get_multi_company_extractor_chain(llm)
-            extraction_result = extractor_chain.invoke({"question": question})
-            
-            print(f"Extracted companies: {extraction_result.companies}, Primary: {extraction_result.primary_company}, Is comparison: {extraction_result.is_comparison}")
+            print(f"Extracted companies: {extraction_result.companies}, Primary: {extraction_result.company}, Is comparison: {extraction_result.is_comparison}")
             
             return extraction_result.companies
         
@@ -34,58 +48,296 @@ def extract_multiple_companies_from_question(question, llm=None):
         print(f"Error in LLM-based company extraction: {e}")
     
     # Fallback to keyword matching
-    company_mappings = {
-        "amazon": ["amazon", "amzn", "amazon.com"],
-        "berkshire": ["berkshire", "berkshire hathaway", "brk"],
-        "google": ["google", "alphabet", "googl", "goog"],
-        "Jhonson and Jhonosn": ["johnson", "jnj", "johnson & johnson", "johnson and johnson"],
-        "jp morgan": ["jp morgan", "jpmorgan", "jpmc", "chase", "jpm"],
-        "meta": ["meta", "facebook", "fb", "meta platforms"],
-        "microsoft": ["microsoft", "msft", "ms"],
-        "nvidia": ["nvidia", "nvda"],
-        "tesla": ["tesla", "tsla"],
-        "visa": ["visa", "v"],
-        "walmart": ["walmart", "wmt"],
-        "pfizer": ["pfizer", "pfe"]
-    }
-    
-    question_lower = question.lower()
-    detected_companies = []
-    
-    for standard_name, variations in company_mappings.items():
-        for variation in variations:
-            if variation in question_lower:
-                if standard_name not in detected_companies:
-                    detected_companies.append(standard_name)
-                break
-    
-    # Also look for comparison keywords to determine if cross-referencing is likely
-    comparison_keywords = ["compare", "versus", "vs", "against", "with", "between", "and"]
-    has_comparison = any(keyword in question_lower for keyword in comparison_keywords)
-    
-    # If we found multiple companies or comparison keywords, return detected companies
-    if len(detected_companies) > 1 or (len(detected_companies) >= 1 and has_comparison):
-        return detected_companies
-    
-    # If only one company detected but no comparison context, still return it
-    return detected_companies
+    return match_companies_by_keyword(question)
+
+
+async def aextract_multiple_companies_from_question(question, use_llm=True, state=None):
+    """
+    Async version of extract_multiple_companies_from_question.
+    """
+    try:
+        if use_llm:
+            extraction_result = await aget_query_plan(state or {}, question)
+
+            print(f"Extracted companies: {extraction_result.companies}, Primary: {extraction_result.company}, Is comparison: {extraction_result.is_comparison}")
+
+            return extraction_result.companies
+
+    except Exception as e:
+        print(f"Error in LLM-based company extraction: {e}")
+
+    return match_companies_by_keyword(question)
+
+
+def match_companies_by_keyword(question):
+    """
+    Detect companies in the question by name, ticker and alias keywords
+    (word-boundary matching, see Graph/company_matcher.py).
+    """
+    return global_company_matcher.match(question)
+
+
+def get_question_embedding(state, question):
+    """
+    Get the embedding for the question, reusing the vector cached in
+    state["context_embeddings"] when it was computed for the same question text.
+
+    Args:
+        state (dict): The current graph state
+        question (str): The question to embed
+
+    Returns:
+        tuple: (embedding, context_embeddings) where context_embeddings is the
+        state entry for the question (the existing one on a cache hit)
+    """
+    cached = state.get("context_embeddings") or {}
+    if cached.get("question") == question and cached.get("embedding"):
+        return cached["embedding"], cached
+
+    init = load_vector_database()
+    embedding = init.embeddings.embed_query(question)
+    print(f"EMBEDDED QUESTION (dimension {len(embedding)})")
+    return embedding, {"question": question, "embedding": embedding}
+
+
+async def aget_question_embedding(state, question):
+    """
+    Async version of get_question_embedding.
+    """
+    cached = state.get("context_embeddings") or {}
+    if cached.get("question") == question and cached.get("embedding"):
+        return cached["embedding"], cached
+
+    init = load_vector_database()
+    embedding = await init.embeddings.aembed_query(question)
+    print(f"EMBEDDED QUESTION (dimension {len(embedding)})")
+    return embedding, {"question": question, "embedding": embedding}
+
+
+def get_router_results(state, question):
+    """
+    Search the text and image collections once for the question, so the router
+    can score them and the retrieval nodes can reuse the points.
+
+    Args:
+        state (dict): The current graph state
+        question (str): The question being routed
+
+    Returns:
+        dict: RetrievalResult for "text" and "image"
+    """
+    query_embedding, _ = get_question_embedding(state, question)
+    init = load_vector_database()
+    constraints = extract_retrieval_constraints(question)
+    cache_scope = constraints_cache_scope(constraints)
+
+    cached_results = get_cached_router_results(state, question, query_embedding, init, cache_scope)
+    if cached_results is not None:
+        return cached_results
+
+    # Qdrant similarity search for the top text and image docs, run concurrently,
+    # filtered to the companies/years/files named in the question
+    router_results = init.search_for_question(question, query_embedding, limit=ROUTER_SEARCH_LIMIT,
+                                              constraints=constraints)
+    print(f"Text and image search completed for collections: "
+          f"{init.text_vector_db_path}, {init.image_vector_db_path}")
+
+    cache_router_results(query_embedding, router_results, cache_scope)
+    return router_results
+
+
+async def aget_router_results(state, question):
+    """
+    Async version of get_router_results.
+    """
+    query_embedding, _ = await aget_question_embedding(state, question)
+    init = load_vector_database()
+    # May read the payload catalog from Qdrant; keep it off the event loop
+    constraints = await asyncio.to_thread(extract_retrieval_constraints, question)
+    cache_scope = constraints_cache_scope(constraints)
+
+    cached_results = get_cached_router_results(state, question, query_embedding, init, cache_scope)
+    if cached_results is not None:
+        return cached_results
+
+    router_results = await init.asearch_for_question(question, query_embedding, limit=ROUTER_SEARCH_LIMIT,
+                                                     constraints=constraints)
+    print(f"Text and image search completed for collections: "
+          f"{init.text_vector_db_path}, {init.image_vector_db_path}")
+
+    cache_router_results(query_embedding, router_results, cache_scope)
+    return router_results
+
+
+def get_cached_router_results(state, question, query_embedding, init, cache_scope=""):
+    """
+    Serve near-duplicate questions from the semantic document cache.
+
+    Args:
+        cache_scope: Suffix for questions with the same retrieval constraints
+
+    Returns:
+        dict: RetrievalResult for "text" and "image", or None on a miss
+    """
+    from Graph.memory_manager import global_memory_manager
+
+    cached_text = global_memory_manager.get_cached_documents(query_embedding, collection_type="text" + cache_scope)
+    cached_images = global_memory_manager.get_cached_documents(query_embedding, collection_type="image" + cache_scope)
+    if cached_text and cached_images:
+        print(f"---USING CACHED DOCUMENT RESULTS (similarity {cached_text['similarity']:.3f})---")
+        if state.get('performance_metrics'):
+            state['performance_metrics']['cache_hits'] += 1
+        return {
+            "text": RetrievalResult(question, init.text_vector_db_path, cached_text.get('documents', []), ROUTER_SEARCH_LIMIT),
+            "image": RetrievalResult(question, init.image_vector_db_path, cached_images.get('documents', []), ROUTER_SEARCH_LIMIT)
+        }
+    return None
+
+
+def cache_router_results(query_embedding, router_results, cache_scope=""):
+    """Store fresh router search results in the semantic document cache."""
+    from Graph.memory_manager import global_memory_manager
+
+    for collection_type, router_result in router_results.items():
+        if router_result.scores:
+            global_memory_manager.cache_document_retrieval(
+                query_embedding, router_result.points, router_result.scores, collection_type + cache_scope
+            )
+
+
+def get_reusable_router_result(state, source, question):
+    """
+    Get the router's search result for a source ("text" or "image") if it was
+    computed for the current question text, otherwise None.
+    """
+    result = (state.get("router_results") or {}).get(source)
+    if result is not None and result.question == question:
+        return result
+    return None
+
+
+def context_packing_inputs(state):
+    """
+    Query vector and Qdrant point vectors already in the state, used by the
+    context packer for MMR so generation does not re-embed retrieved chunks.
+
+    Returns:
+        tuple: (query_vector or None, {(collection, point id): vector})
+    """
+    query_vector = (state.get("context_embeddings") or {}).get("embedding")
+    known_vectors = {}
+    for router_result in (state.get("router_results") or {}).values():
+        known_vectors.update(router_result.vectors)
+    return query_vector, known_vectors
+
+
+def prepare_question(state):
+    """
+    Embed the incoming question once and run the routing searches, so routing
+    and retrieval share both the vector and the Qdrant results.
+
+    The query planner is started first and runs while the searches are in
+    flight (see Graph/speculative.py).
+    """
+    print("---PREPARE QUESTION---")
+    messages = state["messages"]
+    question = messages[-1].content
+
+    result = {"speculative_tasks": start_query_planning(question)}
+    try:
+        _, result["context_embeddings"] = get_question_embedding(state, question)
+    except Exception as e:
+        # Routing and retrieval embed on their own if this fails
+        print(f"Question embedding failed, continuing without cached vector: {e}")
+        return result
+
+    try:
+        result["router_results"] = get_router_results(
+            {**state, "context_embeddings": result["context_embeddings"]}, question
+        )
+    except Exception as e:
+        print(f"Routing search failed, router will retry: {e}")
+
+    return result
+
+
+async def aprepare_question(state):
+    """
+    Async version of prepare_question.
+    """
+    print("---PREPARE QUESTION---")
+    messages = state["messages"]
+    question = messages[-1].content
+
+    result = {"speculative_tasks": astart_query_planning(question)}
+    try:
+        _, result["context_embeddings"] = await aget_question_embedding(state, question)
+    except Exception as e:
+        print(f"Question embedding failed, continuing without cached vector: {e}")
+        return result
+
+    try:
+        result["router_results"] = await aget_router_results(
+            {**state, "context_embeddings": result["context_embeddings"]}, question
+        )
+    except Exception as e:
+        print(f"Routing search failed, router will retry: {e}")
+
+    return result
+
+
 def retrieve(state):
     print("---RETRIEVE---")
     messages = state["messages"]
     question = messages[-1].content
 
-    init = load_vector_database()
-    retriever, _, _ = init.get_text_retriever()
-    documents = retriever.invoke(question)
+    query_embedding, context_embeddings = get_question_embedding(state, question)
+
+    router_result = get_reusable_router_result(state, "text", question)
+    if router_result is not None:
+        print("---REUSING ROUTER TEXT SEARCH RESULTS---")
+        documents = router_result.to_documents(k=RETRIEVAL_K)
+    else:
+        init = load_vector_database()
+        documents = init.search_collection(question, query_embedding, init.text_vector_db_path, k=RETRIEVAL_K,
+                                           constraints=extract_retrieval_constraints(question))
+
+    return text_retrieval_result(state, documents, context_embeddings)
 
+
+async def aretrieve(state):
+    """
+    Async version of retrieve.
+    """
+    print("---RETRIEVE---")
+    messages = state["messages"]
+    question = messages[-1].content
+
+    query_embedding, context_embeddings = await aget_question_embedding(state, question)
+
+    router_result = get_reusable_router_result(state, "text", question)
+    if router_result is not None:
+        print("---REUSING ROUTER TEXT SEARCH RESULTS---")
+        documents = router_result.to_documents(k=RETRIEVAL_K)
+    else:
+        init = load_vector_database()
+        constraints = await asyncio.to_thread(extract_retrieval_constraints, question)
+        documents = await init.asearch_collection(question, query_embedding, init.text_vector_db_path, k=RETRIEVAL_K,
+                                                  constraints=constraints)
+
+    return text_retrieval_result(state, documents, context_embeddings)
+
+
+def text_retrieval_result(state, documents, context_embeddings):
     tool_call_entry = {
         "tool": "text_retriever"
     }
 
     print(f"DOCUMENTS RETRIEVED AND NUMBER OF DOCUMENTS ARE {len(documents)}")
     return {
-        "documents": documents,
+        "text_documents": documents,
         "vectorstore_searched": True,
+        "context_embeddings": context_embeddings,
         "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
     }
 
@@ -94,58 +346,187 @@ def retrieve_from_images_data(state):
     print("---RETRIEVE FROM IMAGES---")
     messages = state["messages"]
     question = messages[-1].content
-    documents = state["documents"]
 
-    init = load_vector_database()
-    _, image_retriever, _ = init.get_image_retriever()
-    results = image_retriever.invoke(question)
+    router_result = get_reusable_router_result(state, "image", question)
+    if router_result is not None:
+        print("---REUSING ROUTER IMAGE SEARCH RESULTS---")
+    else:
+        query_embedding, _ = get_question_embedding(state, question)
+        init = load_vector_database()
+        router_result, = init.search_collections(question, query_embedding, [init.image_vector_db_path], limit=RETRIEVAL_K,
+                                                 constraints=extract_retrieval_constraints(question))
+    results = router_result.to_documents(k=RETRIEVAL_K)
 
     # Check if we need cross-referencing (multiple companies)
     cross_ref_analysis = state.get("cross_reference_analysis", {})
     needs_cross_reference = cross_ref_analysis.get("needs_cross_reference", "no")
     
-    if needs_cross_reference == "yes":
+    if is_company_filtered(router_result):
+        print("---IMAGES ALREADY FILTERED BY COMPANY IN QDRANT---")
+        filtered_results = results
+    elif needs_cross_reference == "yes":
         print("---CROSS-REFERENCING MODE: RETRIEVING IMAGES FROM MULTIPLE SOURCES---")
         # For cross-referencing, we want images from all relevant companies
         # Extract multiple companies from the question
-        llm = ChatOpenAI(model="gpt-4o-mini")
-        companies_in_question = extract_multiple_companies_from_question(question, llm)
-        
-        if companies_in_question:
-            print(f"DETECTED COMPANIES FOR CROSS-REFERENCING: {companies_in_question}")
-            # Filter results to include images from all detected companies
-            filtered_results = [
-                doc for doc in results
-                if any(company.lower() in doc.metadata.get("company", "").lower() 
-                      for company in companies_in_question)
-            ]
-        else:
-            # If no specific companies detected, use top relevant images regardless of company
-            print("NO SPECIFIC COMPANIES DETECTED, USING TOP RELEVANT IMAGES")
-            filtered_results = results[:6]  # Get more images for cross-referencing
+        companies_in_question = extract_multiple_companies_from_question(question, state=state)
+        filtered_results = filter_images_for_companies(results, companies_in_question)
     else:
         print("---SINGLE COMPANY MODE: FILTERING TO PRIMARY COMPANY---")
         # Original single-company filtering logic
-        llm = ChatOpenAI(model="gpt-4o-mini")
-        company_extractor = get_company_name(llm)
-        company = company_extractor.invoke({"question": question})
+        company = get_query_plan(state, question).company
+        print(f"PRIMARY COMPANY: {company}")
+        filtered_results = filter_images_for_company(results, company)
+
+    return image_retrieval_result(state, filtered_results)
+
+
+async def aretrieve_from_images_data(state):
+    """
+    Async version of retrieve_from_images_data.
+    """
+    print("---RETRIEVE FROM IMAGES---")
+    messages = state["messages"]
+    question = messages[-1].content
+
+    router_result = get_reusable_router_result(state, "image", question)
+    if router_result is not None:
+        print("---REUSING ROUTER IMAGE SEARCH RESULTS---")
+    else:
+        query_embedding, _ = await aget_question_embedding(state, question)
+        init = load_vector_database()
+        constraints = await asyncio.to_thread(extract_retrieval_constraints, question)
+        router_result, = await init.asearch_collections(question, query_embedding, [init.image_vector_db_path],
+                                                        limit=RETRIEVAL_K, constraints=constraints)
+    results = router_result.to_documents(k=RETRIEVAL_K)
+
+    cross_ref_analysis = state.get("cross_reference_analysis", {})
+    if is_company_filtered(router_result):
+        print("---IMAGES ALREADY FILTERED BY COMPANY IN QDRANT---")
+        filtered_results = results
+    elif cross_ref_analysis.get("needs_cross_reference", "no") == "yes":
+        print("---CROSS-REFERENCING MODE: RETRIEVING IMAGES FROM MULTIPLE SOURCES---")
+        companies_in_question = await aextract_multiple_companies_from_question(question, state=state)
+        filtered_results = filter_images_for_companies(results, companies_in_question)
+    else:
+        print("---SINGLE COMPANY MODE: FILTERING TO PRIMARY COMPANY---")
+        company = (await aget_query_plan(state, question)).company
         print(f"PRIMARY COMPANY: {company}")
+        filtered_results = filter_images_for_company(results, company)
+
+    return image_retrieval_result(state, filtered_results)
 
-        filtered_results = [
+
+def is_company_filtered(retrieval_result):
+    """Whether the search was already restricted to the question's companies in Qdrant."""
+    return "company" in (retrieval_result.constraints or {})
+
+
+def filter_images_for_companies(results, companies_in_question):
+    """Keep images from any of the companies in a cross-referencing question."""
+    if companies_in_question:
+        print(f"DETECTED COMPANIES FOR CROSS-REFERENCING: {companies_in_question}")
+        # Filter results to include images from all detected companies
+        return [
             doc for doc in results
-            if doc.metadata.get("company", "").lower() in company.company.lower()
+            if any(company.lower() in doc.metadata.get("company", "").lower() 
+                  for company in companies_in_question)
         ]
+    # If no specific companies detected, use top relevant images regardless of company
+    print("NO SPECIFIC COMPANIES DETECTED, USING TOP RELEVANT IMAGES")
+    return results[:6]  # Get more images for cross-referencing
 
-    if filtered_results:
-        documents.extend(filtered_results)
 
+def filter_images_for_company(results, company):
+    """Keep images from the question's primary company."""
+    return [
+        doc for doc in results
+        if doc.metadata.get("company", "").lower() in company.lower()
+    ]
+
+
+def image_retrieval_result(state, filtered_results):
     tool_call_entry = {
         "tool": "image_retriever"
     }
 
-    print(f"UPDATED DOCUMENTS LENGTH: {len(documents)} (Added {len(filtered_results)} images)")
+    print(f"IMAGE DOCUMENTS RETRIEVED: {len(filtered_results)}")
     return {
-        "documents": documents,
+        "image_documents": filtered_results,
+        "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
+    }
+
+
+def merge_retrieved_documents(state):
+    """
+    Join the text and image retrieval branches into the documents list,
+    collapsing near-duplicate and overlapping chunks before they are graded.
+    """
+    print("---MERGE RETRIEVED DOCUMENTS---")
+    text_documents = state.get("text_documents") or []
+    image_documents = state.get("image_documents") or []
+    documents = collapse_near_duplicates(list(text_documents) + list(image_documents))
+
+    print(f"UPDATED DOCUMENTS LENGTH: {len(documents)} (Added {len(image_documents)} images)")
+    return {
+        "documents": documents
+    }
+
+
+def rerank_documents(state):
+    """
+    Order the retrieved candidates with the local reranker and keep the
+    top-N for grading (top-N per company when the question compares companies).
+    """
+    print("---RERANK DOCUMENTS---")
+    question = state["messages"][-1].content
+    documents = state.get("documents") or []
+    if global_reranker is None:
+        return {"documents": documents}
+
+    needs_cross_reference = (state.get("cross_reference_analysis") or {}).get("needs_cross_reference") \
+        or get_query_plan(state, question).needs_cross_reference
+    group_by = document_group if needs_cross_reference == "yes" else None
+
+    rerank_start = time.time()
+    reranked = global_reranker.rerank(question, documents, top_n=RERANK_TOP_N, group_by=group_by)
+    rerank_time = time.time() - rerank_start
+    return rerank_result(state, documents, reranked, rerank_time, group_by)
+
+
+async def arerank_documents(state):
+    """
+    Async version of rerank_documents; the model runs in a worker thread.
+    """
+    print("---RERANK DOCUMENTS---")
+    question = state["messages"][-1].content
+    documents = state.get("documents") or []
+    if global_reranker is None:
+        return {"documents": documents}
+
+    needs_cross_reference = (state.get("cross_reference_analysis") or {}).get("needs_cross_reference") \
+        or (await aget_query_plan(state, question)).needs_cross_reference
+    group_by = document_group if needs_cross_reference == "yes" else None
+
+    rerank_start = time.time()
+    reranked = await asyncio.to_thread(global_reranker.rerank, question, documents, RERANK_TOP_N, group_by)
+    rerank_time = time.time() - rerank_start
+    return rerank_result(state, documents, reranked, rerank_time, group_by)
+
+
+def rerank_result(state, documents, reranked, rerank_time, group_by=None):
+    tool_call_entry = {
+        "tool": "reranker",
+        "reranker": global_reranker.name,
+        "candidates": len(documents),
+        "kept": len(reranked),
+        "per_company": group_by is not None,
+        "rerank_time": round(rerank_time, 3)
+    }
+
+    scope = "PER COMPANY" if group_by is not None else "OVERALL"
+    print(f"RERANKED {len(documents)} CANDIDATES, KEPT TOP {RERANK_TOP_N} {scope} ({len(reranked)}) IN {rerank_time:.2f}s")
+    return {
+        "documents": reranked,
         "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
     }
 
@@ -166,23 +547,108 @@ def generate(state):
     else:
         print("---USING STANDARD GENERATION---")
         # Use standard generation for simple queries
-        llm = ChatOpenAI(model="gpt-4o-mini")
-        rag_chain = get_rag_chain(llm)
+        query_vector, known_vectors = context_packing_inputs(state)
+        context = pack_context(documents, query_vector, known_vectors)
+        rag_chain = global_llm_registry.get_chain("rag")
         Intermediate_message = rag_chain.invoke(
-            {"documents": documents, "question": question}
+            {"documents": context, "question": question}
         )
+        return rag_generation_result(state, Intermediate_message)
 
-        retry_count = state.get("retry_count", 0)
 
-        tool_call_entry = {
-            "tool": "rag_chain"
-        }
+async def agenerate(state):
+    """
+    Async version of generate.
+    """
+    print("---GENERATE---")
+    messages = state["messages"]
+    question = messages[-1].content
+    documents = state["documents"]
 
-        return {
-            "Intermediate_message": Intermediate_message,
-            "retry_count": retry_count + 1,
-            "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
-        }
+    cross_ref_analysis = state.get("cross_reference_analysis", {})
+    if cross_ref_analysis.get("needs_cross_reference") == "yes":
+        print("---USING ENHANCED GENERATION WITH CROSS-REFERENCING---")
+        return await agenerate_with_cross_reference_and_citations(state)
+
+    print("---USING STANDARD GENERATION---")
+    query_vector, known_vectors = context_packing_inputs(state)
+    context = await asyncio.to_thread(pack_context, documents, query_vector, known_vectors)
+    rag_chain = global_llm_registry.get_chain("rag")
+    Intermediate_message = await rag_chain.ainvoke(
+        {"documents": context, "question": question}
+    )
+    return rag_generation_result(state, Intermediate_message)
+
+
+def rag_generation_result(state, Intermediate_message):
+    retry_count = state.get("retry_count", 0)
+
+    tool_call_entry = {
+        "tool": "rag_chain"
+    }
+
+    return {
+        "Intermediate_message": Intermediate_message,
+        "retry_count": retry_count + 1,
+        "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
+    }
+
+
+def grade_documents_concurrently(retrieval_grader, question, documents,
+                                 max_concurrency=GRADING_MAX_CONCURRENCY):
+    """
+    Grade documents with the LLM grader in parallel.
+
+    Args:
+        retrieval_grader: Chain returning a GradeDocuments result
+        question (str): The user question
+        documents (list): Documents to grade
+        max_concurrency (int): Maximum grader calls in flight
+
+    Returns:
+        list: One {"grade", "latency", "error"} dict per document, in input order.
+        "grade" is None when the grader call failed.
+    """
+    def grade_one(document):
+        start_time = time.time()
+        try:
+            score = global_grade_cache.coalesce(
+                question, document, GRADER_MODEL,
+                lambda: retrieval_grader.invoke({"question": question, "document": document.page_content})
+            )
+            return {"grade": score.binary_score, "latency": time.time() - start_time, "error": None}
+        except Exception as e:
+            return {"grade": None, "latency": time.time() - start_time, "error": str(e)}
+
+    if not documents:
+        return []
+
+    workers = max(1, min(max_concurrency, len(documents)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grader") as executor:
+        return list(executor.map(grade_one, documents))
+
+
+async def agrade_documents_concurrently(retrieval_grader, question, documents,
+                                        max_concurrency=GRADING_MAX_CONCURRENCY):
+    """
+    Async version of grade_documents_concurrently: grader calls share the
+    event loop, limited by a semaphore instead of a thread pool.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def grade_one(document):
+        async with semaphore:
+            start_time = time.time()
+            try:
+                score = await global_grade_cache.acoalesce(
+                    question, document, GRADER_MODEL,
+                    lambda: retrieval_grader.ainvoke({"question": question, "document": document.page_content})
+                )
+                return {"grade": score.binary_score, "latency": time.time() - start_time, "error": None}
+            except Exception as e:
+                return {"grade": None, "latency": time.time() - start_time, "error": str(e)}
+
+    return list(await asyncio.gather(*[grade_one(document) for document in documents]))
 
 
 def grade_documents(state):
@@ -190,25 +656,144 @@ def grade_documents(state):
     messages = state["messages"]
     question = messages[-1].content
     documents = state["documents"]
+
+    retrieval_grader = global_llm_registry.get_chain("retrieval_grader", model=GRADER_MODEL)
+    grading_plan = plan_document_grading(question, documents)
+
+    grading_start = time.time()
+    grading_results = grade_documents_concurrently(retrieval_grader, question, grading_plan["ambiguous_docs"])
+    grading_time = time.time() - grading_start
+
+    return document_grading_result(state, question, documents, grading_plan, grading_results, grading_time)
+
+
+async def agrade_documents(state):
+    """
+    Async version of grade_documents.
+    """
+    print("---CHECK DOCUMENT RELEVANCE---")
+    messages = state["messages"]
+    question = messages[-1].content
+    documents = state["documents"]
+
+    retrieval_grader = global_llm_registry.get_chain("retrieval_grader", model=GRADER_MODEL)
+    grading_plan = plan_document_grading(question, documents)
+
+    grading_start = time.time()
+    grading_results = await agrade_documents_concurrently(retrieval_grader, question, grading_plan["ambiguous_docs"])
+    grading_time = time.time() - grading_start
+
+    return document_grading_result(state, question, documents, grading_plan, grading_results, grading_time)
+
+
+def plan_document_grading(question, documents):
+    """
+    Decide which documents need the LLM grader.
+
+    Returns:
+        dict: cached_grades and score decisions (index -> grade), the score
+        decisions of the calibration samples, and the ambiguous documents
+        (with their indexes) left for the LLM
+    """
+    # Reuse grades from earlier requests (any session) for the same question and chunk
+    cached_grades = global_grade_cache.get_many(question, documents, GRADER_MODEL)
+    if cached_grades:
+        print(f"REUSED {len(cached_grades)} CACHED GRADES")
+    uncached_indexes = [i for i in range(len(documents)) if i not in cached_grades]
+
+    # Decide clear cases from the similarity score; only ambiguous docs go to the LLM
+    score_decisions, score_ambiguous = pre_grade_documents(
+        [documents[i] for i in uncached_indexes], global_grade_calibrator
+    )
+    decisions = {uncached_indexes[i]: grade for i, grade in score_decisions.items()}
+    ambiguous_indexes = [uncached_indexes[i] for i in score_ambiguous]
+    # A few clear cases still go to the LLM so the score cut-offs keep being checked
+    samples = calibration_samples(decisions)
+    calibration_decisions = {index: decisions.pop(index) for index in samples}
+    rerank_accepted = []
+    if RERANK_FAST_MODE and global_reranker is not None and ambiguous_indexes:
+        # Fast mode: the reranked top-N are accepted without the LLM grader
+        print(f"FAST MODE: ACCEPTED {len(ambiguous_indexes)} RERANKED DOCS WITHOUT LLM GRADING")
+        rerank_accepted, ambiguous_indexes = ambiguous_indexes, []
+    ambiguous_indexes = sorted(ambiguous_indexes + samples)
+    if samples:
+        print(f"SENT {len(samples)} SCORE-DECIDED DOCS TO THE LLM AS CALIBRATION SAMPLES")
+    if decisions:
+        print(f"PRE-GRADED {len(decisions)} DOCS BY SCORE "
+              f"(accepted: {sum(1 for g in decisions.values() if g == 'yes')}, "
+              f"rejected: {sum(1 for g in decisions.values() if g == 'no')})")
+
+    return {
+        "cached_grades": cached_grades,
+        "decisions": decisions,
+        "calibration_decisions": calibration_decisions,
+        "rerank_accepted": rerank_accepted,
+        "ambiguous_indexes": ambiguous_indexes,
+        "ambiguous_docs": [documents[i] for i in ambiguous_indexes]
+    }
+
+
+def document_grading_result(state, question, documents, grading_plan, grading_results, grading_time):
+    """
+    Combine cached, score-based and LLM grades into the filtered documents.
+    """
     cross_ref_analysis = state.get("cross_reference_analysis", {})
+    cached_grades = grading_plan["cached_grades"]
+    decisions = grading_plan["decisions"]
+    calibration_decisions = grading_plan["calibration_decisions"]
+    rerank_accepted = set(grading_plan["rerank_accepted"])
+    llm_results = dict(zip(grading_plan["ambiguous_indexes"], grading_results))
 
     filtered_docs = []
-    llm_grade_document = ChatOpenAI(model="gpt-4o")
-    retrieval_grader = get_retrival_grader_chain(llm_grade_document)
-
     results_log = []
     is_cross_ref = cross_ref_analysis.get("needs_cross_reference") == "yes"
     
     # For cross-referencing, be more inclusive with document filtering
     min_docs_threshold = 5 if is_cross_ref else 3
     
-    for d in documents:
-        score = retrieval_grader.invoke({"question": question, "document": d.page_content})
-        grade = score.binary_score
-        results_log.append({"doc": d.page_content[:100] + "...", "grade": grade})
-        if grade.lower() == "yes":
+    for index, d in enumerate(documents):
+        if index in cached_grades:
+            grade = cached_grades[index]
+            results_log.append({"doc": d.page_content[:100] + "...", "grade": grade, "source": "cache"})
+        elif index in decisions:
+            grade = decisions[index]
+            results_log.append({"doc": d.page_content[:100] + "...", "grade": grade, "source": "score"})
+        elif index in rerank_accepted:
+            grade = "yes"
+            results_log.append({"doc": d.page_content[:100] + "...", "grade": grade, "source": "rerank"})
+        else:
+            result = llm_results[index]
+            grade = result["grade"]
+            results_log.append({
+                "doc": d.page_content[:100] + "...",
+                "grade": grade,
+                "source": "llm",
+                "latency": round(result["latency"], 3),
+                "error": result["error"]
+            })
+            global_grade_cache.put(question, d, GRADER_MODEL, grade)
+            score = d.metadata.get(SCORE_METADATA_KEY) if hasattr(d, "metadata") else None
+            if grade is not None and score is not None:
+                # Log the LLM verdict against the score to calibrate the cut-offs
+                global_grade_calibrator.record(
+                    d.metadata.get("_collection_name", "unknown"), score, grade.lower() == "yes"
+                )
+            if grade is None and index in calibration_decisions:
+                # A failed calibration sample falls back to its confident score decision
+                grade = calibration_decisions[index]
+                print(f"CALIBRATION SAMPLE FAILED, USING SCORE DECISION '{grade}': {result['error']}")
+
+        if grade is None:
+            # Keep an ambiguous document if its grading call failed rather than losing it
+            print(f"GRADING FAILED, KEEPING DOCUMENT: {llm_results[index]['error']}")
+            filtered_docs.append(d)
+        elif grade.lower() == "yes":
             filtered_docs.append(d)
 
+    llm_latencies = [entry["latency"] for entry in results_log if entry["source"] == "llm"]
+    print(f"LLM GRADED {len(grading_plan['ambiguous_docs'])} OF {len(documents)} DOCS IN {grading_time:.2f}s "
+          f"(per-document: {llm_latencies})")
+
     # If we're doing cross-referencing and have too few docs, be more lenient
     if is_cross_ref and len(filtered_docs) < min_docs_threshold:
         print(f"---CROSS-REFERENCING MODE: Only {len(filtered_docs)} docs passed grading, being more inclusive---")
@@ -221,7 +806,13 @@ def grade_documents(state):
             print(f"---ADDED {additional_needed} ADDITIONAL DOCS FOR CROSS-REFERENCING---")
 
     tool_call_entry = {
-        "tool": "retrieval_grader"
+        "tool": "retrieval_grader",
+        "documents_graded": len(documents),
+        "llm_graded": len(grading_plan["ambiguous_docs"]),
+        "cached_grades": len(cached_grades),
+        "rerank_accepted": len(rerank_accepted),
+        "grading_time": round(grading_time, 3),
+        "document_latencies": llm_latencies
     }
 
     print(f"FILTERED DOCS COUNT: {len(filtered_docs)} (Cross-ref mode: {is_cross_ref})")
@@ -236,41 +827,92 @@ def transform_query(state):
     messages = state["messages"]
     question = messages[-1].content
 
-    llm = ChatGroq(model="llama-3.3-70b-versatile")
-    question_rewriter = get_question_rewriter_chain(llm)
+    question_rewriter = global_llm_registry.get_chain("question_rewriter")
     better_question = question_rewriter.invoke({"question": question})
 
     tool_call_entry = {
         "tool": "question_rewriter"
     }
 
-    return {
+    result = {
         "messages": [better_question],
+        "speculative_tasks": start_query_planning(better_question),
         "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
     }
 
+    # Embed the rewritten question here so the retrieval that follows reuses it
+    try:
+        _, result["context_embeddings"] = get_question_embedding(state, better_question)
+    except Exception as e:
+        print(f"Embedding rewritten question failed, retrieval will embed it: {e}")
+
+    return result
+
+
+async def atransform_query(state):
+    """
+    Async version of transform_query.
+    """
+    print("---TRANSFORM QUERY---")
+    messages = state["messages"]
+    question = messages[-1].content
+
+    question_rewriter = global_llm_registry.get_chain("question_rewriter")
+    better_question = await question_rewriter.ainvoke({"question": question})
+
+    tool_call_entry = {
+        "tool": "question_rewriter"
+    }
+
+    result = {
+        "messages": [better_question],
+        "speculative_tasks": astart_query_planning(better_question),
+        "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
+    }
+
+    try:
+        _, result["context_embeddings"] = await aget_question_embedding(state, better_question)
+    except Exception as e:
+        print(f"Embedding rewritten question failed, retrieval will embed it: {e}")
+
+    return result
+
 
 def web_search(state):
     print("---WEB SEARCH---")
     messages = state["messages"]
     question = messages[-1].content
-    web_search_tool = TavilySearch(k=3)
-    docs = web_search_tool.invoke({"query": question})
+    docs = global_web_search_service.search(question)
+    return web_search_result(state, docs)
 
-    if isinstance(docs, list):
-        web_results = "\n".join(
-            d["content"] if isinstance(d, dict) and "content" in d else str(d)
-            for d in docs
-        )
-    else:
-        web_results = str(docs)
+
+async def aweb_search(state):
+    """
+    Async version of web_search.
+    """
+    print("---WEB SEARCH---")
+    messages = state["messages"]
+    question = messages[-1].content
+    docs = await global_web_search_service.asearch(question)
+    return web_search_result(state, docs)
+
+
+def web_search_result(state, docs):
+    web_documents = web_search_documents(docs)
 
     tool_call_entry = {
-        "tool": "web_search"
+        "tool": "web_search",
+        "results": len(docs or [])
     }
 
+    if not web_documents:
+        return {
+            "documents": [],
+            "web_search_failed": True,
+            "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
+        }
     return {
-        "documents": [Document(page_content=web_results)],
+        "documents": web_documents,
         "web_searched": True,
         "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
     }
@@ -281,25 +923,59 @@ def financial_web_search(state):
     messages = state["messages"]
     question = messages[-1].content
 
-    web_search_tool = TavilySearch(k=3)
-    docs = web_search_tool.invoke({"query": question})
+    docs = global_web_search_service.search(question)
+    return financial_web_search_result(state, docs)
+
+
+async def afinancial_web_search(state):
+    """
+    Async version of financial_web_search.
+    """
+    print("---FINANCIAL WEB SEARCH---")
+    messages = state["messages"]
+    question = messages[-1].content
+
+    docs = await global_web_search_service.asearch(question)
+    return financial_web_search_result(state, docs)
+
 
+def join_web_results(docs):
+    """Join the content of web search results into one text block."""
     if isinstance(docs, list):
-        web_results = "\n".join(
+        return "\n".join(
             d.get("content", "") if isinstance(d, dict) else str(d)
             for d in docs
         )
-    else:
-        web_results = str(docs)
+    return str(docs)
+
+
+def web_search_documents(docs):
+    """
+    The web results as one document, or no documents when the search failed,
+    timed out or found nothing.
+    """
+    web_results = join_web_results(docs or [])
+    if not web_results.strip():
+        print("---WEB SEARCH RETURNED NO RESULTS---")
+        return []
+    return [Document(page_content=web_results)]
+
+
+def financial_web_search_result(state, docs):
+    web_documents = web_search_documents(docs)
 
     tool_call_entry = {
-        "tool": "financial_web_search"
+        "tool": "financial_web_search",
+        "results": len(docs or [])
     }
 
-    return {
-        "documents": [Document(page_content=web_results)],
+    result = {
+        "documents": web_documents,
         "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
     }
+    if not web_documents:
+        result["web_search_failed"] = True
+    return result
 
 
 def integrate_web_search(state):
@@ -309,27 +985,43 @@ def integrate_web_search(state):
     print("---INTEGRATE WEB SEARCH---")
     messages = state["messages"]
     question = messages[-1].content
-    existing_documents = state.get("documents", [])
 
-    web_search_tool = TavilySearch(k=3)
-    docs = web_search_tool.invoke({"query": question})
+    docs = global_web_search_service.search(question)
+    return integrated_web_search_result(state, docs)
 
-    if isinstance(docs, list):
-        web_results = "\n".join(
-            d.get("content", "") if isinstance(d, dict) else str(d)
-            for d in docs
-        )
-    else:
-        web_results = str(docs)
 
-    # Add web results to existing documents
-    web_doc = Document(page_content=web_results)
-    combined_documents = existing_documents + [web_doc]
+async def aintegrate_web_search(state):
+    """
+    Async version of integrate_web_search.
+    """
+    print("---INTEGRATE WEB SEARCH---")
+    messages = state["messages"]
+    question = messages[-1].content
+
+    docs = await global_web_search_service.asearch(question)
+    return integrated_web_search_result(state, docs)
+
+
+def integrated_web_search_result(state, docs):
+    existing_documents = state.get("documents", [])
+    web_documents = web_search_documents(docs)
 
     tool_call_entry = {
-        "tool": "integrate_web_search"
+        "tool": "integrate_web_search",
+        "results": len(docs or [])
     }
 
+    if not web_documents:
+        # Keep the vectorstore documents as they are; the web was not searched successfully
+        return {
+            "documents": existing_documents,
+            "web_search_failed": True,
+            "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
+        }
+
+    # Add web results to existing documents
+    combined_documents = collapse_near_duplicates(existing_documents + web_documents)
+
     print(f"INTEGRATED WEB SEARCH RESULTS WITH {len(existing_documents)} EXISTING DOCS")
     return {
         "documents": combined_documents,
@@ -383,11 +1075,24 @@ def analyze_cross_reference_needs(state):
     messages = state["messages"]
     question = messages[-1].content
 
-    llm = ChatOpenAI(model="gpt-4o")
-    cross_ref_analyzer = get_cross_reference_analyzer_chain(llm)
-    
-    analysis = cross_ref_analyzer.invoke({"question": question})
-    
+    # The query plan carries the cross-reference fields
+    analysis = get_query_plan(state, question)
+    return cross_reference_analysis_result(state, analysis)
+
+
+async def aanalyze_cross_reference_needs(state):
+    """
+    Async version of analyze_cross_reference_needs.
+    """
+    print("---ANALYZE CROSS-REFERENCE NEEDS---")
+    messages = state["messages"]
+    question = messages[-1].content
+
+    analysis = await aget_query_plan(state, question)
+    return cross_reference_analysis_result(state, analysis)
+
+
+def cross_reference_analysis_result(state, analysis):
     tool_call_entry = {
         "tool": "cross_reference_analyzer"
     }
@@ -405,35 +1110,37 @@ def analyze_cross_reference_needs(state):
 
 def determine_summary_strategy(state):
     """
-    Determine the optimal strategy for document summarization based on cross-reference analysis.
+    Determine the optimal strategy for document summarization based on the
+    available sources and the question's query plan (no LLM call).
     """
     print("---DETERMINE SUMMARY STRATEGY---")
     messages = state["messages"]
     question = messages[-1].content
-    cross_ref_analysis = state.get("cross_reference_analysis", {})
-    
-    # Determine available sources based on current state
+
+    # Planned by analyze_cross_reference_needs earlier in the run
+    plan = global_query_plan_cache.get(question)
+    strategy = decide_summary_strategy(available_document_sources(state), plan)
+    return summary_strategy_result(state, strategy)
+
+
+def available_document_sources(state):
+    """Determine available sources based on current state."""
     available_sources = []
     if state.get("vectorstore_searched", False):
         available_sources.extend(["text_docs", "images"])
     if state.get("web_searched", False):
         available_sources.append("web_search")
-        
-    llm = ChatOpenAI(model="gpt-4o")
-    strategy_analyzer = get_document_summary_strategy_chain(llm)
-    
-    strategy = strategy_analyzer.invoke({
-        "question": question,
-        "document_sources": available_sources
-    })
-    
+    return available_sources
+
+
+def summary_strategy_result(state, strategy):
     tool_call_entry = {
         "tool": "summary_strategy_analyzer"
     }
 
-    print(f"SUMMARY STRATEGY: {strategy.strategy}")
+    print(f"SUMMARY STRATEGY: {strategy}")
     return {
-        "summary_strategy": strategy.strategy,
+        "summary_strategy": strategy,
         "tool_calls": state.get("tool_calls", []) + [tool_call_entry]
     }
 
@@ -509,25 +1216,41 @@ def generate_with_cross_reference_and_citations(state):
     summary_strategy = state.get("summary_strategy", "single_source")
     cross_reference_analysis = state.get("cross_reference_analysis", {})
 
-    llm = ChatOpenAI(model="gpt-4o")
-    enhanced_rag_chain = get_enhanced_rag_chain_with_citations(llm)
-    
-    # Format document sources for the prompt
-    formatted_sources = {}
-    for source_type, docs in document_sources.items():
-        if docs:
-            formatted_sources[source_type] = [
-                {"content": doc.page_content, "metadata": getattr(doc, 'metadata', {})}
-                for doc in docs
-            ]
+    query_vector, known_vectors = context_packing_inputs(state)
+    enhanced_rag_chain = global_llm_registry.get_chain("enhanced_rag")
     
     enhanced_response = enhanced_rag_chain.invoke({
         "question": question,
-        "document_sources": formatted_sources,
+        "document_sources": pack_document_sources(document_sources, query_vector, known_vectors),
         "summary_strategy": summary_strategy,
         "cross_reference_analysis": cross_reference_analysis
     })
+    return cited_generation_result(state, enhanced_response)
+
+
+async def agenerate_with_cross_reference_and_citations(state):
+    """
+    Async version of generate_with_cross_reference_and_citations.
+    """
+    print("---GENERATE WITH CROSS-REFERENCE AND CITATIONS---")
+    messages = state["messages"]
+    question = messages[-1].content
+
+    query_vector, known_vectors = context_packing_inputs(state)
+    document_sources = await asyncio.to_thread(
+        pack_document_sources, state.get("document_sources", {}), query_vector, known_vectors
+    )
+    enhanced_rag_chain = global_llm_registry.get_chain("enhanced_rag")
+    enhanced_response = await enhanced_rag_chain.ainvoke({
+        "question": question,
+        "document_sources": document_sources,
+        "summary_strategy": state.get("summary_strategy", "single_source"),
+        "cross_reference_analysis": state.get("cross_reference_analysis", {})
+    })
+    return cited_generation_result(state, enhanced_response)
+
 
+def cited_generation_result(state, enhanced_response):
     retry_count = state.get("retry_count", 0)
 
     tool_call_entry = {
@@ -0,0 +1,211 @@
+"""
+Query planning: one structured LLM call per question for company extraction,
+cross-reference analysis and the summary strategy hint.
+
+Plans depend only on the question, so they are cached process-wide by
+normalized question and started speculatively at graph entry. Questions whose
+companies are unambiguous from the alias matcher are planned without the LLM.
+"""
+
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from Graph.cache_engine import LRUTTLCache
+from Graph.grade_cache import normalize_question
+from Graph.company_matcher import global_company_matcher
+from Graph.speculative import (start_speculative_classifiers, astart_speculative_classifiers,
+                               get_speculative_result, aget_speculative_result)
+from load_vector_dbs.llm_registry import global_llm_registry, CHAIN_SPECS
+from pydantic_models.models import QueryPlan
+
+# Model used by the planner (part of the plan cache key)
+PLANNER_MODEL = CHAIN_SPECS["query_planner"][2]
+
+SINGLE_SOURCE = "single_source"
+MULTI_SOURCE_VECTORSTORE = "multi_source_vectorstore"
+INTEGRATED_WEB_VECTORSTORE = "integrated_web_vectorstore"
+
+# Words that make a single-company question possibly need other sources
+CROSS_REFERENCE_CUES = re.compile(
+    r"\b(compar\w*|versus|vs|against|between|industry|market|sector|peers?|competitors?|rivals?)\b",
+    re.IGNORECASE
+)
+
+
+class QueryPlanCache:
+    """
+    Process-wide cache of QueryPlan objects keyed by (model, normalized question).
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl: Optional[float] = 24 * 3600):
+        """
+        Args:
+            max_entries: Maximum number of cached plans
+            ttl: Time to live for a plan in seconds
+        """
+        self._cache = LRUTTLCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, question: str, model: str = PLANNER_MODEL):
+        with self._lock:
+            return self._cache.get((model, normalize_question(question)))
+
+    def put(self, question: str, plan: Any, model: str = PLANNER_MODEL):
+        with self._lock:
+            self._cache.put((model, normalize_question(question)), plan)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._cache.get_stats()
+
+
+global_query_plan_cache = QueryPlanCache(
+    max_entries=int(os.getenv("QUERY_PLAN_CACHE_MAX_ENTRIES", "5000")),
+    ttl=float(os.getenv("QUERY_PLAN_CACHE_TTL", str(24 * 3600)))
+)
+
+
+def rule_based_query_plan(question: str) -> Optional[QueryPlan]:
+    """
+    Plan the question from the company aliases it names, when that is unambiguous:
+    two or more companies always need cross-referencing, one company without
+    comparison/industry wording never does. Questions where a company was only
+    recognized through an ordinary-word alias opening a sentence ("Chase ...",
+    "Meta ...") are left to the LLM planner.
+
+    Returns:
+        QueryPlan, or None when the LLM planner is needed
+    """
+    if global_company_matcher.is_ambiguous(question):
+        return None
+    companies = global_company_matcher.match(question)
+    if len(companies) >= 2:
+        return QueryPlan(
+            company=companies[0],
+            companies=companies,
+            is_comparison=True,
+            needs_cross_reference="yes",
+            source_types_needed=["text_docs", "images"],
+            reasoning=f"Question names several companies: {', '.join(companies)}",
+            summary_strategy=MULTI_SOURCE_VECTORSTORE
+        )
+    if len(companies) == 1 and not CROSS_REFERENCE_CUES.search(question or ""):
+        return QueryPlan(
+            company=companies[0],
+            companies=companies,
+            is_comparison=False,
+            needs_cross_reference="no",
+            source_types_needed=["text_docs", "images"],
+            reasoning=f"Single company question about {companies[0]}",
+            summary_strategy=SINGLE_SOURCE
+        )
+    return None
+
+
+def get_known_query_plan(question: str) -> Optional[QueryPlan]:
+    """
+    Plan available without an LLM call: cached, or rule-based (then cached).
+    """
+    plan = global_query_plan_cache.get(question)
+    if plan is None:
+        plan = rule_based_query_plan(question)
+        if plan is not None:
+            print(f"RULE-BASED QUERY PLAN: {plan}")
+            global_query_plan_cache.put(question, plan)
+    return plan
+
+
+def start_query_planning(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Start the planner in the background unless the plan is already known.
+
+    Returns:
+        dict: Value for the speculative_tasks state entry (None when known)
+    """
+    if get_known_query_plan(question) is not None:
+        return None
+    return start_speculative_classifiers(question)
+
+
+def astart_query_planning(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Async version of start_query_planning.
+    """
+    if get_known_query_plan(question) is not None:
+        return None
+    return astart_speculative_classifiers(question)
+
+
+def get_query_plan(state: Dict[str, Any], question: str):
+    """
+    Get the QueryPlan for a question: from the cache or the alias rules, the
+    speculative call started at graph entry, or a new planner call.
+
+    Args:
+        state: The current graph state (may be empty)
+        question: The question to plan
+
+    Returns:
+        QueryPlan
+    """
+    plan = get_known_query_plan(question)
+    if plan is not None:
+        return plan
+    plan = get_speculative_result(state, "query_planner", question)
+    if plan is None:
+        planner = global_llm_registry.get_chain("query_planner")
+        plan = planner.invoke({"question": question})
+    global_query_plan_cache.put(question, plan)
+    print(f"QUERY PLAN: {plan}")
+    return plan
+
+
+async def aget_query_plan(state: Dict[str, Any], question: str):
+    """
+    Async version of get_query_plan.
+    """
+    plan = get_known_query_plan(question)
+    if plan is not None:
+        return plan
+    plan = await aget_speculative_result(state, "query_planner", question)
+    if plan is None:
+        planner = global_llm_registry.get_chain("query_planner")
+        plan = await planner.ainvoke({"question": question})
+    global_query_plan_cache.put(question, plan)
+    print(f"QUERY PLAN: {plan}")
+    return plan
+
+
+def decide_summary_strategy(available_sources: List[str], plan=None) -> str:
+    """
+    Pick the summary strategy with rules instead of an LLM call.
+
+    Web and vectorstore results together are always integrated, and a single
+    kind of source is always summarized on its own. Only for vectorstore-only
+    answers does the question matter (one company or several), which comes
+    from the plan.
+
+    Args:
+        available_sources: Source types searched (see available_document_sources)
+        plan: The question's QueryPlan, if known
+
+    Returns:
+        str: One of the DocumentSummaryStrategy values
+    """
+    has_vectorstore = "text_docs" in available_sources or "images" in available_sources
+    has_web = "web_search" in available_sources
+
+    if has_vectorstore and has_web:
+        return INTEGRATED_WEB_VECTORSTORE
+    if not has_vectorstore or plan is None:
+        return SINGLE_SOURCE
+    if plan.is_comparison or len(set(plan.companies)) > 1:
+        return MULTI_SOURCE_VECTORSTORE
+    if plan.summary_strategy == MULTI_SOURCE_VECTORSTORE:
+        return MULTI_SOURCE_VECTORSTORE
+    return SINGLE_SOURCE
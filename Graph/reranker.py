@@ -0,0 +1,177 @@
+"""
+Local reranking between retrieval and LLM grading.
+
+The only relevance judgement used to be one LLM grader call per document.
+Retrieval now returns a larger candidate pool, a reranker running locally on
+CPU orders it, and only the top-N go to the grader (or, in fast mode, straight
+to generation without LLM grading).
+
+Backends (RERANKER):
+    cross-encoder  sentence-transformers CrossEncoder (RERANKER_BACKEND=onnx for ONNX Runtime)
+    lexical        deterministic BM25 over the candidate pool, no model needed
+    none           keep retrieval order and size
+The cross-encoder falls back to the lexical reranker if it cannot be loaded.
+"""
+
+import os
+import abc
+import math
+import threading
+from collections import Counter
+from typing import Any, Callable, Hashable, List, Optional
+
+from load_vector_dbs.sparse_vectors import tokenize
+
+RERANKER = os.getenv("RERANKER", "cross-encoder").lower()
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND")  # e.g. "onnx"
+# Documents retrieved per collection for the reranker to choose from
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "10"))
+# Documents passed on to the grader
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "5"))
+# Accept the reranked top-N without LLM grading
+RERANK_FAST_MODE = os.getenv("RERANK_FAST_MODE", "false").lower() in ("1", "true", "yes")
+
+RERANK_SCORE_METADATA_KEY = "rerank_score"
+
+
+def document_group(document: Any) -> Hashable:
+    """Company of a document (its collection when unknown), for per-company top-N."""
+    metadata = getattr(document, "metadata", None) or {}
+    return metadata.get("company") or metadata.get("_collection_name")
+
+
+class Reranker(abc.ABC):
+    """Interface: score (question, document) pairs; higher is more relevant."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def score(self, question: str, documents: List[Any]) -> List[float]:
+        """Relevance score of each document for the question."""
+
+    def warm_up(self):
+        """Load whatever the reranker needs before the first request."""
+
+    def rerank(self, question: str, documents: List[Any], top_n: Optional[int] = None,
+               group_by: Optional[Callable[[Any], Hashable]] = None) -> List[Any]:
+        """
+        Order documents by relevance and keep the top_n.
+        Ties keep the retrieval order, so the result is deterministic.
+
+        Args:
+            question: The user question
+            documents: Candidate documents
+            top_n: Documents to keep (None keeps all)
+            group_by: Keep the top_n of each group (e.g. per company) instead of overall
+
+        Returns:
+            list: Documents with their score under metadata["rerank_score"]
+        """
+        if not documents:
+            return []
+        scores = self.score(question, documents)
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+        if group_by is None:
+            order = order[:top_n]
+        elif top_n is not None:
+            kept_per_group = Counter()
+            grouped_order = []
+            for index in order:
+                group = group_by(documents[index])
+                if kept_per_group[group] < top_n:
+                    kept_per_group[group] += 1
+                    grouped_order.append(index)
+            order = grouped_order
+        reranked = []
+        for index in order:
+            document = documents[index]
+            metadata = {**(getattr(document, "metadata", None) or {}), RERANK_SCORE_METADATA_KEY: float(scores[index])}
+            reranked.append(document.model_copy(update={"metadata": metadata}))
+        return reranked
+
+
+class LexicalReranker(Reranker):
+    """BM25 of the question terms, with IDF taken from the candidate pool."""
+
+    name = "lexical"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, question: str, documents: List[Any]) -> List[float]:
+        query_terms = set(tokenize(question))
+        document_terms = [Counter(tokenize(document.page_content)) for document in documents]
+        average_length = sum(sum(terms.values()) for terms in document_terms) / len(documents) or 1.0
+        document_frequency = Counter(term for terms in document_terms for term in terms if term in query_terms)
+
+        scores = []
+        for terms in document_terms:
+            length_norm = 1 - self.b + self.b * sum(terms.values()) / average_length
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term, 0)
+                if tf:
+                    idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                    score += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+            scores.append(score)
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Cross-encoder scoring each (question, chunk) pair on CPU. The model is
+    loaded by warm_up() (or on first use); if that fails the lexical reranker
+    is used instead.
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str = RERANKER_MODEL, backend: Optional[str] = RERANKER_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        self._model = None
+        self._fallback: Optional[Reranker] = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._model is None and self._fallback is None:
+            with self._lock:
+                if self._model is None and self._fallback is None:
+                    try:
+                        from sentence_transformers import CrossEncoder
+                        kwargs = {"backend": self.backend} if self.backend else {}
+                        self._model = CrossEncoder(self.model_name, device="cpu", **kwargs)
+                        print(f"Loaded reranker {self.model_name}")
+                    except Exception as e:
+                        print(f"Could not load reranker {self.model_name}, using lexical reranking: {e}")
+                        self._fallback = LexicalReranker()
+
+    def warm_up(self):
+        self._load()
+
+    def score(self, question: str, documents: List[Any]) -> List[float]:
+        self._load()
+        if self._fallback is not None:
+            return self._fallback.score(question, documents)
+        pairs = [(question, document.page_content) for document in documents]
+        return [float(score) for score in self._model.predict(pairs)]
+
+
+def create_reranker(name: str = RERANKER) -> Optional[Reranker]:
+    """Reranker for a backend name, or None when reranking is disabled."""
+    if name in ("none", "off", "false", ""):
+        return None
+    if name == "lexical":
+        return LexicalReranker()
+    return CrossEncoderReranker()
+
+
+def candidate_pool_size(default: int) -> int:
+    """Documents to retrieve per collection: more when a reranker picks from them."""
+    return max(default, RERANK_CANDIDATES) if global_reranker is not None else default
+
+
+# Shared reranker, warmed up at app startup
+global_reranker = create_reranker()
@@ -0,0 +1,70 @@
+"""
+Retrieval constraints taken from the question: which companies, fiscal years
+and source files the searches should be filtered to.
+
+Only values that exist in the collections are kept (see PayloadCatalog), so a
+filter never excludes everything just because the question names a company
+or year the corpus does not have.
+"""
+
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from Graph.company_matcher import global_company_matcher
+from load_vector_dbs.payload_filters import global_payload_catalog, YEAR_PATTERN
+
+RETRIEVAL_FILTERS_ENABLED = os.getenv("RETRIEVAL_FILTERS", "true").lower() in ("1", "true", "yes")
+
+
+def _mentions(question: str, term: str) -> bool:
+    return re.search(rf"(?<!\w){re.escape(term)}(?!\w)", question, re.IGNORECASE) is not None
+
+
+def extract_retrieval_constraints(question: str, companies: Optional[List[str]] = None) -> Optional[Dict[str, List[Any]]]:
+    """
+    Build the payload constraints for a question.
+
+    Args:
+        question: The user question
+        companies: Standard company names, if already known (default: alias matcher)
+
+    Returns:
+        dict: {metadata field: allowed values}, or None when nothing applies
+    """
+    if not RETRIEVAL_FILTERS_ENABLED or not question:
+        return None
+
+    constraints = {}
+
+    company_values = []
+    for company in (companies if companies is not None else global_company_matcher.match(question)):
+        company_values.extend(global_company_matcher.payload_values(company))
+    if company_values:
+        constraints["company"] = sorted(set(company_values))
+
+    known_years = set(global_payload_catalog.values("fiscal_year"))
+    years = sorted({int(year) for year in YEAR_PATTERN.findall(question)} & known_years)
+    if years:
+        constraints["fiscal_year"] = years
+
+    source_files = [
+        source_file for source_file in global_payload_catalog.values("source_file")
+        if _mentions(question, source_file) or (
+            _mentions(question, os.path.splitext(source_file)[0])
+            and os.path.splitext(source_file)[0] not in company_values
+        )
+    ]
+    if source_files:
+        constraints["source_file"] = source_files
+
+    if constraints:
+        print(f"RETRIEVAL CONSTRAINTS: {constraints}")
+    return constraints or None
+
+
+def constraints_cache_scope(constraints: Optional[Dict[str, List[Any]]]) -> str:
+    """Suffix separating semantic cache entries of differently filtered searches."""
+    if not constraints:
+        return ""
+    return "|" + ";".join(f"{field}={','.join(map(str, values))}" for field, values in sorted(constraints.items()))
@@ -0,0 +1,165 @@
+"""
+Embedding-similarity cache used to answer near-duplicate queries from memory.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+# Partitions kept per cache; the least recently used one is dropped beyond this
+SEMANTIC_CACHE_MAX_PARTITIONS = int(os.getenv("SEMANTIC_CACHE_MAX_PARTITIONS", "16"))
+
+
+class _Partition:
+    """Fixed-capacity block of normalized embeddings for one collection."""
+
+    def __init__(self, capacity: int, dim: int, dtype):
+        self.vectors = np.zeros((capacity, dim), dtype=dtype)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)  # 0 marks an empty slot
+        self.values: List[Any] = [None] * capacity
+
+
+class SemanticCache:
+    """
+    Cache keyed by query embedding instead of exact text.
+
+    Embeddings for each collection are kept in one contiguous matrix
+    (float16 by default), so a lookup is a single vectorized cosine-similarity
+    pass. Entries expire after ``ttl`` seconds, and when a partition is full
+    the oldest entry is replaced. At most ``max_partitions`` partitions are
+    kept; the least recently used one is dropped to make room for a new one.
+    """
+
+    def __init__(self, capacity: int = 1000, ttl: int = 3600,
+                 similarity_threshold: float = 0.95, dtype=np.float16,
+                 max_partitions: int = SEMANTIC_CACHE_MAX_PARTITIONS):
+        """
+        Args:
+            capacity: Maximum entries per collection
+            ttl: Time to live for entries in seconds
+            similarity_threshold: Default minimum cosine similarity for a hit
+            dtype: Storage dtype for the embedding matrix
+            max_partitions: Maximum number of partitions kept
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.dtype = dtype
+        self.max_partitions = max(1, max_partitions)
+        self.partitions: "OrderedDict[str, _Partition]" = OrderedDict()
+        self.stats = {
+            'lookups': 0,
+            'hits': 0,
+            'exact_hits': 0,
+            'evictions': 0,
+            'partition_evictions': 0
+        }
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if vector.size == 0 or norm == 0:
+            return None
+        return vector / norm
+
+    def _partition(self, collection: str, dim: int) -> _Partition:
+        partition = self.partitions.get(collection)
+        if partition is None or partition.vectors.shape[1] != dim:
+            # New collection, or the embedding model changed dimension
+            partition = _Partition(self.capacity, dim, self.dtype)
+            self.partitions[collection] = partition
+        self.partitions.move_to_end(collection)
+        while len(self.partitions) > self.max_partitions:
+            self.partitions.popitem(last=False)
+            self.stats['partition_evictions'] += 1
+        return partition
+
+    def drop_partitions(self, predicate) -> int:
+        """Drop every partition whose name matches the predicate. Returns the number dropped."""
+        stale = [collection for collection in self.partitions if predicate(collection)]
+        for collection in stale:
+            del self.partitions[collection]
+        return len(stale)
+
+    def _similarities(self, partition: _Partition, vector: np.ndarray, now: float) -> np.ndarray:
+        similarities = partition.vectors.astype(np.float32) @ vector
+        live = (partition.timestamps > 0) & (now - partition.timestamps < self.ttl)
+        similarities[~live] = -np.inf
+        return similarities
+
+    def get(self, embedding, collection: str = "default",
+            similarity_threshold: Optional[float] = None) -> Optional[Tuple[Any, float]]:
+        """
+        Find the cached value whose embedding is most similar to the query.
+
+        Args:
+            embedding: Query embedding
+            collection: Partition to search
+            similarity_threshold: Minimum cosine similarity (default: the cache's threshold)
+
+        Returns:
+            tuple: (value, similarity) for the best live match, or None
+        """
+        self.stats['lookups'] += 1
+        vector = self._normalize(embedding)
+        partition = self.partitions.get(collection)
+        if vector is None or partition is None or partition.vectors.shape[1] != vector.size:
+            return None
+        self.partitions.move_to_end(collection)
+
+        threshold = self.similarity_threshold if similarity_threshold is None else similarity_threshold
+        similarities = self._similarities(partition, vector, time.time())
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < threshold:
+            return None
+
+        self.stats['hits'] += 1
+        if similarity >= 0.999:
+            self.stats['exact_hits'] += 1
+        return partition.values[best], similarity
+
+    def put(self, embedding, value: Any, collection: str = "default"):
+        """
+        Store a value under its query embedding. A near-identical embedding
+        already in the cache is overwritten instead of duplicated.
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        partition = self._partition(collection, vector.size)
+        now = time.time()
+
+        similarities = self._similarities(partition, vector, now)
+        best = int(np.argmax(similarities))
+        if similarities[best] >= 0.999:
+            slot = best
+        else:
+            expired = (partition.timestamps == 0) | (now - partition.timestamps >= self.ttl)
+            if expired.any():
+                slot = int(np.argmax(expired))
+            else:
+                slot = int(np.argmin(partition.timestamps))
+                self.stats['evictions'] += 1
+
+        partition.vectors[slot] = vector.astype(self.dtype)
+        partition.timestamps[slot] = now
+        partition.values[slot] = value
+
+    def remove_expired(self) -> int:
+        """Free the slots of expired entries. Returns the number removed."""
+        now = time.time()
+        removed = 0
+        for partition in self.partitions.values():
+            expired = (partition.timestamps > 0) & (now - partition.timestamps >= self.ttl)
+            for slot in np.flatnonzero(expired):
+                partition.timestamps[slot] = 0
+                partition.values[slot] = None
+                removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return int(sum(np.count_nonzero(p.timestamps) for p in self.partitions.values()))
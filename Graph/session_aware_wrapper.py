@@ -2,8 +2,9 @@
 Session-aware graph wrapper that properly manages memory across different user sessions.
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator, Sequence, Tuple
 import time
+import asyncio
 from Graph.session_manager import global_session_manager, load_user_session
 from Graph.memory_manager import MemoryManager
 
@@ -61,6 +62,57 @@ class SessionAwareGraphWrapper:
         self._post_process_session_learning(session_enhanced_inputs, result, execution_time)
         
         return result
+
+    async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async version of invoke: runs the graph with ainvoke so the event loop
+        stays free while nodes wait on the LLM, Qdrant and web search.
+        """
+        session_enhanced_inputs = self._prepare_session_context(inputs)
+
+        start_time = time.time()
+        config = {"recursion_limit": 35}
+        result = await self.compiled_graph.ainvoke(session_enhanced_inputs, config=config)
+        execution_time = time.time() - start_time
+
+        # Learning may save the session to disk, keep that off the event loop
+        await asyncio.to_thread(
+            self._post_process_session_learning, session_enhanced_inputs, result, execution_time
+        )
+
+        return result
+
+    async def astream(self, inputs: Dict[str, Any],
+                      stream_mode: Sequence[str] = ("updates", "messages")) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Execute the graph with session context, yielding progress as it happens.
+
+        Args:
+            inputs: Graph inputs
+            stream_mode: LangGraph stream modes to forward
+
+        Yields:
+            tuple: (mode, chunk) for each streamed item, then ("final", state)
+            with the final graph state once session learning is done
+        """
+        session_enhanced_inputs = self._prepare_session_context(inputs)
+
+        start_time = time.time()
+        config = {"recursion_limit": 35}
+        result = None
+        async for mode, chunk in self.compiled_graph.astream(
+            session_enhanced_inputs, config=config, stream_mode=[*stream_mode, "values"]
+        ):
+            if mode == "values":
+                result = chunk  # the last values chunk is the final state
+            else:
+                yield mode, chunk
+        execution_time = time.time() - start_time
+
+        await asyncio.to_thread(
+            self._post_process_session_learning, session_enhanced_inputs, result, execution_time
+        )
+        yield "final", result
     
     def _prepare_session_context(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -101,8 +153,29 @@ class SessionAwareGraphWrapper:
         
         return session_inputs
     
+    def record_exchange(self, inputs: Dict[str, Any], result: Dict[str, Any], execution_time: float,
+                        learn_routing: bool = True):
+        """
+        Record an answer this session did not compute itself (shared by a
+        concurrent identical request, or served from the answer cache), so
+        follow-up questions in this session see it in their history.
+
+        Args:
+            inputs: This session's graph inputs (its own question)
+            result: The final graph state of the answer
+            execution_time: Seconds this session waited for the answer
+            learn_routing: Also learn the routing pattern (False for cache hits)
+        """
+        self._post_process_session_learning(inputs, result, execution_time, learn_routing)
+
+    async def arecord_exchange(self, inputs: Dict[str, Any], result: Dict[str, Any], execution_time: float,
+                               learn_routing: bool = True):
+        """Async version of record_exchange; saving the session stays off the event loop."""
+        await asyncio.to_thread(self.record_exchange, inputs, result, execution_time, learn_routing)
+
     def _post_process_session_learning(self, inputs: Dict[str, Any], 
-                                     result: Dict[str, Any], execution_time: float):
+                                     result: Dict[str, Any], execution_time: float,
+                                     learn_routing: bool = True):
         """
         Learn from this interaction and update session-specific memory.
         """
@@ -129,7 +202,7 @@ class SessionAwareGraphWrapper:
             )
             
             # Learn routing patterns specific to this session
-            if result.get('routing_memory'):
+            if learn_routing and result.get('routing_memory'):
                 routing_info = result['routing_memory']
                 quality_estimate = 0.8 if result.get('documents') else 0.3
                 
@@ -0,0 +1,114 @@
+"""
+Speculative execution of the classifiers that depend only on the question.
+
+The query planner (company extraction and cross-reference analysis) used to
+run on the critical path after retrieval and grading. It is started when the
+question enters the graph, runs alongside the vector searches, and the nodes
+that need it join the result. Results nobody asks for are discarded.
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Dict, Optional
+from load_vector_dbs.llm_registry import global_llm_registry
+
+SPECULATIVE_CLASSIFIERS_ENABLED = os.getenv("SPECULATIVE_CLASSIFIERS", "true").lower() in ("1", "true", "yes")
+
+# Chains that take only {"question": ...} and are started at graph entry
+SPECULATIVE_CHAINS = ("query_planner",)
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SPECULATIVE_MAX_WORKERS", "8")),
+    thread_name_prefix="speculative"
+)
+
+
+def start_speculative_classifiers(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Start the question-only classifiers in background threads.
+
+    Returns:
+        dict: {"question", "pending"} for the speculative_tasks state entry, or None if disabled
+    """
+    if not SPECULATIVE_CLASSIFIERS_ENABLED:
+        return None
+    pending = {
+        name: _executor.submit(global_llm_registry.get_chain(name).invoke, {"question": question})
+        for name in SPECULATIVE_CHAINS
+    }
+    print(f"STARTED SPECULATIVE CLASSIFIERS: {list(pending)}")
+    return {"question": question, "pending": pending}
+
+
+def _consume_exception(task: asyncio.Task):
+    # Unused tasks that fail must not log "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+def astart_speculative_classifiers(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Async version of start_speculative_classifiers: starts the classifiers as
+    tasks on the running event loop.
+    """
+    if not SPECULATIVE_CLASSIFIERS_ENABLED:
+        return None
+    pending = {}
+    for name in SPECULATIVE_CHAINS:
+        task = asyncio.create_task(global_llm_registry.get_chain(name).ainvoke({"question": question}))
+        task.add_done_callback(_consume_exception)
+        pending[name] = task
+    print(f"STARTED SPECULATIVE CLASSIFIERS: {list(pending)}")
+    return {"question": question, "pending": pending}
+
+
+def _pending_for(state: Dict[str, Any], name: str, question: str):
+    speculative = state.get("speculative_tasks") or {}
+    if speculative.get("question") != question:
+        return None  # started for a different (e.g. rewritten) question
+    return (speculative.get("pending") or {}).get(name)
+
+
+def get_speculative_result(state: Dict[str, Any], name: str, question: str):
+    """
+    Join a speculative classifier result.
+
+    Args:
+        state: The current graph state
+        name: Chain name from SPECULATIVE_CHAINS
+        question: The question the caller needs the result for
+
+    Returns:
+        The chain output, or None if it was not started for this question or
+        failed (the caller then runs the chain itself)
+    """
+    pending = _pending_for(state, name, question)
+    if not isinstance(pending, Future):
+        return None
+    try:
+        result = pending.result()
+        print(f"USING SPECULATIVE RESULT: {name}")
+        return result
+    except Exception as e:
+        print(f"Speculative {name} failed, running it now: {e}")
+        return None
+
+
+async def aget_speculative_result(state: Dict[str, Any], name: str, question: str):
+    """
+    Async version of get_speculative_result.
+    """
+    pending = _pending_for(state, name, question)
+    if pending is None:
+        return None
+    try:
+        if isinstance(pending, Future):
+            result = await asyncio.wrap_future(pending)
+        else:
+            result = await pending
+        print(f"USING SPECULATIVE RESULT: {name}")
+        return result
+    except Exception as e:
+        print(f"Speculative {name} failed, running it now: {e}")
+        return None
@@ -0,0 +1,246 @@
+"""
+Shared web-search service used by the web_search, financial_web_search and
+integrate_web_search nodes.
+
+Each node used to build its own TavilySearch and call it synchronously, with
+no timeout, so a fallback chain could search the same query twice. Searches
+now go through one service: a pluggable backend (Tavily, or a local fixture
+file for offline runs), one shared client, per-call timeouts and a TTL cache
+keyed by normalized query. Time-sensitive queries ("latest", "stock price",
+...) expire sooner. A failed or empty search returns no results, and the
+nodes then add no documents.
+"""
+
+import os
+import re
+import abc
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+
+from tavily import TavilyClient
+
+from Graph.cache_engine import LRUTTLCache
+from load_vector_dbs.singleflight import SingleFlight
+from Graph.grade_cache import normalize_question
+
+WEB_SEARCH_BACKEND = os.getenv("WEB_SEARCH_BACKEND", "tavily").lower()
+WEB_SEARCH_MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "3"))
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "10"))
+WEB_SEARCH_TTL = float(os.getenv("WEB_SEARCH_TTL", str(6 * 3600)))
+WEB_SEARCH_TIME_SENSITIVE_TTL = float(os.getenv("WEB_SEARCH_TIME_SENSITIVE_TTL", "600"))
+WEB_SEARCH_FIXTURES = os.getenv("WEB_SEARCH_FIXTURES", os.path.join("cache", "web_search_fixtures.json"))
+
+TIME_SENSITIVE_PATTERN = re.compile(
+    r"\b(today|current(ly)?|latest|recent(ly)?|news|now|this (year|quarter|month|week)|"
+    r"stock price|share price|market cap\w*|price target)\b",
+    re.IGNORECASE
+)
+
+
+def is_time_sensitive(query: str) -> bool:
+    """Whether results for the query go stale quickly."""
+    return TIME_SENSITIVE_PATTERN.search(query or "") is not None
+
+
+class WebSearchBackend(abc.ABC):
+    """Interface: return a list of result dicts with at least a "content" key."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        """Search the web; raise on failure."""
+
+    async def asearch(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.search, query, max_results)
+
+
+def _tavily_results(response: Any) -> List[Dict[str, Any]]:
+    """Normalize a Tavily response (dict with "results", list, or text)."""
+    if isinstance(response, dict):
+        response = response.get("results", [])
+    if isinstance(response, list):
+        return [item if isinstance(item, dict) else {"content": str(item)} for item in response]
+    return [{"content": str(response)}] if response else []
+
+
+class TavilyBackend(WebSearchBackend):
+    """
+    Tavily search through one shared client. Requests carry their own
+    timeout, so a hung call releases its worker thread instead of holding it.
+    The async path runs the same client in a worker thread: Tavily's async
+    client is bound to the event loop it was first used on.
+    """
+
+    name = "tavily"
+
+    def __init__(self, timeout: float = WEB_SEARCH_TIMEOUT):
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> TavilyClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = TavilyClient()
+        return self._client
+
+    def search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        response = self.client.search(query, max_results=max_results, timeout=self.timeout)
+        return _tavily_results(response)[:max_results]
+
+
+class FixtureBackend(WebSearchBackend):
+    """
+    Offline backend answering from a JSON file mapping queries to result
+    lists. Queries are matched after normalization; a "*" entry is the
+    default for unknown queries.
+    """
+
+    name = "fixture"
+
+    def __init__(self, path: str = WEB_SEARCH_FIXTURES):
+        self.path = path
+        self._fixtures: Optional[Dict[str, List[Dict[str, Any]]]] = None
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        if self._fixtures is None:
+            fixtures = {}
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    fixtures = {normalize_question(query): results for query, results in json.load(f).items()}
+            except Exception as e:
+                print(f"Could not load web search fixtures from {self.path}: {e}")
+            self._fixtures = fixtures
+        return self._fixtures
+
+    def search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        fixtures = self._load()
+        results = fixtures.get(normalize_question(query), fixtures.get("*", []))
+        return [dict(result, content=result.get("content", "").replace("{query}", query)) for result in results][:max_results]
+
+
+def create_backend(name: str = WEB_SEARCH_BACKEND) -> WebSearchBackend:
+    if name == "fixture":
+        return FixtureBackend()
+    return TavilyBackend()
+
+
+class WebSearchService:
+    """
+    Cached web search with a timeout per call. Failed or timed-out searches
+    return no results and are not cached.
+    """
+
+    def __init__(self, backend: Optional[WebSearchBackend] = None, max_results: int = WEB_SEARCH_MAX_RESULTS,
+                 timeout: float = WEB_SEARCH_TIMEOUT, ttl: float = WEB_SEARCH_TTL,
+                 time_sensitive_ttl: float = WEB_SEARCH_TIME_SENSITIVE_TTL, max_entries: int = 2000):
+        """
+        Args:
+            backend: Search backend (default: WEB_SEARCH_BACKEND)
+            max_results: Results per search
+            timeout: Seconds to wait for a search
+            ttl: Cache lifetime of results
+            time_sensitive_ttl: Cache lifetime of results for time-sensitive queries
+            max_entries: Maximum number of cached queries
+        """
+        self.backend = backend or create_backend()
+        self.max_results = max_results
+        self.timeout = timeout
+        self.ttl = ttl
+        self.time_sensitive_ttl = time_sensitive_ttl
+        self._cache = LRUTTLCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="web-search")
+        # Nodes searching the same query at the same time share one backend call
+        self._inflight = SingleFlight("web_search")
+        self.stats = {'searches': 0, 'cache_hits': 0, 'timeouts': 0, 'errors': 0}
+
+    def _key(self, query: str):
+        return (self.backend.name, self.max_results, normalize_question(query))
+
+    def ttl_for(self, query: str) -> float:
+        return self.time_sensitive_ttl if is_time_sensitive(query) else self.ttl
+
+    def _cached(self, query: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            results = self._cache.get(self._key(query))
+        if results is not None:
+            self.stats['cache_hits'] += 1
+            print(f"WEB SEARCH CACHE HIT: {query}")
+        return results
+
+    def _store(self, query: str, results: List[Dict[str, Any]], elapsed: float):
+        print(f"WEB SEARCH ({self.backend.name}) RETURNED {len(results)} RESULTS IN {elapsed:.2f}s")
+        with self._lock:
+            self._cache.put(self._key(query), results, ttl=self.ttl_for(query))
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Search the web for a query, serving repeats from the cache.
+
+        Returns:
+            list: Result dicts with a "content" key (empty on timeout or error)
+        """
+        cached = self._cached(query)
+        if cached is not None:
+            return cached
+        return self._inflight.do(self._key(query), self._search, query)
+
+    def _search(self, query: str) -> List[Dict[str, Any]]:
+        self.stats['searches'] += 1
+        start = time.time()
+        future = self._executor.submit(self.backend.search, query, self.max_results)
+        try:
+            results = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.stats['timeouts'] += 1
+            print(f"WEB SEARCH TIMED OUT AFTER {self.timeout}s: {query}")
+            return []
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"WEB SEARCH FAILED: {e}")
+            return []
+        self._store(query, results, time.time() - start)
+        return results
+
+    async def asearch(self, query: str) -> List[Dict[str, Any]]:
+        """Async version of search."""
+        cached = self._cached(query)
+        if cached is not None:
+            return cached
+        return await self._inflight.ado(self._key(query), self._asearch, query)
+
+    async def _asearch(self, query: str) -> List[Dict[str, Any]]:
+        self.stats['searches'] += 1
+        start = time.time()
+        try:
+            results = await asyncio.wait_for(self.backend.asearch(query, self.max_results), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            print(f"WEB SEARCH TIMED OUT AFTER {self.timeout}s: {query}")
+            return []
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"WEB SEARCH FAILED: {e}")
+            return []
+        self._store(query, results, time.time() - start)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'backend': self.backend.name, 'cached_queries': len(self._cache),
+                'coalesced': self._inflight.stats['shared']}
+
+
+# Shared service used by all web search nodes
+global_web_search_service = WebSearchService()
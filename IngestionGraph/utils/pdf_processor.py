@@ -4,8 +4,9 @@ import uuid
 import fitz  # PyMuPDF
 from langchain.docstore.document import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from load_vector_dbs.load_dbs import load_vector_database
+from load_vector_dbs.vector_db_registry import global_vector_db_registry
+from load_vector_dbs.payload_filters import ensure_payload_indexes, filter_metadata
 from data_preparation.image_data_prep import ImageDescription
 from llama_parse import LlamaParse
 from dotenv import load_dotenv
@@ -20,9 +21,13 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
         yield f"Processing document: {uploaded_pdf_path}"
         source_file_name = os.path.basename(uploaded_pdf_path)
 
-        embeddings = OpenAIEmbeddings()
+        # Shared client and cached embeddings from the vector DB registry
         db_init = load_vector_database()
 
+        # Indexes backing the company/year/source-file filters used at retrieval
+        for collection_name in (db_init.text_vector_db_path, db_init.image_vector_db_path):
+            ensure_payload_indexes(collection_name)
+
         # --- Text ingestion ---
         retriever, text_vectorstore, _ = db_init.get_text_retriever()
         existing_files = db_init.get_vector_store_files(text_vectorstore)
@@ -63,13 +68,15 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
                     text = page.text if hasattr(page, "text") else str(page)
                     if text.strip():
                         documents.append(
-                            Document(page_content=text, metadata={"source_file": source_file_name, "page_num": i + 1})
+                            Document(page_content=text, metadata={"source_file": source_file_name, "page_num": i + 1,
+                                                             **filter_metadata(source_file_name)})
                         )
             else:
                 text = parsed_docs.text if hasattr(parsed_docs, "text") else str(parsed_docs)
                 if text.strip():
                     documents.append(
-                        Document(page_content=text, metadata={"source_file": source_file_name, "page_num": 1})
+                        Document(page_content=text, metadata={"source_file": source_file_name, "page_num": 1,
+                                                         **filter_metadata(source_file_name)})
                     )
 
             if documents:
@@ -88,6 +95,7 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
                 ]
 
                 text_vectorstore.add_documents(text_chunks, ids=ids)
+                global_vector_db_registry.bump_corpus_version()
                 yield f"Added text & table chunks from {source_file_name} into Qdrant text vector store."
             else:
                 yield "No text extracted from PDF."
@@ -113,6 +121,12 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
                     metadata_path, os.path.splitext(source_file_name)[0]
                 )
 
+                # Filterable fields (company already comes from getRetriever)
+                for doc in image_documents:
+                    doc.metadata.setdefault("source_file", source_file_name)
+                    doc.metadata.update({key: value for key, value in filter_metadata(source_file_name).items()
+                                         if key != "company"})
+
                 # Deterministic UUIDs for images
                 img_ids = [
                     str(uuid.uuid5(
@@ -123,6 +137,7 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
                 ]
 
                 image_vectorstore.add_documents(image_documents, ids=img_ids)
+                global_vector_db_registry.bump_corpus_version()
                 yield f"Added image captions from {source_file_name} into Qdrant image vector store."
             else:
                 yield "No images found in PDF."
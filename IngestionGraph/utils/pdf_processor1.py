@@ -6,8 +6,9 @@ import fitz  # PyMuPDF
 from qdrant_client import models
 from langchain.docstore.document import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from load_vector_dbs.load_dbs import load_vector_database
+from load_vector_dbs.vector_db_registry import global_vector_db_registry
+from load_vector_dbs.payload_filters import ensure_payload_indexes, filter_metadata
 from data_preparation.image_data_prep import ImageDescription
 
 
@@ -20,6 +21,10 @@ def init_vector_stores():
     
     # Initialize image vector store
     image_vectorstore, image_retriever, _ = db_init.get_image_retriever()
+
+    # Indexes backing the company/year/source-file filters used at retrieval
+    for collection_name in (db_init.text_vector_db_path, db_init.image_vector_db_path):
+        ensure_payload_indexes(collection_name)
     
     return text_vectorstore, image_vectorstore
 
@@ -198,7 +203,7 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
                 metadata = {
                     "source_file": source_file_name,
                     "page_num": page_num + 1,
-                    "company": company_name,
+                    **filter_metadata(source_file_name),
                     "content_type": "text",
                     "content_hash": content_hash,
                     "ingestion_timestamp": str(datetime.now()),
@@ -218,6 +223,7 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
             print(f"First chunk metadata sample: {text_chunks[0].metadata}")
             print(f"First chunk ID: {ids[0]}")
             text_vectorstore.add_documents(text_chunks, ids=ids)
+            global_vector_db_registry.bump_corpus_version()
             print("Debug: Verifying ingestion...")
             verify_points = text_vectorstore.client.scroll(
                 collection_name=text_vectorstore.collection_name,
@@ -270,7 +276,7 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
             for doc in image_documents:
                 doc.metadata.update({
                     "source_file": source_file_name,
-                    "company": company_name,
+                    **filter_metadata(source_file_name),
                     "content_type": "image",
                     "ingestion_timestamp": str(datetime.now())
                 })
@@ -278,6 +284,7 @@ def process_pdf_and_stream(uploaded_pdf_path: str):
             # Generate deterministic UUIDs using the common function
             img_ids = [generate_doc_id(doc.metadata, i, "image") for i, doc in enumerate(image_documents)]
             image_vectorstore.add_documents(image_documents, ids=img_ids)
+            global_vector_db_registry.bump_corpus_version()
             yield f"Added {len(image_documents)} image captions from {source_file_name} into Qdrant image vector store."
         else:
             yield "No images found in PDF."
@@ -1,12 +1,28 @@
 import os
+import json
+import time
 from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from manager_agent.manager import ManagerAgent  #  import your manager
 from app_logger import log_response
+from load_vector_dbs.vector_db_registry import global_vector_db_registry
+from load_vector_dbs.llm_registry import global_llm_registry, ANSWER_STREAM_TAG
+from Graph.reranker import global_reranker
 # Initialize FastAPI + ManagerAgent
 app = FastAPI()
 manager = ManagerAgent()
 
+@app.on_event("startup")
+async def warm_up_vector_db():
+    """Create the shared Qdrant client, vector stores, LLM chains and reranker model before the first request."""
+    health = global_vector_db_registry.warm_up()
+    print(f"Vector DB registry status: {health['status']} ({health['latency_ms']} ms)")
+    global_llm_registry.warm_up()
+    if global_reranker is not None:
+        global_reranker.warm_up()
+
 from fastapi.middleware.cors import CORSMiddleware
 
 app.add_middleware(
@@ -86,11 +102,94 @@ async def ask_agent(payload: QueryInput):
     user_id = payload.user_id
     extra_inputs = payload.extra_inputs
     
-    # Handle with session awareness
-    result = manager.handle(query, user_id=user_id, extra_inputs=extra_inputs)
+    # Handle with session awareness, without blocking the event loop
+    result = await manager.ahandle(query, user_id=user_id, extra_inputs=extra_inputs)
     print(f"Query from user {user_id}: {query}")
     print(f"Session info: {result.get('session_info', {})}")
     
+    response_data = build_response_data(result)
+    
+    # Log the response to markdown file
+    log_response(payload.dict(), response_data)
+    
+    return response_data
+
+
+def _format_stream_event(event: dict, stream_format: str) -> str:
+    """Serialize one stream event as an NDJSON line or an SSE message."""
+    data = json.dumps(jsonable_encoder(event), default=str)
+    if stream_format == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@app.post("/ask/stream")
+async def ask_agent_stream(payload: QueryInput, format: str = "ndjson"):
+    """
+    Streaming version of /ask.
+
+    Emits one event per line (NDJSON, or SSE with ?format=sse):
+    - {"event": "node", "node": ...} when a graph node finishes
+    - {"event": "token", "node": ..., "attempt": ..., "content": ...} for answer tokens
+    - {"event": "answer_reset", "node": ..., "attempt": ...} when a generation node
+      starts again (answer not grounded or not useful): discard the tokens so far
+    - {"event": "final", "response": ...} with the same payload /ask returns
+    - {"event": "error", "message": ...} if the graph fails
+    """
+    stream_format = "sse" if format == "sse" else "ndjson"
+
+    async def event_stream():
+        start_time = time.time()
+        # Each run of a generation node is one answer attempt
+        attempt = 0
+        attempt_run = None
+        yield _format_stream_event({"event": "start", "query": payload.query, "user_id": payload.user_id}, stream_format)
+        try:
+            async for mode, chunk in manager.astream(payload.query, user_id=payload.user_id,
+                                                     extra_inputs=payload.extra_inputs):
+                elapsed_ms = round((time.time() - start_time) * 1000)
+                if mode == "updates":
+                    for node_name in chunk:
+                        yield _format_stream_event({"event": "node", "node": node_name, "elapsed_ms": elapsed_ms},
+                                                   stream_format)
+                elif mode == "messages":
+                    message_chunk, metadata = chunk
+                    content = getattr(message_chunk, "content", None)
+                    if content and isinstance(content, str) and ANSWER_STREAM_TAG in (metadata.get("tags") or []):
+                        node_name = metadata.get("langgraph_node")
+                        run = metadata.get("langgraph_checkpoint_ns") or (node_name, metadata.get("langgraph_step"))
+                        if run != attempt_run:
+                            if attempt_run is not None:
+                                attempt += 1
+                                yield _format_stream_event({"event": "answer_reset", "node": node_name,
+                                                            "attempt": attempt}, stream_format)
+                            attempt_run = run
+                        yield _format_stream_event({"event": "token", "node": node_name, "attempt": attempt,
+                                                    "content": content}, stream_format)
+                elif mode == "final":
+                    response_data = build_response_data(chunk)
+                    log_response(payload.dict(), response_data)
+                    yield _format_stream_event({"event": "final", "response": response_data,
+                                                "elapsed_ms": elapsed_ms}, stream_format)
+        except Exception as e:
+            print(f"Streaming request failed: {e}")
+            yield _format_stream_event({"event": "error", "message": str(e)}, stream_format)
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(event_stream(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def build_response_data(result: dict) -> dict:
+    """
+    Build the /ask response payload from the final graph state.
+
+    Args:
+        result: Final graph state with session_info attached
+
+    Returns:
+        dict: Answer, documents, citations, tool calls and metrics
+    """
     # Prepare response with session information
     routing_decision = 'unknown'
     if result.get('routing_memory') and result.get('routing_memory', {}).get('decision'):
@@ -135,10 +234,6 @@ async def ask_agent(payload: QueryInput):
             "retry_count": result.get('retry_count', 0)
         }
     }
-    
-    # Log the response to markdown file
-    log_response(payload.dict(), response_data)
-    
     return response_data
 
 # Additional endpoints for session management
@@ -157,4 +252,9 @@ async def clear_user_session(user_id: str):
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy", "service": "Agentic RAG API"}
\ No newline at end of file
+    return {
+        "status": "healthy",
+        "service": "Agentic RAG API",
+        "vector_db": global_vector_db_registry.health_check(),
+        "llm_registry": global_llm_registry.get_stats()
+    }
\ No newline at end of file
@@ -1,29 +1,35 @@
-from langchain_openai import OpenAIEmbeddings
 from qdrant_client import QdrantClient
+from load_vector_dbs.vector_db_registry import global_vector_db_registry
+from load_vector_dbs.payload_filters import ensure_payload_indexes
+from load_vector_dbs.sparse_vectors import sparse_vectors_config
 from qdrant_client.models import Distance, VectorParams
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def create_qdrant_collection(collection_name: str, qdrant_url: str = "http://localhost:6333"):
-    # Initialize embeddings
-    embeddings = OpenAIEmbeddings()
-    
-    # Detect embedding dimension dynamically
-    dummy_vector = embeddings.embed_query("Hello world")
-    embedding_dim = len(dummy_vector)
+def create_qdrant_collection(collection_name: str, qdrant_url: str = None):
+    # Detect embedding dimension (served from the embedding cache after the first run)
+    embedding_dim = global_vector_db_registry.embedding_dimension()
     print(f"Detected embedding dimension: {embedding_dim}")
     
-    # Connect to Qdrant
-    client = QdrantClient(url=qdrant_url)
+    # Connect to Qdrant (reuse the shared client unless a different URL is requested)
+    if qdrant_url and qdrant_url != global_vector_db_registry.url:
+        client = QdrantClient(url=qdrant_url)
+    else:
+        client = global_vector_db_registry.client
     
-    # Drop + recreate collection
+    # Drop + recreate collection (dense vectors plus BM25 sparse vectors for hybrid search)
     client.recreate_collection(
         collection_name=collection_name,
-        vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE)
+        vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE),
+        sparse_vectors_config=sparse_vectors_config()
     )
     
-    print(f" Collection '{collection_name}' recreated with vector size {embedding_dim}.")
+    ensure_payload_indexes(collection_name, client)
+    # The collection was emptied and may now have sparse vectors: invalidate derived caches and handles
+    global_vector_db_registry.bump_corpus_version()
+    
+    print(f" Collection '{collection_name}' recreated with vector size {embedding_dim} and sparse vectors.")
 
 if __name__ == "__main__":
     # Recreate both collections fresh
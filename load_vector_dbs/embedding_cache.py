@@ -0,0 +1,262 @@
+"""
+Persistent, content-addressed cache for embeddings.
+
+Every OpenAIEmbeddings call goes out over the network, so re-ingesting a file,
+embedding duplicate chunks or answering a repeated question pays again. This
+module wraps any LangChain Embeddings provider with an on-disk SQLite store
+keyed by model name and a hash of the text, shared by ingestion and queries.
+"""
+
+import os
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import time
+from typing import Dict, Any, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from load_vector_dbs.singleflight import SingleFlight
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+# Bounds on the store: oldest vectors are evicted first (0 disables a bound)
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "500000"))
+EMBEDDING_CACHE_MAX_AGE_DAYS = float(os.getenv("EMBEDDING_CACHE_MAX_AGE_DAYS", "0"))
+
+
+class EmbeddingStore:
+    """
+    SQLite-backed store of float32 vectors keyed by content hash. Vectors
+    are kept as blobs in the database itself (there is no separate
+    memory-mapped array). Safe to share between threads; WAL mode lets
+    several processes read it. Writes evict the oldest vectors once the
+    store exceeds max_rows or they are older than max_age.
+    """
+
+    def __init__(self, path: str, max_rows: int = EMBEDDING_CACHE_MAX_ROWS,
+                 max_age: float = EMBEDDING_CACHE_MAX_AGE_DAYS * 86400):
+        """
+        Open (or create) the store.
+
+        Args:
+            path: Location of the SQLite database file
+            max_rows: Maximum number of stored vectors (0: unbounded)
+            max_age: Seconds a vector is kept (0: forever)
+        """
+        self.path = path
+        self.max_rows = max_rows
+        self.max_age = max_age
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   key TEXT PRIMARY KEY,
+                   model TEXT NOT NULL,
+                   dim INTEGER NOT NULL,
+                   vector BLOB NOT NULL,
+                   created_at REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+        self._conn.commit()
+        # Approximate row count, so writes only count the table when near the bound
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.evictions = 0
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up vectors for many keys in batched queries."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        """Write vectors back to the store, then evict past the size and age bounds."""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append((key, model, int(array.shape[0]), array.tobytes(), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._rows += len(rows)
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Delete expired and, beyond max_rows, the oldest vectors. Called with the lock held."""
+        if self.max_age > 0:
+            deleted = self._conn.execute(
+                "DELETE FROM embeddings WHERE created_at < ?", (now - self.max_age,)
+            ).rowcount
+            self._rows -= deleted
+            self.evictions += deleted
+        if self.max_rows > 0 and self._rows > self.max_rows:
+            # INSERT OR REPLACE may have overwritten rows, so recount before deleting
+            self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            excess = self._rows - self.max_rows
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY created_at LIMIT ?)", (excess,)
+                )
+                self._rows -= excess
+                self.evictions += excess
+                print(f"Embedding cache: evicted {excess} oldest vectors (max {self.max_rows})")
+
+    def get_dimension(self, model: str) -> Optional[int]:
+        """Get the vector dimension already stored for a model, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dim FROM embeddings WHERE model = ? LIMIT 1", (model,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves vectors from an EmbeddingStore and only
+    sends cache misses to the underlying provider, writing them back.
+    """
+
+    def __init__(self, underlying: Embeddings, store: EmbeddingStore, model_name: Optional[str] = None):
+        """
+        Args:
+            underlying: The embeddings provider to call on a cache miss
+            store: Persistent vector store
+            model_name: Name used in cache keys (default: the provider's model attribute)
+        """
+        self.underlying = underlying
+        self.store = store
+        self.model_name = model_name or getattr(underlying, "model", type(underlying).__name__)
+        # Concurrent requests embedding the same question share one lookup and provider call
+        self._inflight = SingleFlight("embeddings")
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'provider_calls': 0
+        }
+
+    @classmethod
+    def from_env(cls, underlying: Embeddings) -> Embeddings:
+        """
+        Wrap the provider with the store configured by EMBEDDING_CACHE_PATH
+        (bounded by EMBEDDING_CACHE_MAX_ROWS / EMBEDDING_CACHE_MAX_AGE_DAYS),
+        or return it unchanged if EMBEDDING_CACHE_ENABLED is false.
+        """
+        if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return underlying
+        path = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("cache", "embeddings.sqlite3"))
+        try:
+            return cls(underlying, EmbeddingStore(path))
+        except Exception as e:
+            print(f"Embedding cache unavailable ({e}), using provider directly")
+            return underlying
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, texts: List[str]):
+        """Returns (keys, found vectors by key, distinct missing texts by key)."""
+        keys = [self._key(text) for text in texts]
+        try:
+            found = self.store.get_many(list(set(keys)))
+        except Exception as e:
+            print(f"Embedding cache lookup failed: {e}")
+            found = {}
+
+        # Embed each distinct missing text once, even if it repeats in the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        self.stats['hits'] += len(keys) - sum(1 for key in keys if key in missing)
+        self.stats['misses'] += len(missing)
+        if missing:
+            self.stats['provider_calls'] += 1
+        return keys, found, missing
+
+    def _store_missing(self, found: Dict[str, List[float]], missing: Dict[str, str], vectors: List[List[float]]):
+        new_items = dict(zip(missing.keys(), vectors))
+        found.update(new_items)
+        try:
+            self.store.put_many(self.model_name, new_items)
+        except Exception as e:
+            print(f"Embedding cache write failed: {e}")
+
+    def _embed(self, texts: List[str], embed_misses) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            self._store_missing(found, missing, embed_misses(list(missing.values())))
+        return [found[key] for key in keys]
+
+    async def _aembed(self, texts: List[str], aembed_misses) -> List[List[float]]:
+        # SQLite reads and writes run in a worker thread, off the event loop
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await aembed_misses(list(missing.values()))
+            await asyncio.to_thread(self._store_missing, found, missing, vectors)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._inflight.do(
+            self._key(text), self._embed, [text], lambda misses: [self.underlying.embed_query(misses[0])]
+        )[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed(list(texts), self.underlying.aembed_documents)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        async def aembed_misses(misses):
+            return [await self.underlying.aembed_query(misses[0])]
+        return (await self._inflight.ado(self._key(text), self._aembed, [text], aembed_misses))[0]
+
+    def dimension(self) -> int:
+        """Vector dimension for the model, without a network call once anything is cached."""
+        dim = self.store.get_dimension(self.model_name)
+        if dim is None:
+            dim = len(self.embed_query("Hello world"))
+        return dim
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and hit rate since the process started."""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': self.stats['hits'] / lookups if lookups > 0 else 0.0,
+            'model': self.model_name,
+            'coalesced': self._inflight.stats['shared'],
+            'evictions': self.store.evictions,
+            'path': self.store.path
+        }
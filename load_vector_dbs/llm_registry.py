@@ -0,0 +1,197 @@
+"""
+Process-wide registry for chat models and the prompt chains built on them.
+
+Nodes used to construct a new ChatOpenAI / ChatGroq client and rebuild their
+chain (including with_structured_output schema binding) on every call. The
+registry builds each model and chain once, shares one pooled HTTP client
+between all models, and hands ready chains to the nodes.
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+from langchain_groq import ChatGroq
+from load_vector_dbs.prompts_and_chains import (get_retrival_grader_chain, get_rag_chain,
+                                                get_hallucination_chain, get_query_planner_chain,
+                                                get_answer_quality_chain, get_question_rewriter_chain,
+                                                get_enhanced_rag_chain_with_citations)
+
+load_dotenv()
+
+OPENAI = "openai"
+GROQ = "groq"
+
+# Tag on chains whose tokens are streamed to the client as the answer
+ANSWER_STREAM_TAG = "answer_stream"
+# LangGraph does not stream tokens of chat models run under this tag
+NO_STREAM_TAG = "nostream"
+
+# Chain name -> (factory, provider, default model)
+CHAIN_SPECS: Dict[str, Tuple[Callable, str, str]] = {
+    "retrieval_grader": (get_retrival_grader_chain, OPENAI, "gpt-4o"),
+    "rag": (get_rag_chain, OPENAI, "gpt-4o-mini"),
+    "query_planner": (get_query_planner_chain, OPENAI, "gpt-4o"),
+    "question_rewriter": (get_question_rewriter_chain, GROQ, "llama-3.3-70b-versatile"),
+    "enhanced_rag": (get_enhanced_rag_chain_with_citations, OPENAI, "gpt-4o"),
+    "hallucination_grader": (get_hallucination_chain, OPENAI, "gpt-4o"),
+    "answer_grader": (get_answer_quality_chain, OPENAI, "gpt-4o"),
+}
+
+# Chains producing the answer text; every other chain is excluded from token streaming
+STREAMED_CHAINS = {"rag", "enhanced_rag"}
+
+
+class LLMRegistry:
+    """
+    Builds chat models and chains on first use and caches them for the
+    lifetime of the process. Safe to use from concurrent nodes.
+    """
+
+    def __init__(self, max_connections: Optional[int] = None, timeout: Optional[float] = None):
+        """
+        Args:
+            max_connections: Connection pool size of the shared HTTP client (default: LLM_MAX_CONNECTIONS)
+            timeout: Request timeout in seconds (default: LLM_TIMEOUT)
+        """
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "60"))
+
+        self._lock = threading.RLock()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+        self._closing = set()  # aclose() tasks scheduled by reset()
+        self._llms: Dict[Tuple[str, str], Any] = {}
+        self._chains: Dict[Tuple[str, str], Any] = {}
+
+        self.stats = {
+            'llms_created': 0,
+            'chains_created': 0,
+            'chain_requests': 0
+        }
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections)
+
+    @property
+    def http_client(self) -> httpx.Client:
+        """Pooled HTTP client shared by every model."""
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(limits=self._limits(), timeout=self.timeout)
+        return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        """Pooled async HTTP client shared by every model."""
+        if self._http_async_client is None:
+            with self._lock:
+                if self._http_async_client is None:
+                    self._http_async_client = httpx.AsyncClient(limits=self._limits(), timeout=self.timeout)
+        return self._http_async_client
+
+    def get_llm(self, model: str = "gpt-4o", provider: str = OPENAI):
+        """
+        Get the shared chat model.
+
+        Args:
+            model: Model name
+            provider: "openai" or "groq"
+
+        Returns:
+            The cached ChatOpenAI / ChatGroq instance
+        """
+        key = (provider, model)
+        llm = self._llms.get(key)
+        if llm is None:
+            with self._lock:
+                llm = self._llms.get(key)
+                if llm is None:
+                    model_class = ChatGroq if provider == GROQ else ChatOpenAI
+                    llm = model_class(model=model, http_client=self.http_client,
+                                      http_async_client=self.http_async_client)
+                    self._llms[key] = llm
+                    self.stats['llms_created'] += 1
+        return llm
+
+    def get_chain(self, name: str, model: Optional[str] = None):
+        """
+        Get a ready chain by name (see CHAIN_SPECS).
+
+        Args:
+            name: Chain name
+            model: Override the chain's default model
+
+        Returns:
+            The cached runnable chain
+        """
+        self.stats['chain_requests'] += 1
+        factory, provider, default_model = CHAIN_SPECS[name]
+        key = (name, model or default_model)
+        chain = self._chains.get(key)
+        if chain is None:
+            with self._lock:
+                chain = self._chains.get(key)
+                if chain is None:
+                    chain = factory(self.get_llm(key[1], provider)).with_config(
+                        tags=[ANSWER_STREAM_TAG if name in STREAMED_CHAINS else NO_STREAM_TAG]
+                    )
+                    self._chains[key] = chain
+                    self.stats['chains_created'] += 1
+        return chain
+
+    def warm_up(self):
+        """Build every chain up front so the first request does not pay for it."""
+        for name in CHAIN_SPECS:
+            try:
+                self.get_chain(name)
+            except Exception as e:
+                print(f"LLM registry warm-up failed for {name}: {e}")
+
+    def reset(self):
+        """Drop cached models and chains and close the HTTP clients."""
+        with self._lock:
+            self._llms.clear()
+            self._chains.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            if self._http_async_client is not None:
+                self._close_async_client(self._http_async_client)
+            self._http_async_client = None
+
+    def _close_async_client(self, client: httpx.AsyncClient):
+        """
+        Close a dropped async client: on the running event loop when reset()
+        is called from one, otherwise on a temporary loop. If its connections
+        belong to a loop that has already shut down, they were released with it.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        try:
+            if loop is not None:
+                task = loop.create_task(client.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+            else:
+                asyncio.run(client.aclose())
+        except Exception as e:
+            print(f"Could not close the async HTTP client: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'cached_llms': [f"{provider}:{model}" for provider, model in self._llms],
+            'cached_chains': [name for name, _ in self._chains]
+        }
+
+
+# Global registry shared by the whole process
+global_llm_registry = LLMRegistry()
@@ -2,42 +2,317 @@
 this module is used for loading the image related data and vector db retriever
 """
 
+import os
+import asyncio
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
-from langchain_qdrant import QdrantVectorStore  # Updated LangChain Qdrant integration
-from qdrant_client import QdrantClient
+from langchain_core.documents import Document
+from load_vector_dbs.vector_db_registry import (global_vector_db_registry,
+                                                TEXT_COLLECTION, IMAGE_COLLECTION)
+from load_vector_dbs.payload_filters import build_payload_filter, relaxed_constraints
+from load_vector_dbs.sparse_vectors import (HYBRID_SEARCH_ENABLED, SPARSE_VECTOR_NAME, dense_vector,
+                                            reciprocal_rank_fusion, to_qdrant_sparse)
 
 load_dotenv()
 
 from qdrant_client.http.models import Filter
 
+# Optional minimum similarity applied inside Qdrant to every search
+RETRIEVAL_SCORE_THRESHOLD = float(os.getenv("RETRIEVAL_SCORE_THRESHOLD")) if os.getenv("RETRIEVAL_SCORE_THRESHOLD") else None
+
+# Metadata key carrying the similarity score into grading
+SCORE_METADATA_KEY = "relevance_score"
+
+
+def documents_with_scores(documents_and_scores):
+    """Attach similarity scores to documents returned by a *_with_score search."""
+    documents = []
+    for document, score in documents_and_scores:
+        document.metadata[SCORE_METADATA_KEY] = score
+        documents.append(document)
+    return documents
+
+
+class RetrievalResult():
+    """
+    Scored points returned by one vector search, kept so that routing and
+    retrieval can share a single Qdrant round trip. constraints are the
+    payload constraints the search was filtered by (None if unfiltered).
+    """
+    def __init__(self, question, collection_name, points, limit, constraints=None):
+        self.question = question
+        self.collection_name = collection_name
+        self.points = list(points or [])
+        self.limit = limit
+        self.constraints = constraints
+
+    @classmethod
+    def from_response(cls, question, collection_name, response, limit, constraints=None):
+        """Build a result from a query_points response (or older search API result)."""
+        if hasattr(response, 'points'):
+            points = response.points
+        else:
+            points = getattr(response, 'result', response)
+        return cls(question, collection_name, points, limit, constraints)
+
+    @property
+    def scores(self):
+        return [point.score for point in self.points if getattr(point, 'score', None) is not None]
+
+    @property
+    def vectors(self):
+        """Point vectors returned with the search, keyed by (collection, point id)."""
+        return {
+            (self.collection_name, point.id): dense_vector(point)
+            for point in self.points
+            if dense_vector(point) is not None
+        }
+
+    def to_documents(self, k=None):
+        """
+        Convert the top-k points into LangChain Documents, mirroring the payload
+        layout QdrantVectorStore writes (page_content + metadata).
+        """
+        documents = []
+        for point in self.points[:k]:
+            payload = point.payload or {}
+            metadata = dict(payload.get("metadata") or {})
+            metadata["_id"] = point.id
+            metadata["_collection_name"] = self.collection_name
+            metadata[SCORE_METADATA_KEY] = point.score
+            documents.append(Document(page_content=payload.get("page_content", ""), metadata=metadata))
+        return documents
+
+
 class load_vector_database():
     "This class is useful for loading the vector DBs"
-    def __init__(self):
-        self.image_vector_db_path = "multimodel_vector_db"  # collection name
-        self.text_vector_db_path = "10K_vector_db"          # collection name
-        self.embeddings = OpenAIEmbeddings()
-        self.qdrant_client = QdrantClient(url="http://localhost:6333")
+    def __init__(self, registry=None):
+        # Client, embeddings and vector stores come from the process-wide registry,
+        # so creating this object per node no longer opens new connections.
+        self.registry = registry or global_vector_db_registry
+        self.image_vector_db_path = IMAGE_COLLECTION  # collection name
+        self.text_vector_db_path = TEXT_COLLECTION    # collection name
+        self.embeddings = self.registry.embeddings
+        self.qdrant_client = self.registry.client
     
     def get_image_retriever(self):
-        image_vectorstore_10k = QdrantVectorStore(
-            client=self.qdrant_client,
-            collection_name=self.image_vector_db_path,
-            embedding=self.embeddings
-        )
+        image_vectorstore_10k = self.registry.get_vector_store(self.image_vector_db_path)
         image_retriever_10k = image_vectorstore_10k.as_retriever(search_kwargs={"k": 4})  
         return image_vectorstore_10k, image_retriever_10k, self.image_vector_db_path
     
     def get_text_retriever(self):
-        vectorstore = QdrantVectorStore(
-            client=self.qdrant_client,
-            collection_name=self.text_vector_db_path,
-            embedding=self.embeddings
-        )
+        vectorstore = self.registry.get_vector_store(self.text_vector_db_path)
         retriever = vectorstore.as_retriever(
             search_kwargs={"k": 4}
         )
         return retriever, vectorstore, self.text_vector_db_path
+
+    def query_collections(self, query_embedding, collection_names, limit=5, with_payload=True,
+                          score_threshold=RETRIEVAL_SCORE_THRESHOLD, query_filter=None,
+                          with_vectors=False, sparse_query=None):
+        """
+        Run the same vector query against several collections concurrently,
+        so the total latency is that of the slowest search instead of the sum.
+
+        With a sparse_query, collections that store BM25 sparse vectors are
+        also searched by it (in the same round of requests) and the two
+        rankings are fused with RRF.
+
+        Returns:
+            list: query_points responses (fused point lists for hybrid searches)
+            in the same order as collection_names
+        """
+        futures = []
+        for collection_name in collection_names:
+            dense = self.registry.executor.submit(
+                self.qdrant_client.query_points,
+                collection_name=collection_name,
+                query=query_embedding,
+                limit=limit,
+                with_payload=with_payload,
+                score_threshold=score_threshold,
+                query_filter=query_filter,
+                with_vectors=with_vectors or sparse_query is not None
+            )
+            sparse = None
+            if sparse_query is not None and self.registry.supports_sparse(collection_name):
+                sparse = self.registry.executor.submit(
+                    self.qdrant_client.query_points,
+                    collection_name=collection_name,
+                    query=to_qdrant_sparse(sparse_query),
+                    using=SPARSE_VECTOR_NAME,
+                    limit=limit,
+                    with_payload=with_payload,
+                    query_filter=query_filter,
+                    with_vectors=True
+                )
+            futures.append((dense, sparse))
+
+        responses = []
+        for dense, sparse in futures:
+            if sparse is None:
+                responses.append(dense.result())
+            else:
+                responses.append(reciprocal_rank_fusion(
+                    [dense.result().points, sparse.result().points], query_embedding, limit,
+                    score_threshold=score_threshold
+                ))
+        return responses
+
+    async def aquery_collections(self, query_embedding, collection_names, limit=5, with_payload=True,
+                                 score_threshold=RETRIEVAL_SCORE_THRESHOLD, query_filter=None,
+                                 with_vectors=False, sparse_query=None):
+        """
+        Async version of query_collections using the shared async Qdrant client.
+
+        Returns:
+            list: query_points responses (fused point lists for hybrid searches)
+            in the same order as collection_names
+        """
+        hybrid = [False] * len(collection_names)
+        if sparse_query is not None:
+            hybrid = await asyncio.to_thread(
+                lambda: [self.registry.supports_sparse(collection_name) for collection_name in collection_names]
+            )
+
+        dense_requests = [
+            self.registry.async_client.query_points(
+                collection_name=collection_name,
+                query=query_embedding,
+                limit=limit,
+                with_payload=with_payload,
+                score_threshold=score_threshold,
+                query_filter=query_filter,
+                with_vectors=with_vectors or sparse_query is not None
+            )
+            for collection_name in collection_names
+        ]
+        sparse_requests = [
+            self.registry.async_client.query_points(
+                collection_name=collection_name,
+                query=to_qdrant_sparse(sparse_query),
+                using=SPARSE_VECTOR_NAME,
+                limit=limit,
+                with_payload=with_payload,
+                query_filter=query_filter,
+                with_vectors=True
+            )
+            for collection_name, is_hybrid in zip(collection_names, hybrid) if is_hybrid
+        ]
+        responses = await asyncio.gather(*dense_requests, *sparse_requests)
+        dense_responses = responses[:len(dense_requests)]
+        sparse_responses = iter(responses[len(dense_requests):])
+
+        return [
+            reciprocal_rank_fusion([dense.points, next(sparse_responses).points], query_embedding, limit,
+                                   score_threshold=score_threshold)
+            if is_hybrid else dense
+            for dense, is_hybrid in zip(dense_responses, hybrid)
+        ]
+
+    def sparse_query(self, question):
+        """BM25 query vector for hybrid search, or None when it is disabled or the question has no terms."""
+        if not HYBRID_SEARCH_ENABLED or not question:
+            return None
+        sparse_query = self.registry.sparse_embeddings.embed_query(question)
+        return sparse_query if sparse_query.indices else None
+
+    def _collect_filtered_results(self, question, limit, level, pending, responses, results):
+        """Keep the results that found points; return the collections to retry with looser constraints."""
+        retry = []
+        for collection_name, response in zip(pending, responses):
+            result = RetrievalResult.from_response(question, collection_name, response, limit, level)
+            if result.points or level is None:
+                results[collection_name] = result
+            else:
+                print(f"NO MATCHES IN {collection_name} FOR {level}, RELAXING FILTER")
+                retry.append(collection_name)
+        return retry
+
+    def search_collections(self, question, query_embedding, collection_names, limit=5, constraints=None):
+        """
+        Search collections with the constraints pushed down as Qdrant payload
+        filters, so limit applies to the matching points only. A collection
+        with no match is searched again with looser constraints. Point vectors
+        are returned too, for MMR when packing the generation context.
+
+        Collections with BM25 sparse vectors are searched by dense and sparse
+        vectors together, fused with RRF (hybrid search).
+
+        Args:
+            question: The question text (kept on the results)
+            query_embedding: Question vector
+            collection_names: Collections to search concurrently
+            limit: Points per collection
+            constraints: {metadata field: allowed values} or None
+
+        Returns:
+            list: RetrievalResult per collection, in the order of collection_names
+        """
+        results = {}
+        pending = list(collection_names)
+        sparse_query = self.sparse_query(question)
+        for level in relaxed_constraints(constraints):
+            if not pending:
+                break
+            responses = self.query_collections(query_embedding, pending, limit=limit,
+                                               query_filter=build_payload_filter(level), with_vectors=True,
+                                               sparse_query=sparse_query)
+            pending = self._collect_filtered_results(question, limit, level, pending, responses, results)
+        return [results[collection_name] for collection_name in collection_names]
+
+    async def asearch_collections(self, question, query_embedding, collection_names, limit=5, constraints=None):
+        """Async version of search_collections."""
+        results = {}
+        pending = list(collection_names)
+        sparse_query = self.sparse_query(question)
+        for level in relaxed_constraints(constraints):
+            if not pending:
+                break
+            responses = await self.aquery_collections(query_embedding, pending, limit=limit,
+                                                      query_filter=build_payload_filter(level), with_vectors=True,
+                                                      sparse_query=sparse_query)
+            pending = self._collect_filtered_results(question, limit, level, pending, responses, results)
+        return [results[collection_name] for collection_name in collection_names]
+
+    def search_for_question(self, question, query_embedding, limit=5, constraints=None):
+        """
+        Search the text and image collections concurrently for a question.
+
+        Returns:
+            dict: RetrievalResult for "text" and "image"
+        """
+        text_result, image_result = self.search_collections(
+            question, query_embedding,
+            [self.text_vector_db_path, self.image_vector_db_path],
+            limit=limit, constraints=constraints
+        )
+        return {"text": text_result, "image": image_result}
+
+    async def asearch_for_question(self, question, query_embedding, limit=5, constraints=None):
+        """Async version of search_for_question."""
+        text_result, image_result = await self.asearch_collections(
+            question, query_embedding,
+            [self.text_vector_db_path, self.image_vector_db_path],
+            limit=limit, constraints=constraints
+        )
+        return {"text": text_result, "image": image_result}
+
+    def search_collection(self, question, query_embedding, collection_name, k=4, constraints=None):
+        """
+        Search one collection with the constraints pushed down.
+
+        Returns:
+            list: The top-k Documents, with scores in their metadata
+        """
+        result, = self.search_collections(question, query_embedding, [collection_name], limit=k,
+                                          constraints=constraints)
+        return result.to_documents(k)
+
+    async def asearch_collection(self, question, query_embedding, collection_name, k=4, constraints=None):
+        """Async version of search_collection, using the async client."""
+        result, = await self.asearch_collections(question, query_embedding, [collection_name], limit=k,
+                                                 constraints=constraints)
+        return result.to_documents(k)
     
     def get_vector_store_files(self, vectorstore):
         doc_list = set()
@@ -0,0 +1,181 @@
+"""
+Payload filters pushed down into Qdrant searches.
+
+Retrieval used to fetch the top-k points and then drop those of other
+companies, which often left nothing. Company, fiscal year and source file
+constraints are now sent as a Qdrant Filter so k is applied after filtering,
+backed by payload indexes created at ingestion.
+"""
+
+import os
+import re
+import time
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+from qdrant_client.http import models
+from load_vector_dbs.vector_db_registry import global_vector_db_registry, TEXT_COLLECTION, IMAGE_COLLECTION
+
+# Metadata field -> payload index type. QdrantVectorStore nests metadata under "metadata".
+PAYLOAD_INDEX_FIELDS = {
+    "company": models.PayloadSchemaType.KEYWORD,
+    "source_file": models.PayloadSchemaType.KEYWORD,
+    "fiscal_year": models.PayloadSchemaType.INTEGER,
+}
+
+# Constraints dropped one at a time, in this order, when a filtered search finds nothing
+RELAXATION_ORDER = ("fiscal_year", "source_file", "company")
+
+# Distinct values read per field and collection from the payload index facets
+PAYLOAD_FACET_LIMIT = int(os.getenv("PAYLOAD_FACET_LIMIT", "10000"))
+# Seconds before retrying a catalog read that failed, doubled per failure up to the max
+PAYLOAD_CATALOG_RETRY_BACKOFF = float(os.getenv("PAYLOAD_CATALOG_RETRY_BACKOFF", "5"))
+PAYLOAD_CATALOG_RETRY_MAX = float(os.getenv("PAYLOAD_CATALOG_RETRY_MAX", "300"))
+
+YEAR_PATTERN = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+
+
+def payload_key(field: str) -> str:
+    return f"metadata.{field}"
+
+
+def fiscal_year_from_filename(source_file: str) -> Optional[int]:
+    """Fiscal year in a file name such as AMAZON_10K_2023.pdf, if any."""
+    match = YEAR_PATTERN.search(os.path.basename(source_file or ""))
+    return int(match.group(1)) if match else None
+
+
+def filter_metadata(source_file: str) -> Dict[str, Any]:
+    """
+    Filterable metadata for chunks ingested from a file: company (the file
+    name without extension, as ingestion has always used) and fiscal_year.
+    """
+    metadata = {"company": os.path.splitext(os.path.basename(source_file))[0]}
+    fiscal_year = fiscal_year_from_filename(source_file)
+    if fiscal_year is not None:
+        metadata["fiscal_year"] = fiscal_year
+    return metadata
+
+
+def ensure_payload_indexes(collection_name: str, client=None):
+    """
+    Create the payload indexes used by retrieval filters (no-op if they exist).
+
+    Args:
+        collection_name: Qdrant collection
+        client: Qdrant client (default: the shared registry client)
+    """
+    client = client or global_vector_db_registry.client
+    for field, schema in PAYLOAD_INDEX_FIELDS.items():
+        try:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=payload_key(field),
+                field_schema=schema
+            )
+        except Exception as e:
+            print(f"Could not create payload index {payload_key(field)} on {collection_name}: {e}")
+
+
+def build_payload_filter(constraints: Optional[Dict[str, List[Any]]]) -> Optional[models.Filter]:
+    """
+    Turn constraints ({field: allowed values}) into a Qdrant Filter.
+
+    Returns:
+        Filter, or None when there is nothing to filter on
+    """
+    conditions = [
+        models.FieldCondition(key=payload_key(field), match=models.MatchAny(any=list(values)))
+        for field, values in (constraints or {}).items()
+        if values
+    ]
+    return models.Filter(must=conditions) if conditions else None
+
+
+def relaxed_constraints(constraints: Optional[Dict[str, List[Any]]]) -> Iterator[Optional[Dict[str, List[Any]]]]:
+    """
+    Yield the constraints, then progressively looser versions of them,
+    ending with None (no filter).
+    """
+    current = {field: values for field, values in (constraints or {}).items() if values}
+    while current:
+        yield dict(current)
+        for field in RELAXATION_ORDER:
+            if field in current:
+                del current[field]
+                break
+        else:
+            break
+    yield None
+
+
+class PayloadCatalog:
+    """
+    Distinct company, source file and fiscal year values stored in the
+    collections, so only constraints that can match are pushed down.
+    Values are read from the payload index facets and rebuilt when the corpus
+    version changes. A read that fails for any collection is not kept: it is
+    retried with exponential backoff, serving the values known so far.
+    """
+
+    def __init__(self, registry=None, collections=(TEXT_COLLECTION, IMAGE_COLLECTION)):
+        self.registry = registry or global_vector_db_registry
+        self.collections = collections
+        self._lock = threading.Lock()
+        self._values: Optional[Dict[str, set]] = None
+        self._corpus_version: Optional[str] = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _scan(self):
+        """
+        Read the distinct values of each indexed field.
+
+        Returns:
+            tuple: (values by field, whether every collection was read)
+        """
+        values = {field: set() for field in PAYLOAD_INDEX_FIELDS}
+        complete = True
+        for collection_name in self.collections:
+            try:
+                for field in PAYLOAD_INDEX_FIELDS:
+                    response = self.registry.client.facet(
+                        collection_name=collection_name,
+                        key=payload_key(field),
+                        limit=PAYLOAD_FACET_LIMIT,
+                        exact=True
+                    )
+                    values[field].update(hit.value for hit in response.hits if hit.value not in (None, ""))
+            except Exception as e:
+                complete = False
+                print(f"Could not read payload values from {collection_name}: {e}")
+        return values, complete
+
+    def _stale(self, corpus_version: str) -> bool:
+        return corpus_version != self._corpus_version and time.time() >= self._retry_at
+
+    def values(self, field: str) -> List[Any]:
+        """Known values of a metadata field across the collections."""
+        corpus_version = self.registry.corpus_version
+        if self._stale(corpus_version):
+            with self._lock:
+                if self._stale(corpus_version):
+                    values, complete = self._scan()
+                    if complete:
+                        self._values = values
+                        self._corpus_version = corpus_version
+                        self._failures = 0
+                        self._retry_at = 0.0
+                    else:
+                        # Serve what could be read, merged with earlier values, until the retry
+                        previous = self._values or {}
+                        self._values = {name: found | previous.get(name, set()) for name, found in values.items()}
+                        self._corpus_version = None
+                        self._failures += 1
+                        backoff = min(PAYLOAD_CATALOG_RETRY_BACKOFF * 2 ** (self._failures - 1), PAYLOAD_CATALOG_RETRY_MAX)
+                        self._retry_at = time.time() + backoff
+                        print(f"Payload catalog incomplete, retrying in {backoff:.0f}s")
+        return sorted((self._values or {}).get(field, set()), key=str)
+
+
+global_payload_catalog = PayloadCatalog()
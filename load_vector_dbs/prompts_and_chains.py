@@ -225,6 +225,41 @@ def get_question_rewriter_chain(llm):
     question_rewriter = re_write_prompt | llm | StrOutputParser()
     return question_rewriter
 
+def get_query_planner_chain(llm):
+    """Single planner call returning companies, cross-reference needs and summary strategy."""
+    from pydantic_models.models import QueryPlan
+    structured_llm = llm.with_structured_output(QueryPlan)
+
+    SYSTEM_PROMPT = """You plan how a financial question will be answered. Fill in every field.
+
+    **Companies**: map each company mentioned to one of:
+    amazon, berkshire, google, Jhonson and Jhonosn, jp morgan, meta, microsoft, nvidia, tesla, visa, walmart, pfizer
+    - Map short forms and tickers (e.g. jpmc, msft, googl) to the names above
+    - Keep the spellings exactly as listed
+    - company is the company the question is mainly about
+    - is_comparison is true when the question compares companies
+
+    **Cross-referencing** is needed for:
+    - Multi-company questions: "Compare Tesla and Amazon"
+    - Industry analysis: "EV market trends"
+    - Questions requiring multiple data sources for validation
+    Not needed for:
+    - Single company queries: "Tesla's revenue"
+    - Simple factual questions: "Company CEO"
+
+    **Summary strategy**:
+    - single_source: Same company/type documents
+    - multi_source_vectorstore: Multiple companies from vectorstore
+    - integrated_web_vectorstore: Vectorstore + web results
+    """
+
+    planner_prompt = ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
+        ("human", "Question: {question}")
+    ])
+
+    return planner_prompt | structured_llm
+
 def get_cross_reference_analyzer_chain(llm):
     """Simplified cross-reference analyzer for compatibility."""
     from pydantic_models.models import CrossReferenceAnalysis
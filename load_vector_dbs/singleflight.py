@@ -0,0 +1,103 @@
+"""
+In-flight call coalescing ("singleflight").
+
+When several callers ask for the same key while a call for it is still
+running, only the first one executes; the others wait for it and get the same
+result (or the same exception). Nothing is cached once the call finishes, so
+this complements the TTL caches instead of replacing them.
+
+Used for identical /ask requests and at the embedding, web-search and grading
+layers.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key. Thread callers use do();
+    coroutines use ado(), which shares one task per key and event loop.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Label used in logs and stats
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Any, asyncio.Task] = {}
+        self.stats = {'executions': 0, 'shared': 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) unless a call for key is already in flight,
+        in which case wait for that call and return its result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats['executions'] += 1
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Async version of do. The shared call runs as its own task, so a
+        waiter being cancelled does not cancel it for the others.
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = loop.create_task(fn(*args, **kwargs))
+                self._tasks[task_key] = task
+                task.add_done_callback(lambda _: self._forget(task_key))
+                self.stats['executions'] += 1
+            else:
+                self.stats['shared'] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, task_key):
+        with self._lock:
+            self._tasks.pop(task_key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._tasks)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'name': self.name, 'in_flight': self.in_flight()}
@@ -0,0 +1,146 @@
+"""
+Local BM25 sparse vectors for hybrid (dense + sparse) retrieval.
+
+Dense search misses questions that hinge on exact tokens such as "Item 7",
+"diluted EPS", fiscal years or tickers. Chunks also get a sparse vector of
+BM25 term weights, computed locally at ingestion and stored next to the dense
+vector; Qdrant applies the IDF part (Modifier.IDF). Searches run the dense and
+the sparse query together and fuse the two rankings with reciprocal rank
+fusion (RRF).
+"""
+
+import os
+import re
+import hashlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from qdrant_client.http import models
+from langchain_qdrant import SparseEmbeddings, SparseVector
+
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+SPARSE_VECTOR_NAME = "bm25"
+DENSE_VECTOR_NAME = ""  # the unnamed vector QdrantVectorStore writes
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Typical chunk length in tokens (unigrams + bigrams), used for length normalization
+BM25_AVG_DOC_LENGTH = float(os.getenv("BM25_AVG_DOC_LENGTH", "300"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Words, tickers and figures such as 574.8 or 1,234 (commas dropped)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,]\d+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from had has have how in is it its of on or "
+    "than that the their this to was were what when which who why will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Unigrams and bigrams of the lower-cased text, without stopwords.
+    Bigrams keep phrases such as "item 7" and "diluted eps" together.
+    """
+    words = [
+        token.replace(",", "") for token in TOKEN_PATTERN.findall((text or "").lower())
+        if token not in STOPWORDS
+    ]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def token_index(token: str) -> int:
+    """Stable 32-bit index of a token in the sparse vector."""
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+def _sparse_vector(weights: Dict[int, float]) -> SparseVector:
+    indices = sorted(weights)
+    return SparseVector(indices=indices, values=[weights[index] for index in indices])
+
+
+class BM25SparseEmbeddings(SparseEmbeddings):
+    """
+    BM25 term-frequency weights per chunk; Qdrant multiplies them by the IDF
+    of each term in the collection at query time.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B, avg_doc_length: float = BM25_AVG_DOC_LENGTH):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = avg_doc_length
+
+    def embed_document(self, text: str) -> SparseVector:
+        tokens = tokenize(text)
+        length_norm = 1 - self.b + self.b * len(tokens) / self.avg_doc_length
+        weights: Dict[int, float] = {}
+        for token, tf in Counter(tokens).items():
+            index = token_index(token)
+            weights[index] = weights.get(index, 0.0) + tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return _sparse_vector(weights)
+
+    def embed_documents(self, texts: List[str]) -> List[SparseVector]:
+        return [self.embed_document(text) for text in texts]
+
+    def embed_query(self, text: str) -> SparseVector:
+        return _sparse_vector({token_index(token): 1.0 for token in set(tokenize(text))})
+
+
+def sparse_vectors_config() -> Dict[str, models.SparseVectorParams]:
+    """Sparse vector configuration for new collections."""
+    return {SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)}
+
+
+def to_qdrant_sparse(vector: SparseVector) -> models.SparseVector:
+    return models.SparseVector(indices=vector.indices, values=vector.values)
+
+
+def dense_vector(point: Any) -> Optional[List[float]]:
+    """The dense vector of a point returned with vectors, if any."""
+    vector = getattr(point, "vector", None)
+    if isinstance(vector, dict):
+        vector = vector.get(DENSE_VECTOR_NAME)
+    return vector if isinstance(vector, list) else None
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Any]], query_embedding: Sequence[float],
+                           limit: int, k: int = RRF_K, score_threshold: Optional[float] = None) -> List[Any]:
+    """
+    Fuse ranked point lists by RRF (sum of 1 / (k + rank)).
+
+    Fused points keep cosine similarity as their score, so routing thresholds
+    and grade calibration see the same scale as with dense search: points only
+    found by the sparse search are scored from their returned dense vector.
+    With a score_threshold, points below it are dropped, as the dense search
+    does (the sparse search cannot apply a cosine threshold itself).
+
+    Returns:
+        list: Up to limit points in fused order
+    """
+    fused: Dict[Any, float] = {}
+    points: Dict[Any, Any] = {}
+    for ranking in rankings:
+        for rank, point in enumerate(ranking, start=1):
+            fused[point.id] = fused.get(point.id, 0.0) + 1.0 / (k + rank)
+            points.setdefault(point.id, point)
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = np.linalg.norm(query) or 1.0
+    results = []
+    for point_id in sorted(fused, key=fused.get, reverse=True):
+        if len(results) >= limit:
+            break
+        point = points[point_id]
+        vector = dense_vector(point)
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            score = float(vector @ query / ((np.linalg.norm(vector) or 1.0) * query_norm))
+            if score_threshold is not None and score < score_threshold:
+                continue
+            point = point.model_copy(update={"score": score})
+        results.append(point)
+    return results
+
+
+# Shared encoder; it holds no state beyond its parameters
+global_sparse_embeddings = BM25SparseEmbeddings()
@@ -0,0 +1,334 @@
+"""
+Process-wide registry for the vector DB resources used by the graph and ingestion.
+
+Building a QdrantClient, OpenAIEmbeddings and QdrantVectorStore wrappers on every
+node call means new TCP/TLS connections and collection validation round trips per
+query. The registry creates them once per process and hands out shared handles.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+from dotenv import load_dotenv
+from langchain_openai import OpenAIEmbeddings
+from langchain_qdrant import QdrantVectorStore, RetrievalMode
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from load_vector_dbs.embedding_cache import CachedEmbeddings
+from load_vector_dbs.sparse_vectors import (global_sparse_embeddings, HYBRID_SEARCH_ENABLED,
+                                            SPARSE_VECTOR_NAME)
+
+load_dotenv()
+
+TEXT_COLLECTION = "10K_vector_db"
+IMAGE_COLLECTION = "multimodel_vector_db"
+
+
+class VectorDBRegistry:
+    """
+    Holds one pooled Qdrant client, one embeddings provider and one cached
+    vector-store handle per collection, shared by all nodes, requests and
+    ingestion runs in the process.
+    """
+
+    def __init__(self, url: Optional[str] = None, api_key: Optional[str] = None,
+                 prefer_grpc: Optional[bool] = None, pool_size: Optional[int] = None,
+                 timeout: Optional[int] = None):
+        """
+        Initialize the registry. Nothing connects until a resource is first used.
+
+        Args:
+            url: Qdrant URL (default: QDRANT_URL or http://localhost:6333)
+            api_key: Qdrant API key (default: QDRANT_API_KEY)
+            prefer_grpc: Use the gRPC transport (default: QDRANT_PREFER_GRPC)
+            pool_size: Connection pool size for the client (default: QDRANT_POOL_SIZE)
+            timeout: Request timeout in seconds (default: QDRANT_TIMEOUT)
+        """
+        self.url = url or os.getenv("QDRANT_URL", "http://localhost:6333")
+        self.api_key = api_key or os.getenv("QDRANT_API_KEY")
+        if prefer_grpc is None:
+            prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+        self.prefer_grpc = prefer_grpc
+        self.grpc_port = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+        self.pool_size = pool_size or int(os.getenv("QDRANT_POOL_SIZE", "20"))
+        self.timeout = timeout or int(os.getenv("QDRANT_TIMEOUT", "30"))
+        self.max_workers = int(os.getenv("VECTOR_DB_MAX_WORKERS", "8"))
+        self.corpus_version_path = os.getenv("CORPUS_VERSION_PATH", os.path.join("cache", "corpus_version"))
+        # Seconds between checks of the version file for bumps by other processes
+        self.corpus_version_check_interval = float(os.getenv("CORPUS_VERSION_CHECK_INTERVAL", "1"))
+
+        self._lock = threading.RLock()
+        self._client: Optional[QdrantClient] = None
+        self._async_client: Optional[AsyncQdrantClient] = None
+        self._embeddings = None
+        self._vector_stores: Dict[str, QdrantVectorStore] = {}
+        # collection -> (has sparse vectors, corpus version it was checked at)
+        self._sparse_collections: Dict[str, Tuple[bool, str]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._corpus_version: Optional[str] = None
+        self._corpus_version_mtime: Optional[float] = None
+        self._corpus_version_checked_at = 0.0
+
+        self.stats = {
+            'clients_created': 0,
+            'async_clients_created': 0,
+            'vector_stores_created': 0,
+            'vector_store_requests': 0,
+            'health_checks': 0
+        }
+
+    @property
+    def client(self) -> QdrantClient:
+        """Shared Qdrant client, created on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = QdrantClient(
+                        url=self.url,
+                        api_key=self.api_key,
+                        prefer_grpc=self.prefer_grpc,
+                        grpc_port=self.grpc_port,
+                        pool_size=self.pool_size,
+                        timeout=self.timeout
+                    )
+                    self.stats['clients_created'] += 1
+                    print(f"Vector DB registry connected to {self.url} (gRPC: {self.prefer_grpc})")
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncQdrantClient:
+        """Shared async Qdrant client for the async graph path, created on first use."""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = AsyncQdrantClient(
+                        url=self.url,
+                        api_key=self.api_key,
+                        prefer_grpc=self.prefer_grpc,
+                        grpc_port=self.grpc_port,
+                        pool_size=self.pool_size,
+                        timeout=self.timeout
+                    )
+                    self.stats['async_clients_created'] += 1
+        return self._async_client
+
+    @property
+    def embeddings(self):
+        """Shared embeddings provider (behind the persistent cache), created on first use."""
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = CachedEmbeddings.from_env(OpenAIEmbeddings())
+        return self._embeddings
+
+    def embedding_dimension(self) -> int:
+        """Dimension of the shared embeddings, served from the cache when possible."""
+        if hasattr(self.embeddings, "dimension"):
+            return self.embeddings.dimension()
+        return len(self.embeddings.embed_query("Hello world"))
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Shared thread pool for running independent searches concurrently."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="vector-db"
+                    )
+        return self._executor
+
+    @property
+    def sparse_embeddings(self):
+        """Local BM25 sparse encoder used for hybrid search."""
+        return global_sparse_embeddings
+
+    def supports_sparse(self, collection_name: str) -> bool:
+        """
+        Whether a collection stores BM25 sparse vectors next to the dense ones.
+        Collections created before hybrid search keep dense-only retrieval.
+        Re-checked when the corpus version changes (e.g. after the collection
+        was recreated with sparse vectors).
+        """
+        if not HYBRID_SEARCH_ENABLED:
+            return False
+        corpus_version = self.corpus_version
+        cached = self._sparse_collections.get(collection_name)
+        if cached is not None and cached[1] == corpus_version:
+            return cached[0]
+        try:
+            sparse_vectors = self.client.get_collection(collection_name).config.params.sparse_vectors or {}
+        except Exception as e:
+            print(f"Could not read the sparse vector config of {collection_name}: {e}")
+            return False
+        supported = SPARSE_VECTOR_NAME in sparse_vectors
+        with self._lock:
+            self._sparse_collections[collection_name] = (supported, corpus_version)
+        if not supported and (cached is None or cached[0]):
+            print(f"{collection_name} has no '{SPARSE_VECTOR_NAME}' sparse vectors, using dense search only")
+        return supported
+
+    def get_vector_store(self, collection_name: str) -> QdrantVectorStore:
+        """
+        Get the cached vector-store handle for a collection. On collections with
+        sparse vectors the handle is hybrid, so ingestion writes both vectors;
+        the handle is rebuilt if the collection gains or loses them.
+
+        Args:
+            collection_name: Name of the Qdrant collection
+
+        Returns:
+            QdrantVectorStore: Handle bound to the shared client and embeddings
+        """
+        self.stats['vector_store_requests'] += 1
+        sparse = self.supports_sparse(collection_name)
+        vector_store = self._vector_stores.get(collection_name)
+        if vector_store is None or self._is_hybrid(vector_store) != sparse:
+            with self._lock:
+                vector_store = self._vector_stores.get(collection_name)
+                if vector_store is None or self._is_hybrid(vector_store) != sparse:
+                    if sparse:
+                        vector_store = QdrantVectorStore(
+                            client=self.client,
+                            collection_name=collection_name,
+                            embedding=self.embeddings,
+                            retrieval_mode=RetrievalMode.HYBRID,
+                            sparse_embedding=self.sparse_embeddings,
+                            sparse_vector_name=SPARSE_VECTOR_NAME
+                        )
+                    else:
+                        vector_store = QdrantVectorStore(
+                            client=self.client,
+                            collection_name=collection_name,
+                            embedding=self.embeddings
+                        )
+                    self._vector_stores[collection_name] = vector_store
+                    self.stats['vector_stores_created'] += 1
+        return vector_store
+
+    @staticmethod
+    def _is_hybrid(vector_store: QdrantVectorStore) -> bool:
+        return vector_store.retrieval_mode == RetrievalMode.HYBRID
+
+    @property
+    def corpus_version(self) -> str:
+        """
+        Version of the indexed corpus, changed whenever ingestion writes to Qdrant.
+        Caches derived from retrieved chunks include it in their keys.
+        The version file is re-read when another process bumps it; it is
+        checked at most every CORPUS_VERSION_CHECK_INTERVAL seconds, so most
+        reads (including on the async request path) never touch the disk.
+        """
+        now = time.monotonic()
+        if self._corpus_version is not None and now - self._corpus_version_checked_at < self.corpus_version_check_interval:
+            return self._corpus_version
+        self._corpus_version_checked_at = now
+        try:
+            mtime = os.path.getmtime(self.corpus_version_path)
+        except OSError:
+            mtime = None
+        if self._corpus_version is None or mtime != self._corpus_version_mtime:
+            with self._lock:
+                version = "0"
+                if mtime is not None:
+                    try:
+                        with open(self.corpus_version_path, "r", encoding="utf-8") as f:
+                            version = f.read().strip() or "0"
+                    except OSError as e:
+                        print(f"Could not read corpus version: {e}")
+                self._corpus_version = version
+                self._corpus_version_mtime = mtime
+        return self._corpus_version
+
+    def bump_corpus_version(self) -> str:
+        """
+        Mark the corpus as changed after ingestion, invalidating derived caches.
+
+        Returns:
+            str: The new corpus version
+        """
+        with self._lock:
+            version = str(time.time_ns())
+            try:
+                directory = os.path.dirname(self.corpus_version_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.corpus_version_path, "w", encoding="utf-8") as f:
+                    f.write(version)
+                self._corpus_version_mtime = os.path.getmtime(self.corpus_version_path)
+            except OSError as e:
+                print(f"Could not persist corpus version: {e}")
+            self._corpus_version = version
+        print(f"Corpus version bumped to {version}")
+        return version
+
+    def health_check(self) -> Dict[str, Any]:
+        """
+        Check that Qdrant is reachable and report the state of the registry.
+
+        Returns:
+            dict: Status, latency, available collections and registry stats
+        """
+        self.stats['health_checks'] += 1
+        start_time = time.time()
+        try:
+            collections = [c.name for c in self.client.get_collections().collections]
+            status = "healthy"
+            missing = [name for name in (TEXT_COLLECTION, IMAGE_COLLECTION) if name not in collections]
+            if missing:
+                status = "degraded"
+            error = None
+        except Exception as e:
+            collections = []
+            missing = [TEXT_COLLECTION, IMAGE_COLLECTION]
+            status = "unhealthy"
+            error = str(e)
+
+        return {
+            'status': status,
+            'url': self.url,
+            'prefer_grpc': self.prefer_grpc,
+            'latency_ms': round((time.time() - start_time) * 1000, 2),
+            'collections': collections,
+            'missing_collections': missing,
+            'cached_vector_stores': list(self._vector_stores.keys()),
+            'corpus_version': self.corpus_version,
+            'embedding_cache': self._embeddings.get_stats() if hasattr(self._embeddings, "get_stats") else None,
+            'error': error,
+            'stats': self.stats.copy()
+        }
+
+    def warm_up(self) -> Dict[str, Any]:
+        """
+        Create the client and the vector-store handles for the default collections
+        so the first request does not pay for it.
+
+        Returns:
+            dict: Health check result after warm-up
+        """
+        for collection_name in (TEXT_COLLECTION, IMAGE_COLLECTION):
+            try:
+                self.get_vector_store(collection_name)
+            except Exception as e:
+                print(f"Vector DB warm-up failed for {collection_name}: {e}")
+        return self.health_check()
+
+    def reset(self):
+        """Drop all cached handles and close the client so the next use reconnects."""
+        with self._lock:
+            if self._client is not None:
+                try:
+                    self._client.close()
+                except Exception as e:
+                    print(f"Error closing Qdrant client: {e}")
+            self._client = None
+            # The async client is closed by its event loop; drop it so the next use reconnects
+            self._async_client = None
+            self._vector_stores.clear()
+            self._sparse_collections.clear()
+
+
+# Global registry shared by the whole process
+global_vector_db_registry = VectorDBRegistry()
@@ -1,13 +1,23 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
+from load_vector_dbs.llm_registry import global_llm_registry
+from langchain_core.messages import HumanMessage, AIMessage
 from Graph.invoke_graph import BuildingGraph as RAGGraph
 from Graph.session_aware_wrapper import global_session_manager_v2
+from Graph.grade_cache import normalize_question
+from Graph.answer_cache import global_answer_cache
+from load_vector_dbs.vector_db_registry import global_vector_db_registry
+from load_vector_dbs.singleflight import SingleFlight
+import os
+import json
 import time
 from typing import Optional, Dict, Any
 
+# Identical questions already being answered (by any session) share one graph run
+REQUEST_COALESCING_ENABLED = os.getenv("REQUEST_COALESCING", "true").lower() in ("1", "true", "yes")
+global_request_coalescer = SingleFlight("requests")
+
 class ManagerAgent:
     def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-4o")
+        self.llm = global_llm_registry.get_llm("gpt-4o")
         # Remove direct graph creation - we'll use session-specific graphs
         
     def handle(self, query: str, user_id: str = "anonymous", extra_inputs: dict = None):
@@ -22,6 +32,151 @@ class ManagerAgent:
         Returns:
             dict: Response from the RAG system with session information
         """
+        session_graph, inputs = self._prepare_request(query, user_id, extra_inputs)
+
+        # Answers computed for any session are served from the shared cache
+        embedding = self._question_embedding(query)
+        cached = global_answer_cache.get(query, embedding, extra_inputs)
+        if cached is not None:
+            result = self._cached_result(cached, query)
+            session_graph.record_exchange(inputs, result, 0.0, learn_routing=False)
+            return self._add_session_info(result, session_graph, user_id)
+
+        # Execute with session context; identical in-flight queries share one run
+        if REQUEST_COALESCING_ENABLED:
+            start_time = time.time()
+            result, runner = global_request_coalescer.do(
+                self._request_key(query, extra_inputs), self._run_graph,
+                session_graph, inputs, query, embedding, extra_inputs
+            )
+            if runner is not session_graph:
+                result = self._shared_result(result, query)
+                session_graph.record_exchange(inputs, result, time.time() - start_time)
+        else:
+            result, _ = self._run_graph(session_graph, inputs, query, embedding, extra_inputs)
+        return self._add_session_info(dict(result), session_graph, user_id)
+
+    async def ahandle(self, query: str, user_id: str = "anonymous", extra_inputs: dict = None):
+        """
+        Async version of handle: runs the session graph with ainvoke so one
+        worker can serve many queries concurrently.
+        """
+        session_graph, inputs = self._prepare_request(query, user_id, extra_inputs)
+        embedding = await self._aquestion_embedding(query)
+        cached = global_answer_cache.get(query, embedding, extra_inputs)
+        if cached is not None:
+            result = self._cached_result(cached, query)
+            await session_graph.arecord_exchange(inputs, result, 0.0, learn_routing=False)
+            return self._add_session_info(result, session_graph, user_id)
+
+        if REQUEST_COALESCING_ENABLED:
+            start_time = time.time()
+            result, runner = await global_request_coalescer.ado(
+                self._request_key(query, extra_inputs), self._arun_graph,
+                session_graph, inputs, query, embedding, extra_inputs
+            )
+            if runner is not session_graph:
+                result = self._shared_result(result, query)
+                await session_graph.arecord_exchange(inputs, result, time.time() - start_time)
+        else:
+            result, _ = await self._arun_graph(session_graph, inputs, query, embedding, extra_inputs)
+        return self._add_session_info(dict(result), session_graph, user_id)
+
+    async def astream(self, query: str, user_id: str = "anonymous", extra_inputs: dict = None):
+        """
+        Stream a RAG request: yields (mode, chunk) graph events as nodes run,
+        then ("final", result) with session information attached.
+        """
+        session_graph, inputs = self._prepare_request(query, user_id, extra_inputs)
+        embedding = await self._aquestion_embedding(query)
+        cached = global_answer_cache.get(query, embedding, extra_inputs)
+        if cached is not None:
+            result = self._cached_result(cached, query)
+            await session_graph.arecord_exchange(inputs, result, 0.0, learn_routing=False)
+            yield "final", self._add_session_info(result, session_graph, user_id)
+            return
+
+        corpus_version = global_vector_db_registry.corpus_version
+        async for mode, chunk in session_graph.astream(inputs):
+            if mode == "final":
+                global_answer_cache.put(query, chunk, embedding, extra_inputs, corpus_version)
+                chunk = self._add_session_info(chunk, session_graph, user_id)
+            yield mode, chunk
+
+    def _run_graph(self, session_graph, inputs, query, embedding, extra_inputs):
+        """
+        Run the graph and store the answer in the shared answer cache.
+
+        Returns:
+            tuple: (final state, the session graph that ran it), so callers
+            sharing the run know whether their own session recorded it
+        """
+        corpus_version = global_vector_db_registry.corpus_version
+        result = session_graph.invoke(inputs)
+        global_answer_cache.put(query, result, embedding, extra_inputs, corpus_version)
+        return result, session_graph
+
+    async def _arun_graph(self, session_graph, inputs, query, embedding, extra_inputs):
+        """Async version of _run_graph."""
+        corpus_version = global_vector_db_registry.corpus_version
+        result = await session_graph.ainvoke(inputs)
+        global_answer_cache.put(query, result, embedding, extra_inputs, corpus_version)
+        return result, session_graph
+
+    def _question_embedding(self, query: str):
+        """Question embedding for the semantic answer cache (shared with the graph via the embedding cache)."""
+        if not global_answer_cache.cacheable(query):
+            return None
+        try:
+            return global_vector_db_registry.embeddings.embed_query(query)
+        except Exception as e:
+            print(f"Could not embed question for the answer cache: {e}")
+            return None
+
+    async def _aquestion_embedding(self, query: str):
+        """Async version of _question_embedding."""
+        if not global_answer_cache.cacheable(query):
+            return None
+        try:
+            return await global_vector_db_registry.embeddings.aembed_query(query)
+        except Exception as e:
+            print(f"Could not embed question for the answer cache: {e}")
+            return None
+
+    def _cached_result(self, cached: Dict[str, Any], query: str) -> Dict[str, Any]:
+        """
+        Graph-state shaped result for an answer served from the cache, with
+        messages built from this caller's question rather than the original one.
+        """
+        tool_call_entry = {"tool": "answer_cache", **cached["answer_cache"]}
+        return {
+            **cached,
+            "messages": [HumanMessage(content=query), AIMessage(content=cached.get("Intermediate_message", ""))],
+            "tool_calls": list(cached.get("tool_calls", [])) + [tool_call_entry]
+        }
+
+    def _shared_result(self, result: Dict[str, Any], query: str) -> Dict[str, Any]:
+        """A run shared with another session, with messages built from this caller's question."""
+        return {
+            **result,
+            "messages": [HumanMessage(content=query), AIMessage(content=result.get("Intermediate_message", ""))]
+        }
+
+    def _request_key(self, query: str, extra_inputs: dict = None):
+        """
+        Coalescing key: the normalized question plus any extra graph inputs.
+        The run records the exchange in the session that started it; callers
+        from other sessions record the shared answer in their own session.
+        """
+        return normalize_question(query), json.dumps(extra_inputs or {}, sort_keys=True, default=str)
+
+    def _prepare_request(self, query: str, user_id: str, extra_inputs: dict = None):
+        """
+        Get the user's session graph and build the initial graph inputs.
+
+        Returns:
+            tuple: (session_graph, inputs)
+        """
         # Create or get session-specific graph
         session_graph = global_session_manager_v2.get_or_create_session_graph(
             self._get_or_create_session_id(user_id), RAGGraph
@@ -45,10 +200,9 @@ class ManagerAgent:
         # Add extra inputs if provided
         if extra_inputs:
             inputs.update(extra_inputs)
-        
-        # Execute with session context
-        result = session_graph.invoke(inputs)
-        
+        return session_graph, inputs
+
+    def _add_session_info(self, result: Dict[str, Any], session_graph, user_id: str) -> Dict[str, Any]:
         # Add session information to response
         session_summary = session_graph.get_session_summary()
         result['session_info'] = {
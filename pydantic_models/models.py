@@ -78,15 +78,27 @@ class CitationInfo(BaseModel):
         description="Key information extracted from this source"
     )
 
-class MultiCompanyExtraction(BaseModel):
-    """Extract multiple companies from a question for cross-referencing."""
-    
+class QueryPlan(BaseModel):
+    """Everything the graph needs to know about a question, from one LLM call."""
+
+    company: str = Field(
+        description="The primary/main company the question is about"
+    )
     companies: list[str] = Field(
         description="List of company names found in the question"
     )
-    primary_company: str = Field(
-        description="The primary/main company being discussed"
-    )
     is_comparison: bool = Field(
         description="Whether the question involves comparison between companies"
+    )
+    needs_cross_reference: str = Field(
+        description="Whether cross-referencing is needed, 'yes' or 'no'"
+    )
+    source_types_needed: list[str] = Field(
+        description="List of source types needed: 'text_docs', 'images', 'web_search', 'financial_data'"
+    )
+    reasoning: str = Field(
+        description="Brief explanation of why cross-referencing is or isn't needed"
+    )
+    summary_strategy: Literal["single_source", "multi_source_vectorstore", "integrated_web_vectorstore"] = Field(
+        description="Strategy for document summarization"
     )
\ No newline at end of file